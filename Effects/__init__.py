@@ -0,0 +1,53 @@
+"""
+Vocal effects. Submodules and the classes below are imported on first access, so
+`import Effects` stays cheap and pedalboard, librosa or Numba are only loaded by
+the effects that actually use them.
+"""
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "GV_Delay": "delay",
+    "ConvReverb": "conv_reverb",
+    "Distortion": "distortion",
+    "VCA_Compressor": "vca_compressor",
+    "OpticalCompressor": "optical_compressor",
+    "DeEsser": "de_esser",
+    "DynamicBand": "dynamic_eq",
+    "DynamicEQ": "dynamic_eq",
+    "ResonantEQ": "resonant_eq",
+    "ThreeBandEQ": "three_band_eq",
+    "PultecEQP1A": "tube_amp_eq",
+    "HiPass": "hi_pass_eq",
+    "Doubler": "doubler",
+    "StereoDoubler": "doubler",
+    "GVChorus": "chorus",
+    "Mixer": "mix",
+    "Oversampler": "oversampling",
+    "Effect": "chain",
+    "EffectChain": "chain",
+}
+
+_SUBMODULES = {
+    "batch", "benchmark", "biquad", "chain", "chorus", "conv_reverb", "convolution", "de_esser", "delay", "distortion",
+    "doubler", "dynamic_eq", "gain", "hi_pass_eq", "high_shelf_filter", "jit", "mix",
+    "optical_compressor", "oversampling", "precision", "resonant_eq", "sidechain", "streaming", "three_band_eq", "tube_amp_eq",
+    "vca_compressor",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
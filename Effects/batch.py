@@ -0,0 +1,166 @@
+"""
+Renders folders of audio files through an effect chain preset, one file per
+task, spread across a pool of worker processes.
+
+    python -m Effects.batch vocal "Audio/Input/*.wav" Audio/Output --workers 8
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .chain import EffectChain
+from .streaming import BLOCK_SIZE, stream
+
+
+def vocal(sample_rate):
+    """Low cut, three-band EQ, de-esser, VCA compressor and a tempo-synced delay."""
+    from .de_esser import DeEsser
+    from .delay import GV_Delay
+    from .hi_pass_eq import HiPass
+    from .three_band_eq import ThreeBandEQ
+    from .vca_compressor import VCA_Compressor
+
+    delay = GV_Delay(feedback=0.3, mix=0.2, sample_rate=sample_rate)
+    delay.set_delay_seconds(120)
+    return [HiPass(), ThreeBandEQ(sample_rate), DeEsser(sample_rate), VCA_Compressor(), delay]
+
+
+def vocal_plate(sample_rate):
+    """The vocal preset into the plate reverb of conv_reverb."""
+    from .conv_reverb import ConvReverb, ir_file
+
+    return vocal(sample_rate) + [ConvReverb(sample_rate, ir_file, mix=0.2, block_size=BLOCK_SIZE)]
+
+
+# Preset name -> function building the chain's stages for a sample rate
+PRESETS = {
+    "vocal": vocal,
+    "vocal_plate": vocal_plate,
+}
+
+# Per worker process: the preset, its sample precision, and one prepared chain per (sample rate, channels)
+_preset = None
+_dtype = np.dtype(np.float64)
+_chains = {}
+
+
+def _chain(sample_rate, channels, block_size):
+    key = (sample_rate, channels, block_size)
+    chain = _chains.get(key)
+    if chain is None:
+        chain = _chains[key] = EffectChain(_preset(sample_rate), dtype=_dtype)
+        chain.prepare(sample_rate, block_size, channels)
+    return chain
+
+
+def _warm(preset, formats, block_size, dtype=np.float64):
+    """
+    Worker initializer: builds and prepares the chain for every file format in
+    the batch once, which imports the effects, loads the IRs, designs the
+    filters and compiles the Numba kernels, so the files only pay for rendering.
+    """
+    global _preset, _dtype
+    _preset = PRESETS[preset] if isinstance(preset, str) else preset
+    _dtype = np.dtype(dtype)
+    for sample_rate, channels in formats:
+        chain = _chain(sample_rate, channels, block_size)
+        output = np.empty((block_size, chain.output_channels), dtype=_dtype)
+        chain.process_block(np.zeros((block_size, channels), dtype=_dtype), output)
+        chain.reset()
+
+
+def render_file(input_path, output_path, block_size=BLOCK_SIZE, subtype=None):
+    """
+    Streams one file through the worker's chain, block by block, straight to
+    output_path. The output lines up with the input, the chain's latency removed.
+
+    Returns:
+        tuple: (input_path, seconds of audio, seconds taken).
+    """
+    import soundfile as sf
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with sf.SoundFile(input_path) as source:
+        chain = _chain(source.samplerate, source.channels, block_size)
+        chain.reset()
+        with sf.SoundFile(output_path, 'w', source.samplerate, chain.output_channels, subtype or source.subtype,
+                          format=source.format) as sink:
+            stream(chain, source, sink, block_size)
+        seconds = source.frames / source.samplerate
+    return input_path, seconds, time.perf_counter() - start
+
+
+def render_batch(preset, pattern, output_dir, workers=None, block_size=BLOCK_SIZE, subtype=None, dtype=np.float64):
+    """
+    Renders every file matching pattern through preset into output_dir, under
+    the same path relative to the deepest directory the inputs share, one
+    file per task on a pool of worker processes.
+    Prints each file's throughput as it finishes.
+
+    Args:
+        preset: A name in PRESETS, or a module-level function returning the
+            chain's stages for a sample rate (it is pickled to the workers).
+        pattern (str): Glob of the input files; ** matches subdirectories.
+        output_dir (str): Where the rendered files are written.
+        workers (int): Worker processes; the CPU count by default.
+        block_size (int): Frames per block pushed through the chain.
+        subtype (str): soundfile subtype of the outputs, e.g. "FLOAT"; the input's by default.
+        dtype: Sample precision of the chains, np.float32 or np.float64. float32
+            halves the memory traffic between stages; filter state stays at each
+            effect's own state_dtype.
+
+    Returns:
+        list: (input_path, seconds of audio, seconds taken) per rendered file, in finishing order.
+    """
+    import soundfile as sf
+
+    paths = sorted(glob.glob(pattern, recursive=True))
+    if not paths:
+        raise FileNotFoundError(f"No files match {pattern!r}")
+    if isinstance(preset, str) and preset not in PRESETS:
+        raise ValueError(f"Unknown preset {preset!r}, expected one of {sorted(PRESETS)}")
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    outputs = [os.path.join(output_dir, os.path.relpath(os.path.abspath(path), root)) for path in paths]
+    if any(os.path.abspath(output) == os.path.abspath(path) for path, output in zip(paths, outputs)):
+        raise ValueError(f"{output_dir!r} would overwrite the input files")
+    infos = [sf.info(path) for path in paths]
+    formats = sorted({(info.samplerate, info.channels) for info in infos})
+    workers = min(workers or os.cpu_count(), len(paths))
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_warm, initargs=(preset, formats, block_size, dtype)) as pool:
+        futures = [pool.submit(render_file, path, output, block_size, subtype) for path, output in zip(paths, outputs)]
+        for future in as_completed(futures):
+            path, seconds, elapsed = future.result()
+            results.append((path, seconds, elapsed))
+            print(f"{os.path.relpath(os.path.abspath(path), root)}: {seconds:.1f}s of audio in {elapsed:.2f}s, "
+                  f"{seconds / elapsed:.0f}x real-time")
+
+    elapsed = time.perf_counter() - start
+    audio = sum(seconds for _, seconds, _ in results)
+    print(f"{len(results)} files, {audio:.0f}s of audio in {elapsed:.1f}s on {workers} workers, "
+          f"{audio / elapsed:.0f}x real-time")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m Effects.batch", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("preset", choices=sorted(PRESETS))
+    parser.add_argument("pattern", help="glob of the input files, quoted so the shell leaves it alone")
+    parser.add_argument("output_dir")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--subtype", default=None, help="output subtype, e.g. FLOAT or PCM_24 (default: the input's)")
+    parser.add_argument("--dtype", choices=("float32", "float64"), default="float64",
+                        help="sample precision of the chain (default: float64)")
+    args = parser.parse_args(argv)
+    render_batch(args.preset, args.pattern, args.output_dir, args.workers, args.block_size, args.subtype, args.dtype)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
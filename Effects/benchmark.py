@@ -0,0 +1,522 @@
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from .chain import EffectChain, Gain
+from .conv_reverb import ConvReverb
+from .de_esser import DeEsser
+from .delay import GV_Delay
+from .distortion import Distortion
+from .doubler import Doubler, StereoDoubler
+from .dynamic_eq import DynamicBand, DynamicEQ
+from .hi_pass_eq import HiPass
+from .optical_compressor import OpticalCompressor
+from .three_band_eq import ThreeBandEQ, create_3band_eq
+from .vca_compressor import VCA_Compressor
+
+
+def timed(func, *args):
+    """Run func once and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def vocal_stem(seconds, sample_rate=48000, seed=0):
+    """Synthetic mono stem standing in for a vocal take."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-0.5, 0.5, int(seconds * sample_rate))
+
+
+def report(name, seconds_of_audio, reference_time, new_time):
+    print(f"{name}: reference {reference_time:.3f}s, new {new_time:.4f}s, "
+          f"{reference_time / new_time:.0f}x faster, "
+          f"{seconds_of_audio / new_time:.0f}x real-time")
+
+
+def delay_reference(audio, sample_rate, delay_ms, feedback, mix):
+    """The original per-sample GV_Delay loop."""
+    delay_samples = int(sample_rate * (delay_ms / 1000.0))
+    delayed_signal = np.zeros(len(audio))
+    for i in range(len(audio)):
+        delayed_signal[i] = audio[i]
+        if i >= delay_samples:
+            delayed_signal[i] += delayed_signal[i - delay_samples] * feedback
+    return (audio * (1 - mix)) + (delayed_signal * mix)
+
+
+def bench_delay(seconds=600, sample_rate=48000):
+    audio = vocal_stem(seconds, sample_rate)
+    delay = GV_Delay(feedback=0.3, mix=0.5)
+    delay.set_delay_seconds(120)
+
+    expected, reference_time = timed(delay_reference, audio, sample_rate, delay.vecal_delay_seconds,
+                                     delay.vocal_delay_feedback, delay.vocal_delay_mix)
+    output, new_time = timed(delay.process, audio, sample_rate)
+
+    print("GV_Delay sample-identical:", np.array_equal(expected, output))
+    report("GV_Delay.process", seconds, reference_time, new_time)
+
+
+def distortion_reference(buffer, a):
+    """The original per-sample Distortion.Process loop."""
+    for i in range(len(buffer)):
+        buffer[i] = Distortion.TubeSaturation(buffer[i], a)
+    return buffer
+
+
+def bench_distortion(seconds=60, sample_rate=48000):
+    audio = vocal_stem(seconds, sample_rate) * 3
+
+    expected, reference_time = timed(distortion_reference, audio.copy(), 0.2)
+    buffer = audio.copy()
+    _, new_time = timed(Distortion().Process, buffer, 0.2)
+
+    print("Distortion sample-identical:", np.array_equal(expected, buffer))
+    report("Distortion.Process", seconds, reference_time, new_time)
+
+
+def bench_vca(seconds=60, sample_rate=48000, block_size=512):
+    stereo = np.stack([vocal_stem(seconds, sample_rate, seed) for seed in (0, 1)], axis=1)
+    compressor = VCA_Compressor()
+    compressor.Setup(block_size, 2, sample_rate)
+    compressor.Process(stereo[:block_size].copy())  # compile the ballistics kernel
+    compressor.Reset()
+
+    start = time.perf_counter()
+    for i in range(0, len(stereo), block_size):
+        compressor.Process(stereo[i:i + block_size])
+    elapsed = time.perf_counter() - start
+    print(f"VCA_Compressor.Process: {seconds / elapsed:.0f}x real-time, stereo, {block_size}-sample blocks")
+
+
+def optical_reference(compressor, audio):
+    """The original per-sample OpticalCompressor.compressor loop."""
+    threshold_linear = compressor.db_to_linear(compressor.comp_threshold)
+    attack_coeff = np.exp(-1 / (compressor.attack_time * compressor.sample_rate))
+    release_coeff = np.exp(-1 / (compressor.release_time * compressor.sample_rate))
+    gain = 1.0
+    envelope = 0.0
+    output_audio = np.zeros_like(audio)
+    for i, sample in enumerate(audio):
+        envelope = max(abs(sample), envelope * attack_coeff)
+        if envelope > threshold_linear:
+            compressed_gain = 1 - (1 - compressor.comp_ratio) * (envelope - threshold_linear) / envelope
+            compressed_gain = np.clip(compressed_gain, 0, 1)
+        else:
+            compressed_gain = 1
+        if compressed_gain < gain:
+            gain = compressed_gain + (gain - compressed_gain) * release_coeff
+        else:
+            gain = compressed_gain
+        output_audio[i] = sample * gain * compressor.db_to_linear(compressor.comp_makeup_gain)
+    return output_audio
+
+
+def bench_optical(seconds=20, sample_rate=48000):
+    audio = vocal_stem(seconds, sample_rate) * 3
+    compressor = OpticalCompressor(sample_rate, threshold=0, ratio=0.25)
+    compressor.process(audio[:1024])  # compile the envelope kernel
+
+    expected, reference_time = timed(optical_reference, compressor, audio)
+    output, new_time = timed(compressor.process, audio)
+
+    print("OpticalCompressor max error:", np.abs(expected - output).max())
+    report("OpticalCompressor.process", seconds, reference_time, new_time)
+
+
+def bench_deesser_stream(seconds=30, sample_rate=48000, block_size=256):
+    audio = vocal_stem(seconds, sample_rate)
+    de_esser = DeEsser(sample_rate)
+    expected = de_esser.process(audio)
+    lookahead = int(de_esser.lookahead_ms * sample_rate / 1000)
+
+    timings = []
+    streamed = []
+    for i in range(0, len(audio), block_size):
+        block, elapsed = timed(de_esser.process_block, audio[i:i + block_size])
+        streamed.append(block.copy())
+        timings.append(elapsed)
+    streamed = np.concatenate(streamed)[lookahead:]
+
+    timings = np.array(timings) * 1e6
+    budget = block_size / sample_rate * 1e6
+    print("DeEsser stream max error vs one-shot:", np.abs(streamed - expected[:len(streamed)]).max())
+    print(f"DeEsser.process_block: {block_size}-sample blocks, mean {timings.mean():.0f}us, "
+          f"p99 {np.percentile(timings, 99):.0f}us, max {timings.max():.0f}us, budget {budget:.0f}us, "
+          f"look-ahead latency {lookahead} samples")
+
+    # Host-driven streams change the block size as they go; growing buffers must keep the history
+    de_esser.reset()
+    sizes = [512, 1, 333, 1024, 7, 2048, 64]
+    streamed = []
+    start = 0
+    while start < len(audio):
+        stop = start + sizes[len(streamed) % len(sizes)]
+        streamed.append(de_esser.process_block(audio[start:stop]).copy())
+        start = stop
+    streamed = np.concatenate(streamed)[lookahead:]
+    print(f"DeEsser stream max error vs one-shot, variable blocks {sizes}:",
+          np.abs(streamed - expected[:len(streamed)]).max())
+
+
+def bench_three_band_eq(seconds=600, sample_rate=48000):
+    stereo = np.stack([vocal_stem(seconds, sample_rate, seed) for seed in (0, 1)], axis=1).astype(np.float32)
+    eq = ThreeBandEQ(sample_rate)
+
+    # Pedalboard wants (channels, frames)
+    board = create_3band_eq(eq.low_gain, eq.peak_gain, eq.high_gain, eq.peak_cutoff, eq.peak_resonance)
+    expected, reference_time = timed(lambda audio: board(np.ascontiguousarray(audio.T), sample_rate).T, stereo)
+    output, new_time = timed(eq.process, stereo)
+
+    print("ThreeBandEQ max error vs Pedalboard:", np.abs(expected - output).max(), output.dtype)
+    report("ThreeBandEQ.process", seconds, reference_time, new_time)
+
+
+def synthetic_ir(path, seconds, sample_rate=48000, seed=0):
+    """Writes a decaying stereo noise burst standing in for a reverb IR."""
+    import soundfile as sf
+
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * sample_rate)
+    decay = np.exp(-6.9 * np.arange(frames) / frames)[:, np.newaxis]  # -60 dB at the end
+    sf.write(path, rng.standard_normal((frames, 2)) * decay, sample_rate, subtype='FLOAT')
+    return path
+
+
+def bench_conv_reverb(clips=200, clip_seconds=2, sample_rate=48000):
+    from pedalboard import Pedalboard, Convolution
+
+    with tempfile.TemporaryDirectory() as directory:
+        ir_path = synthetic_ir(os.path.join(directory, "plate.wav"), 2.5, sample_rate)
+        audio = [vocal_stem(clip_seconds, sample_rate, seed).astype(np.float32) for seed in range(clips)]
+
+        # The old conv_reverb.process: a new Pedalboard, and so a new IR decode, per clip
+        def reference(clips):
+            return [Pedalboard([Convolution(ir_path, 0.35)])(clip, sample_rate) for clip in clips]
+
+        def registry(clips):
+            return [ConvReverb(sample_rate, ir_path, 0.35).process(clip) for clip in clips]
+
+        expected, reference_time = timed(reference, audio)
+        output, new_time = timed(registry, audio)
+
+    error = max(np.abs(a - b[:, 0]).max() for a, b in zip(expected, output))
+    print("ConvReverb max error vs Pedalboard:", error)
+    report(f"ConvReverb.process ({clips} clips)", clips * clip_seconds, reference_time, new_time)
+
+
+def bench_conv_latency(seconds=3, sample_rate=48000, block_size=128, ir_seconds=(0.5, 1, 2, 4, 8)):
+    audio = vocal_stem(seconds, sample_rate)
+    budget = block_size / sample_rate
+    with tempfile.TemporaryDirectory() as directory:
+        for ir_length in ir_seconds:
+            ir_path = synthetic_ir(os.path.join(directory, f"ir_{ir_length}.wav"), ir_length, sample_rate)
+            modes = {
+                f"uniform {block_size}": ConvReverb(sample_rate, ir_path, block_size=block_size),
+                "uniform 8192": ConvReverb(sample_rate, ir_path, block_size=8192),
+                f"non-uniform {block_size}": ConvReverb(sample_rate, ir_path, block_size=block_size, low_latency=True),
+            }
+            for mode, reverb in modes.items():
+                # Blocks arrive at the audio rate, as from a sound card, so the
+                # tail worker has the wall-clock time it would have when monitoring
+                timings = []
+                start = time.perf_counter()
+                for block_index, i in enumerate(range(0, len(audio), block_size)):
+                    _, elapsed = timed(reverb.process_block, audio[i:i + block_size])
+                    timings.append(elapsed)
+                    time.sleep(max(0.0, start + (block_index + 1) * budget - time.perf_counter()))
+                reverb.close()
+                timings = np.array(timings)
+                print(f"IR {ir_length:>3}s, {mode:>16}: latency {reverb.latency / sample_rate * 1000:6.1f} ms, "
+                      f"audio thread {timings.sum() / seconds * 100:6.1f}% busy, "
+                      f"p99 block {np.percentile(timings, 99) / budget * 100:6.1f}% of its {budget * 1e3:.1f} ms budget")
+
+
+def doubler_reference(audio, sample_rate, delay_ms=20, detune_cents=5, mix=0.5):
+    """The original librosa doubler, with the detune passed as semitones rather than a ratio."""
+    import librosa
+
+    delay_samples = int((delay_ms / 1000) * sample_rate)
+    delayed_audio = np.pad(audio, (delay_samples, 0), mode='constant')[:len(audio)]
+    shifted_audio = librosa.effects.pitch_shift(delayed_audio, sr=sample_rate, n_steps=detune_cents / 100)
+    return np.clip((1 - mix) * audio + mix * shifted_audio, -1.0, 1.0)
+
+
+def measured_cents(signal, sample_rate, frequency):
+    """Pitch of a (detuned) sine relative to frequency, from the slope of its analytic phase."""
+    spectrum = np.fft.fft(signal)
+    spectrum[np.fft.fftfreq(len(signal)) <= 0] = 0
+    phase = np.unwrap(np.angle(np.fft.ifft(spectrum)))
+    measured = np.polyfit(np.arange(len(signal)) / sample_rate, phase, 1)[0] / (2 * np.pi)
+    return 1200 * np.log2(measured / frequency)
+
+
+def bench_doubler(seconds=30, sample_rate=48000):
+    audio = vocal_stem(seconds, sample_rate)
+    doubler = Doubler(20, 5, 0.5, sample_rate)
+    _, reference_time = timed(doubler_reference, audio, sample_rate)
+    _, new_time = timed(doubler.process, audio)
+    report("Doubler.process", seconds, reference_time, new_time)
+
+    sine = 0.5 * np.sin(2 * np.pi * 440 * np.arange(4 * sample_rate) / sample_rate)
+    for cents in (-10, 5, 20):
+        copy = Doubler(20, cents, 1.0, sample_rate).process(sine)[sample_rate:]
+        print(f"Doubler detune {cents:+} cents: measured {measured_cents(copy, sample_rate, 440):+.1f} cents")
+
+
+def bench_stereo_doubler(seconds=60, sample_rate=48000, voice_counts=(2, 4, 8)):
+    audio = vocal_stem(seconds, sample_rate)
+    for count in voice_counts:
+        doubler = StereoDoubler(count, mix=1.0, sample_rate=sample_rate)
+        pans = doubler.pan_gains()
+
+        # One full-length Doubler render per voice, panned and summed afterwards
+        def reference(audio):
+            voices = [Doubler(delay, detune, 1.0, sample_rate).process(audio) for delay, detune, _ in doubler.voices]
+            return np.stack(voices, axis=1) @ pans.T
+
+        expected, reference_time = timed(reference, audio)
+        output, new_time = timed(doubler.process, audio)
+        reference_peak = peak_memory(reference, audio) / 2**20
+        new_peak = peak_memory(doubler.process, audio) / 2**20
+        print(f"StereoDoubler {count} voices max error vs separate voices:", np.abs(np.clip(expected, -1, 1) - output).max())
+        report(f"StereoDoubler.process ({count} voices, peak {new_peak:.0f} MiB vs {reference_peak:.0f} MiB)",
+               seconds, reference_time, new_time)
+
+
+def bench_dynamic_eq(seconds=60, sample_rate=48000):
+    stereo = np.stack([vocal_stem(seconds, sample_rate, seed) for seed in (0, 1)], axis=1)
+    bands = [
+        DynamicBand("high_pass", 90, q=None),
+        DynamicBand("low_shelf", 250, gain_db=2, threshold_db=-24, ratio=3),
+        DynamicBand("peaking", 550, q=2.5, gain_db=-0.5, threshold_db=-30, ratio=2),
+        DynamicBand("peaking", 3000, q=1.5, threshold_db=-28, ratio=4),
+        DynamicBand("high_shelf", 8000, gain_db=3, threshold_db=-30, ratio=3),
+    ]
+    eq = DynamicEQ(sample_rate, bands, lookahead_ms=2)
+    eq.process(stereo[:1024])  # compile the kernels
+
+    # One single-band instance per band, each a separate pass over the audio
+    def reference(audio):
+        for band in bands:
+            audio = DynamicEQ(sample_rate, [band], lookahead_ms=2).process(audio)
+        return audio
+
+    expected, reference_time = timed(reference, stereo)
+    output, new_time = timed(eq.process, stereo)
+    print("DynamicEQ max difference vs chained bands:", np.abs(expected - output).max())
+    report(f"DynamicEQ.process ({len(bands)} bands, one cascade)", seconds, reference_time, new_time)
+
+
+def peak_memory(func, *args):
+    """Peak bytes allocated while func runs once. Tracing slows func down, so time it separately."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_chain(seconds=60, sample_rate=48000, block_size=512):
+    stereo = np.stack([vocal_stem(seconds, sample_rate, seed) for seed in (0, 1)], axis=1)
+
+    def delay():
+        gv_delay = GV_Delay(sample_rate=sample_rate)
+        gv_delay.set_delay_seconds(120)
+        return gv_delay
+
+    with tempfile.TemporaryDirectory() as directory:
+        ir_path = synthetic_ir(os.path.join(directory, "plate.wav"), 2.5, sample_rate)
+
+        # Glue code: every step takes and returns a whole signal
+        def reference(audio):
+            audio = HiPass().process(audio, sample_rate)
+            audio = ThreeBandEQ(sample_rate).process(audio)
+            audio = audio * 10 ** (-3 / 20)
+            audio = DeEsser(sample_rate).process(audio).copy()
+            compressor = VCA_Compressor()
+            compressor.Setup(len(audio), 2, sample_rate)
+            compressor.Process(audio)
+            audio = delay().process(audio, sample_rate)
+            return ConvReverb(sample_rate, ir_path, 0.35).process(audio)
+
+        chain = EffectChain([HiPass(), ThreeBandEQ(sample_rate), Gain(-3), DeEsser(sample_rate), VCA_Compressor(),
+                             delay(), ConvReverb(sample_rate, ir_path, 0.35, block_size=block_size, low_latency=True)])
+        chain.prepare(sample_rate, block_size, 2)
+        fused = [type(stage).__name__ for stage in chain._active]
+
+        expected, reference_time = timed(reference, stereo)
+        output, new_time = timed(chain.process, stereo)
+        reference_memory = peak_memory(reference, stereo)
+        new_memory = peak_memory(chain.process, stereo)
+        chain.stages[-1].effect.close()
+
+    print(f"EffectChain: {len(chain.stages)} stages run as {len(fused)} ({', '.join(fused)}), "
+          f"latency {chain.latency} samples")
+    print("EffectChain max error vs glue code:", np.abs(expected - output).max())
+    print(f"Peak allocation: glue code {reference_memory / 2**20:.0f} MiB, "
+          f"EffectChain {new_memory / 2**20:.0f} MiB (output {output.nbytes / 2**20:.0f} MiB)")
+    # The chain streams with block_size latency; the glue code convolves offline in long partitions
+    print(f"EffectChain.process ({block_size}-sample blocks): glue code {reference_time:.3f}s, "
+          f"chain {new_time:.3f}s, {seconds / new_time:.0f}x real-time")
+
+
+def bench_batch(files=16, file_seconds=30, sample_rate=48000):
+    import soundfile as sf
+    from . import batch
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "in"))
+        for seed in range(files):
+            stem = np.stack([vocal_stem(file_seconds, sample_rate, seed),
+                             vocal_stem(file_seconds, sample_rate, seed + files)], axis=1)
+            sf.write(os.path.join(directory, "in", f"take{seed:03d}.wav"), stem * 0.5, sample_rate, subtype='FLOAT')
+        pattern = os.path.join(directory, "in", "*.wav")
+
+        # The old nightly loop: one file at a time on one core, a fresh chain per file
+        def reference():
+            for path in sorted(glob.glob(pattern)):
+                audio, rate = sf.read(path)
+                chain = EffectChain(batch.vocal(rate))
+                chain.prepare(rate, batch.BLOCK_SIZE, audio.shape[1])
+                sf.write(os.path.join(directory, "reference.wav"), chain.process(audio), rate, subtype='FLOAT')
+
+        _, reference_time = timed(reference)
+        audio_seconds = files * file_seconds
+        print(f"Serial loop: {files} files in {reference_time:.1f}s, {audio_seconds / reference_time:.0f}x real-time")
+        single = None
+        for workers in sorted({1, 2, 4, os.cpu_count()}):
+            if workers > os.cpu_count():
+                continue
+            _, elapsed = timed(batch.render_batch, "vocal", pattern, os.path.join(directory, "out"), workers,
+                               batch.BLOCK_SIZE, 'FLOAT')
+            single = single or elapsed
+            print(f"render_batch, {workers} workers: {elapsed:.1f}s, {audio_seconds / elapsed:.0f}x real-time, "
+                  f"{single / elapsed:.1f}x the 1-worker speed")
+
+
+# Run in a fresh interpreter per measurement, so each peak RSS is its own
+STREAMING_RENDERS = {
+    # The old script shape: load the whole file, run each stage over all of it, write it out
+    "whole file": """
+import soundfile as sf
+from Effects import DeEsser, ThreeBandEQ, VCA_Compressor
+audio, rate = sf.read(INPUT)
+audio = ThreeBandEQ(rate).process(audio)
+audio = DeEsser(rate).process(audio)
+compressor = VCA_Compressor()
+compressor.Setup(len(audio), audio.shape[1], rate)
+compressor.Process(audio)
+sf.write(OUTPUT, audio, rate, subtype='FLOAT')
+""",
+    "stream_file": """
+from Effects import DeEsser, EffectChain, ThreeBandEQ, VCA_Compressor
+from Effects.streaming import stream_file
+stream_file(EffectChain([ThreeBandEQ(RATE), DeEsser(RATE), VCA_Compressor()]), INPUT, OUTPUT)
+""",
+    "stream_file, normalised": """
+from Effects import DeEsser, EffectChain, ThreeBandEQ, VCA_Compressor
+from Effects.streaming import stream_file
+stream_file(EffectChain([ThreeBandEQ(RATE), DeEsser(RATE), VCA_Compressor()]), INPUT, OUTPUT,
+            normalise_db=-1, scratch_dir=SCRATCH)
+""",
+    # Whole-file analysis on scratch arrays, the file read in and written out block by block
+    "DeEsser.process, scratch_dir": """
+import soundfile as sf
+from Effects import DeEsser
+from Effects.streaming import BLOCK_SIZE, release, scratch_array
+with sf.SoundFile(INPUT) as source:
+    audio = scratch_array((source.frames, source.channels), directory=SCRATCH)
+    for start in range(0, len(audio), BLOCK_SIZE):
+        source.read(out=audio[start:start + BLOCK_SIZE])
+        release(audio, start, start + BLOCK_SIZE)
+output = DeEsser(RATE).process(audio, scratch_dir=SCRATCH)
+with sf.SoundFile(OUTPUT, 'w', RATE, output.shape[1], 'FLOAT') as sink:
+    for start in range(0, len(output), BLOCK_SIZE):
+        sink.write(output[start:start + BLOCK_SIZE])
+        release(output, start, start + BLOCK_SIZE)
+""",
+}
+
+
+def bench_streaming(minutes=(2, 10), sample_rate=48000):
+    import soundfile as sf
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "stem.wav")
+        output_path = os.path.join(directory, "out.wav")
+        for length in minutes:
+            # Written in one-minute pieces, so making the test file stays small too
+            with sf.SoundFile(input_path, 'w', sample_rate, 2, 'FLOAT') as stem:
+                for minute in range(length):
+                    stem.write(np.stack([vocal_stem(60, sample_rate, minute),
+                                         vocal_stem(60, sample_rate, minute + length)], axis=1) * 0.5)
+            for name, script in STREAMING_RENDERS.items():
+                setup = (f"INPUT, OUTPUT, RATE, SCRATCH = {input_path!r}, {output_path!r}, {sample_rate}, {directory!r}\n")
+                probe = setup + script + "import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+                start = time.perf_counter()
+                result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True,
+                                        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+                elapsed = time.perf_counter() - start
+                print(f"{length} min stereo, {name}: peak RSS {int(result.stdout.split()[-1]) / 1024:.0f} MiB, "
+                      f"{elapsed:.1f}s")
+
+
+IMPORT_MODULES = ("batch", "biquad", "chain", "chorus", "conv_reverb", "convolution", "de_esser", "delay",
+                  "distortion", "doubler", "dynamic_eq", "gain", "hi_pass_eq", "high_shelf_filter", "mix", "optical_compressor",
+                  "oversampling", "precision", "resonant_eq", "sidechain", "streaming", "three_band_eq", "tube_amp_eq", "vca_compressor")
+
+
+def import_time(module):
+    """Cumulative cold import time of Effects.<module> in microseconds, from python -X importtime."""
+    target = f"{__package__}.{module}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                            capture_output=True, text=True, check=True)
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == target:
+            return int(fields[1])
+    raise RuntimeError(f"{target} missing from -X importtime output")
+
+
+def bench_imports():
+    heavy = ("numba", "librosa", "pedalboard", "pydub", "soundfile")
+    for module in IMPORT_MODULES:
+        probe = (f"import sys, {__package__}.{module}; "
+                 f"print(' '.join(name for name in {heavy!r} if name in sys.modules))")
+        loaded = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        print(f"import {module}: {import_time(module) / 1000:.1f} ms"
+              + (f" (loads {loaded})" if loaded else ""))
+
+
+BENCHMARKS = {
+    "delay": bench_delay,
+    "distortion": bench_distortion,
+    "vca": bench_vca,
+    "optical": bench_optical,
+    "deesser_stream": bench_deesser_stream,
+    "three_band_eq": bench_three_band_eq,
+    "conv_reverb": bench_conv_reverb,
+    "conv_latency": bench_conv_latency,
+    "doubler": bench_doubler,
+    "stereo_doubler": bench_stereo_doubler,
+    "dynamic_eq": bench_dynamic_eq,
+    "chain": bench_chain,
+    "batch": bench_batch,
+    "streaming": bench_streaming,
+    "imports": bench_imports,
+}
+
+if __name__ == "__main__":
+    # python -m Effects.benchmark [name ...]
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
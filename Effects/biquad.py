@@ -0,0 +1,215 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import sosfilt
+from . import precision
+from .jit import LazyKernel
+
+# Designs kept in the coefficient cache before the least recently used is dropped
+CACHE_SIZE = 1024
+
+# Q giving a maximally flat (Butterworth) second-order response, and the RBJ
+# shelf with slope S=1
+BUTTERWORTH_Q = 1 / np.sqrt(2)
+SHELF_Q = 1 / np.sqrt(2)
+
+KINDS = ("peaking", "low_shelf", "high_shelf", "high_pass", "low_pass", "band_pass")
+
+
+def _coefficients(kind, fs, f0, q, gain_db):
+    # b and a as lists; gain_db may be an array, giving arrays of coefficients
+    A = 10**(np.asarray(gain_db) / 40)  # Amplitude from dB gain
+    omega = 2 * np.pi * f0 / fs
+    cos_omega = np.cos(omega)
+    alpha = np.sin(omega) / (2 * q) if q is not None else None
+
+    if kind == "peaking":
+        b = [1 + alpha * A, -2 * cos_omega, 1 - alpha * A]
+        a = [1 + alpha / A, -2 * cos_omega, 1 - alpha / A]
+    elif kind in ("low_shelf", "high_shelf"):
+        sign = 1 if kind == "low_shelf" else -1
+        root = 2 * np.sqrt(A) * alpha
+        b = [A * ((A + 1) - sign * (A - 1) * cos_omega + root),
+             sign * 2 * A * ((A - 1) - sign * (A + 1) * cos_omega),
+             A * ((A + 1) - sign * (A - 1) * cos_omega - root)]
+        a = [(A + 1) + sign * (A - 1) * cos_omega + root,
+             -sign * 2 * ((A - 1) + sign * (A + 1) * cos_omega),
+             (A + 1) + sign * (A - 1) * cos_omega - root]
+    elif kind in ("high_pass", "low_pass") and q is None:
+        # First order (6 dB/octave), bilinear transform
+        K = np.tan(omega / 2)
+        if kind == "high_pass":
+            b = [1, -1, 0]
+        else:
+            b = [K, K, 0]
+        a = [1 + K, K - 1, 0]
+    elif kind == "high_pass":
+        b = [(1 + cos_omega) / 2, -(1 + cos_omega), (1 + cos_omega) / 2]
+        a = [1 + alpha, -2 * cos_omega, 1 - alpha]
+    elif kind == "low_pass":
+        b = [(1 - cos_omega) / 2, 1 - cos_omega, (1 - cos_omega) / 2]
+        a = [1 + alpha, -2 * cos_omega, 1 - alpha]
+    elif kind == "band_pass":
+        # Constant 0 dB peak gain
+        b = [alpha, 0, -alpha]
+        a = [1 + alpha, -2 * cos_omega, 1 - alpha]
+    else:
+        raise ValueError(f"Unknown biquad type {kind!r}, expected one of {KINDS}")
+    return b, a
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _design(kind, fs, f0, q, gain_db):
+    b, a = _coefficients(kind, fs, f0, q, gain_db)
+    sos = np.array([b + a], dtype=float) / a[0]
+    sos.setflags(write=False)
+    return sos
+
+
+def design(kind, fs, f0, q=None, gain_db=0.0):
+    """
+    Designs one RBJ biquad, memoized by (type, fs, f0, Q, gain).
+
+    Args:
+        kind (str): One of KINDS.
+        fs (float): Sample rate in Hz.
+        f0 (float): Centre, corner or cutoff frequency in Hz.
+        q (float): Quality factor. For high_pass/low_pass, None gives a first-order section.
+        gain_db (float): Gain in dB (peaking and shelves only).
+
+    Returns:
+        numpy.ndarray: A (1, 6) second-order sections array, ready for scipy's sosfilt.
+    """
+    if q is not None:
+        q = float(q)
+    # sosfilt needs writable coefficients, so callers get their own copy of the cached design
+    return _design(kind, float(fs), float(f0), q, float(gain_db)).copy()
+
+
+def gain_sweep(kind, fs, f0, q, gains_db):
+    """
+    Designs one section of the same filter per gain in gains_db, vectorised.
+    Not cached: meant for per-block gains that rarely repeat exactly.
+
+    Returns:
+        numpy.ndarray: (len(gains_db), 6) sections, one per gain.
+    """
+    gains_db = np.asarray(gains_db, dtype=float)
+    b, a = _coefficients(kind, float(fs), float(f0), None if q is None else float(q), gains_db)
+    sections = np.empty(gains_db.shape + (6,))
+    for column, coefficient in enumerate(b + a):
+        sections[..., column] = coefficient
+    sections /= sections[..., 3:4]
+    return sections
+
+
+def peaking(fs, f0, q, gain_db):
+    """Peaking EQ boosting or cutting gain_db around f0."""
+    return design("peaking", fs, f0, q, gain_db)
+
+
+def low_shelf(fs, f0, gain_db, q=SHELF_Q):
+    """Low shelf applying gain_db below f0 (half of it at f0)."""
+    return design("low_shelf", fs, f0, q, gain_db)
+
+
+def high_shelf(fs, f0, gain_db, q=SHELF_Q):
+    """High shelf applying gain_db above f0 (half of it at f0)."""
+    return design("high_shelf", fs, f0, q, gain_db)
+
+
+def high_pass(fs, f0, q=BUTTERWORTH_Q):
+    """High-pass at f0; q=None gives a first-order (6 dB/octave) slope."""
+    return design("high_pass", fs, f0, q)
+
+
+def low_pass(fs, f0, q=BUTTERWORTH_Q):
+    """Low-pass at f0; q=None gives a first-order (6 dB/octave) slope."""
+    return design("low_pass", fs, f0, q)
+
+
+def band_pass(fs, f0, q):
+    """Band-pass around f0 with 0 dB gain at the peak."""
+    return design("band_pass", fs, f0, q)
+
+
+def cascade(*sections):
+    """Stacks single sections and SOS arrays into one SOS cascade."""
+    return np.concatenate(sections, axis=0)
+
+
+def cache_info():
+    """Hits, misses, maxsize and current size of the coefficient cache."""
+    return _design.cache_info()
+
+
+def cache_clear():
+    _design.cache_clear()
+
+
+def frame_axis(audio):
+    """
+    The time axis of audio in either layout, as Pedalboard accepts it: 0 for
+    (frames,) and (frames, channels), 1 for (channels, frames). The longer axis
+    of a 2-D array holds the frames.
+
+    Raises:
+        ValueError: For a square 2-D array, whose layout cannot be told apart.
+    """
+    if np.ndim(audio) != 2:
+        return 0
+    frames, channels = np.shape(audio)
+    if frames == channels and frames > 1:
+        raise ValueError(f"Ambiguous {frames}x{channels} audio: pass (frames, channels) with more frames than channels")
+    return 0 if frames >= channels else 1
+
+
+def _time_varying_sosfilt(x, sos_blocks, block_size, offset, zi, out):
+    # Transposed direct form II, the same state layout as scipy's sosfilt zi,
+    # with a new set of sections every block_size samples, the first block
+    # offset samples in already. x/out are (frames, channels)
+    for i in range(x.shape[0]):
+        sos = sos_blocks[(i + offset) // block_size]
+        for c in range(x.shape[1]):
+            value = x[i, c]
+            for s in range(sos.shape[0]):
+                y = sos[s, 0] * value + zi[s, 0, c]
+                zi[s, 0, c] = sos[s, 1] * value - sos[s, 4] * y + zi[s, 1, c]
+                zi[s, 1, c] = sos[s, 2] * value - sos[s, 5] * y
+                value = y
+            out[i, c] = value
+
+# Without Numba, sosfilt_blocks falls back to one sosfilt call per block
+_time_varying_sosfilt_kernel = LazyKernel(_time_varying_sosfilt)
+
+
+def sosfilt_blocks(sos_blocks, x, block_size, zi, offset=0):
+    """
+    Filters x (frames along axis 0) through a cascade whose sections change
+    every block_size frames, keeping the filter state continuous across changes.
+
+    Args:
+        sos_blocks (numpy.ndarray): (blocks, sections, 6), one cascade per block.
+        x (numpy.ndarray): Input, (frames,) or (frames, channels).
+        block_size (int): Frames per block; the first and last block may be shorter.
+        zi (numpy.ndarray): (sections, 2) + channel shape state, updated in place.
+            The sections are applied at its precision.
+        offset (int): Frames of the first block already filtered by an earlier
+            call, so x only holds its last block_size - offset frames.
+
+    Returns:
+        numpy.ndarray: The filtered signal, float32 for float32 x and float64 otherwise.
+    """
+    x = precision.as_samples(x)
+    sos_blocks = np.asarray(sos_blocks, dtype=zi.dtype)
+    length = len(x)
+    out = np.empty(x.shape, dtype=x.dtype)
+    kernel = _time_varying_sosfilt_kernel.compiled()
+    if kernel is not None:
+        kernel(x.reshape(length, -1), sos_blocks, block_size, offset, zi.reshape(zi.shape[0], 2, -1),
+               out.reshape(length, -1))
+        return out
+
+    for block, start in enumerate(range(-offset, length, block_size)):
+        start, stop = max(start, 0), min(start + block_size, length)
+        out[start:stop], zi[...] = sosfilt(sos_blocks[block], x[start:stop], axis=0, zi=zi)
+    return out
@@ -0,0 +1,405 @@
+"""
+A common block interface for the effects, and a chain that runs a stream
+through any number of them without allocating per block.
+"""
+import inspect
+import numpy as np
+from scipy.signal import sos2tf, sosfilt, tf2sos
+from . import biquad, precision
+
+
+class Effect(object):
+    """
+    The block interface of every EffectChain stage. prepare() is called once with
+    the stream format, then process_block(block, out) for each block. block and
+    out are (frames, channels) arrays of at most block_size frames in the chain's
+    dtype (float32 or float64), never the same array, and block must not be modified.
+    """
+    # Delay of the output against the input, in samples
+    latency = 0
+
+    def prepare(self, sample_rate, block_size, channels):
+        """
+        Sets the stage up for a stream and clears its state.
+
+        Returns:
+            int: The number of output channels for channels input channels.
+        """
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.reset()
+        return channels
+
+    def reset(self):
+        """Clears the state carried between blocks."""
+
+    def process_block(self, block, out):
+        raise NotImplementedError
+
+    def sections(self, sample_rate):
+        """The stage as an SOS cascade at sample_rate if it is a fixed linear filter, else None."""
+        return None
+
+
+class Filter(Effect):
+    def __init__(self, sos, state_dtype=None, design_rate=None):
+        """
+        A fixed second-order-sections cascade.
+
+        Args:
+            sos (numpy.ndarray): (sections, 6) coefficients, as for scipy's sosfilt.
+            state_dtype: Precision of the coefficients and state; None follows the blocks.
+            design_rate (int): Sample rate sos was designed for; a chain at any other
+                rate is refused. None runs it at whatever rate the chain has.
+        """
+        self.sos = np.asarray(sos, dtype=float)
+        self.state_dtype = state_dtype
+        self.design_rate = design_rate
+        self._sos = None
+        self._zi = None
+
+    def sections(self, sample_rate):
+        if self.design_rate is not None and self.design_rate != sample_rate:
+            raise ValueError(f"Filter is designed for {self.design_rate} Hz, the chain runs at {sample_rate} Hz")
+        return self.sos
+
+    def prepare(self, sample_rate, block_size, channels):
+        self._sos = self.sections(sample_rate)
+        self._zi = np.zeros((len(self._sos), 2, channels))
+        return super().prepare(sample_rate, block_size, channels)
+
+    def reset(self):
+        if self._zi is not None:
+            self._zi.fill(0)
+
+    def process_block(self, block, out):
+        dtype = precision.state_dtype(block, self.state_dtype)
+        if self._zi.dtype != dtype:
+            # First block in a new precision: carry the state over once
+            self._sos = self._sos.astype(dtype)
+            self._zi = self._zi.astype(dtype)
+        out[...], self._zi[...] = sosfilt(self._sos, block, axis=0, zi=self._zi)
+
+
+class Biquad(Filter):
+    def __init__(self, kind, f0, q=biquad.BUTTERWORTH_Q, gain_db=0.0, state_dtype=None):
+        """
+        One RBJ biquad, designed for the sample rate the chain is prepared with.
+
+        Args:
+            kind (str): One of biquad.KINDS.
+            f0 (float): Centre, corner or cutoff frequency in Hz.
+            q (float): Quality factor; None gives a first-order high or low pass.
+            gain_db (float): Gain in dB (peaking and shelves only).
+            state_dtype: Precision of the coefficients and state; None follows the blocks.
+        """
+        super().__init__(np.zeros((0, 6)), state_dtype)
+        self.kind = kind
+        self.f0 = f0
+        self.q = q
+        self.gain_db = gain_db
+
+    def sections(self, sample_rate):
+        return biquad.design(self.kind, sample_rate, self.f0, self.q, self.gain_db)
+
+
+class Gain(Effect):
+    def __init__(self, gain_db):
+        """Scales the signal by gain_db."""
+        self.gain_db = gain_db
+
+    def sections(self, sample_rate):
+        return np.array([[10 ** (self.gain_db / 20), 0, 0, 1, 0, 0]])
+
+    def process_block(self, block, out):
+        np.multiply(block, 10 ** (self.gain_db / 20), out=out)
+
+
+class Mix(Effect):
+    def __init__(self, effect, mix):
+        """
+        Blends an effect with the dry signal, like Mixer: mix of the effect and
+        1 - mix of the input. The dry path is delayed by the effect's latency.
+
+        Args:
+            effect: The wet path, anything as_effect() accepts.
+            mix (float): Blend between the dry (0) and the wet (1) signal.
+        """
+        self.effect = as_effect(effect)
+        self.mix = mix
+        self._dry = np.zeros((0, 1))
+
+    @property
+    def latency(self):
+        return self.effect.latency
+
+    def sections(self, sample_rate):
+        # mix * H + (1 - mix) over H's own denominator; the poles stay where they were
+        sos = self.effect.sections(sample_rate)
+        if sos is None:
+            return None
+        b, a = sos2tf(sos)
+        return tf2sos(self.mix * b + (1 - self.mix) * a, a)
+
+    def prepare(self, sample_rate, block_size, channels):
+        output_channels = self.effect.prepare(sample_rate, block_size, channels)
+        # Dry delay line of latency frames, followed by the new block
+        self._dry = np.zeros((self.latency + block_size, channels))
+        super().prepare(sample_rate, block_size, channels)
+        return output_channels
+
+    def reset(self):
+        self.effect.reset()
+        self._dry.fill(0)
+
+    def process_block(self, block, out):
+        self.effect.process_block(block, out)
+        if self._dry.dtype != block.dtype:
+            self._dry = self._dry.astype(block.dtype)
+        latency = self.latency
+        length = len(block)
+        dry = self._dry[:latency + length]
+        dry[latency:] = block
+        out *= self.mix
+        out += (1 - self.mix) * dry[:length]
+        dry[:latency] = dry[length:]
+
+
+class Stream(Effect):
+    def __init__(self, effect):
+        """
+        Adapts an effect with a process_block(block) method (DeEsser, GV_Delay,
+        OpticalCompressor, ConvReverb, DynamicEQ, Doubler, ...) to the Effect
+        interface. Effects that take an out argument write straight into the chain's buffers.
+        """
+        self.effect = effect
+        self._writes_out = "out" in inspect.signature(effect.process_block).parameters
+
+    @property
+    def latency(self):
+        return getattr(self.effect, "latency", 0)
+
+    def prepare(self, sample_rate, block_size, channels):
+        effect_rate = getattr(self.effect, "sample_rate", sample_rate)
+        if effect_rate != sample_rate:
+            raise ValueError(f"{type(self.effect).__name__} is set up for {effect_rate} Hz, the chain runs at {sample_rate} Hz")
+        # One block of silence shows how many channels come out (a stereo IR or
+        # StereoDoubler widens a mono stream); the reset in prepare() forgets it
+        probe = self.effect.process_block(np.zeros((block_size, channels)))
+        super().prepare(sample_rate, block_size, channels)
+        return np.reshape(probe, (block_size, -1)).shape[1]
+
+    def reset(self):
+        self.effect.reset()
+
+    def process_block(self, block, out):
+        if self._writes_out:
+            self.effect.process_block(block, out=out)
+        else:
+            out[...] = np.reshape(self.effect.process_block(block), out.shape)
+
+
+class Compressor(Effect):
+    def __init__(self, compressor):
+        """Adapts a VCA_Compressor, which compresses in place, to the Effect interface."""
+        self.compressor = compressor
+
+    def prepare(self, sample_rate, block_size, channels):
+        if hasattr(self.compressor, "threshold_"):
+            # Already set up: keep its settings, only size the buffers for the stream
+            self.compressor.sample_rate = sample_rate
+            self.compressor.Allocate(block_size, channels)
+        else:
+            self.compressor.Setup(block_size, channels, sample_rate)
+        return super().prepare(sample_rate, block_size, channels)
+
+    def reset(self):
+        self.compressor.Reset()
+
+    def process_block(self, block, out):
+        np.copyto(out, block)
+        self.compressor.Process(out)
+
+
+class Saturation(Effect):
+    def __init__(self, distortion, amount=None):
+        """Adapts a Distortion, which shapes in place, to the Effect interface, at amount or its own setting."""
+        self.distortion = distortion
+        self.amount = distortion.a if amount is None else amount
+
+    @property
+    def latency(self):
+        return self.distortion.latency
+
+    def reset(self):
+        self.distortion.Reset()
+
+    def process_block(self, block, out):
+        np.copyto(out, block)
+        self.distortion.ProcessBlock(out, self.amount)
+
+
+def as_effect(stage):
+    """
+    Wraps an effect object in the matching Effect adapter. Effect instances are
+    returned as they are.
+    """
+    # Imported here so building a chain only loads the modules it uses
+    from .distortion import Distortion
+    from .hi_pass_eq import HiPass
+    from .three_band_eq import ThreeBandEQ
+    from .vca_compressor import VCA_Compressor
+
+    if isinstance(stage, Effect):
+        return stage
+    if isinstance(stage, HiPass):
+        return Biquad("high_pass", stage.cutoff, q=None, state_dtype=stage.state_dtype)
+    if isinstance(stage, ThreeBandEQ):
+        return Filter(stage.sos, stage.state_dtype, stage.sample_rate)
+    if isinstance(stage, VCA_Compressor):
+        return Compressor(stage)
+    if isinstance(stage, Distortion):
+        return Saturation(stage)
+    if hasattr(stage, "process_block"):
+        return Stream(stage)
+    raise TypeError(f"{type(stage).__name__} has no block interface to chain")
+
+
+def _fold_gains(sos):
+    # Pure gain rows (b1 = b2 = a1 = a2 = 0) scale the first real section instead
+    gain_rows = np.all(sos[:, [1, 2, 4, 5]] == 0, axis=1)
+    if not gain_rows.any() or gain_rows.all():
+        return sos
+    gain = np.prod(sos[gain_rows, 0] / sos[gain_rows, 3])
+    sos = sos[~gain_rows].copy()
+    sos[0, :3] *= gain
+    return sos
+
+
+def fuse_linear(stages, sample_rate):
+    """
+    Merges every run of adjacent fixed linear stages (biquads, gains, mixes of
+    linear filters, EQs) into one Filter, so each run costs a single sosfilt pass.
+    A fused Filter keeps its state at the highest state_dtype any of its stages asked for.
+
+    Returns:
+        list: The stages, with each run replaced by its fused Filter.
+    """
+    fused = []
+    run = []
+    for stage in list(stages) + [None]:
+        sections = None if stage is None else stage.sections(sample_rate)
+        if sections is not None:
+            run.append((stage, sections))
+            continue
+        if len(run) == 1:
+            fused.append(run[0][0])
+        elif run:
+            dtypes = [stage.state_dtype for stage, _ in run if getattr(stage, "state_dtype", None) is not None]
+            fused.append(Filter(_fold_gains(biquad.cascade(*[sections for _, sections in run])),
+                                np.result_type(*dtypes) if dtypes else None))
+        run = []
+        if stage is not None:
+            fused.append(stage)
+    return fused
+
+
+class EffectChain(Effect):
+    def __init__(self, stages, fuse=True, dtype=np.float64):
+        """
+        Runs a stream through stages in order. Each block passes between two
+        preallocated buffers, so no stage allocates an intermediate array.
+
+        Args:
+            stages (list): Effect instances or effect objects as_effect() can wrap.
+            fuse (bool): Merge adjacent linear filters into one SOS cascade in prepare().
+            dtype: Sample precision between the stages, np.float32 or np.float64.
+                Stages keep their state at their own state_dtype.
+        """
+        self.stages = [as_effect(stage) for stage in stages]
+        self.fuse = fuse
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in precision.SAMPLE_DTYPES:
+            raise ValueError(f"dtype must be float32 or float64, got {self.dtype}")
+        self._active = self.stages
+        self._channels = []
+        self._buffers = np.zeros((2, 0))
+
+    @property
+    def latency(self):
+        return sum(stage.latency for stage in self._active)
+
+    @property
+    def output_channels(self):
+        """Channels coming out of process_block(), once prepared."""
+        return self._channels[-1]
+
+    def sections(self, sample_rate):
+        cascade = [stage.sections(sample_rate) for stage in self.stages]
+        if not cascade or any(sections is None for sections in cascade):
+            return None
+        return biquad.cascade(*cascade)
+
+    def prepare(self, sample_rate, block_size, channels):
+        self._active = fuse_linear(self.stages, sample_rate) if self.fuse else list(self.stages)
+        self._channels = [channels]
+        for stage in self._active:
+            self._channels.append(stage.prepare(sample_rate, block_size, self._channels[-1]))
+        # Flat storage, so every stage gets a contiguous (frames, channels) view
+        self._buffers = np.zeros((2, block_size * max(self._channels)), dtype=self.dtype)
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        return self._channels[-1]
+
+    def reset(self):
+        for stage in self._active:
+            stage.reset()
+
+    def process_block(self, block, out):
+        if len(block) > self.block_size:
+            raise ValueError(f"Block of {len(block)} frames, the chain is prepared for {self.block_size}")
+        length = len(block)
+        if not self._active:
+            np.copyto(out, block)
+            return
+        source = block
+        for index, stage in enumerate(self._active):
+            if index == len(self._active) - 1:
+                target = out
+            else:
+                target = self._buffers[index % 2, :length * self._channels[index + 1]].reshape(length, -1)
+            stage.process_block(source, target)
+            source = target
+
+    def process(self, audio):
+        """
+        Runs a whole signal through the prepared chain, from a reset state. The
+        chain is flushed with silence and the output trimmed by latency, so it
+        lines up with the input.
+
+        :param audio: NumPy array of audio samples, (frames,) or (frames, channels).
+        :return: The processed audio, in the chain's dtype; one output channel comes back as
+            (frames,) for a (frames,) input.
+        """
+        audio = np.asarray(audio, dtype=self.dtype)
+        frames = audio.reshape(len(audio), -1)
+        if frames.shape[1] != self._channels[0]:
+            raise ValueError(f"{frames.shape[1]} channels in, the chain is prepared for {self._channels[0]}")
+        self.reset()
+        latency = self.latency
+        total = len(frames) + latency
+        output = np.empty((total, self._channels[-1]), dtype=self.dtype)
+        silence = np.zeros((self.block_size, frames.shape[1]), dtype=self.dtype)
+        for start in range(0, total, self.block_size):
+            stop = min(start + self.block_size, total)
+            block = frames[start:stop]
+            if len(block) < stop - start:
+                # Past the end of the input: flush with silence
+                padded = silence[:stop - start]
+                padded[:len(block)] = block
+                padded[len(block):] = 0
+                block = padded
+            self.process_block(block, output[start:stop])
+        self.reset()
+        output = output[latency:]
+        return output[:, 0] if audio.ndim == 1 and output.shape[1] == 1 else output
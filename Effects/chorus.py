@@ -1,5 +1,4 @@
-from pedalboard import Chorus
-import pedalboard as pd
+from . import precision
 
 class GVChorus(object):
     def __init__(self, rateHz, depth, cDelay, feedback, mix):
@@ -15,17 +14,22 @@ class GVChorus(object):
         self.centre_delay_ms = cDelay
         self.feedback = feedback
         self.mix = mix
+        from pedalboard import Chorus
         Chorus(self.rate, self.depth, self.centre_delay_ms, self.feedback, self.mix)
 
         # Define the chorus effect with options
     def create_chorus(rateHz=5, depth=20, cDelay=20, feedback=50, mix=0.35):
+        from pedalboard import Chorus
         return Chorus(rate_hz=rateHz, depth=depth, centre_delay_ms=cDelay, feedback=feedback, mix=mix)
 
 
     def Process(self, buffer, frameSize, sampleRate):
+        import pedalboard as pd
+        from pedalboard import Chorus
         board = pd.Pedalboard([
             Chorus(rate_hz=5, depth=0.1, centre_delay_ms=10, feedback=0.2, mix=0.15)
         ])
 
+        # Pedalboard always renders in float32; float64 input gets float64 back
         processed_audio = board(buffer, sampleRate)
-        return processed_audio
\ No newline at end of file
+        return processed_audio.astype(precision.sample_dtype(buffer), copy=False)
\ No newline at end of file
@@ -1,20 +1,222 @@
-from pedalboard import Pedalboard, Convolution, Reverb
-from pedalboard.io import AudioFile
+import hashlib
+import os
+from fractions import Fraction
+import numpy as np
+from scipy.signal import resample_poly
+from . import precision
+from .convolution import NonUniformConvolver, PartitionedConvolver, nonuniform_layout, partition_ir
 
 # Load an impulse response (IR) file for convolution reverb
 # ir_file = "Audio/Reverbs/Church Schellingwoude.wav"
 # ir_file = "Audio/Reverbs/emt_140_bright_2.wav"
 ir_file = "Audio/Reverbs/A_Plate.aif"
 
+# Same IR normalisation as Pedalboard's Convolution: the loudest channel is
+# scaled to this RMS sum, so IRs of different lengths come out at similar levels
+IR_NORMALISED_ENERGY = 0.125
 
+# process() has no latency to keep down, so it convolves with long partitions,
+# which need far fewer spectral multiply-adds per sample than the streaming ones
+OFFLINE_BLOCK_SIZE = 32768
+
+
+class IRRegistry(object):
+    def __init__(self, cache_dir=None):
+        """
+        Loads each impulse response once per sample rate and keeps it, and its
+        FFT partitions per block size, in memory for every later reverb.
+
+        Args:
+            cache_dir (str): Optional directory for .npy copies of the resampled IRs
+                and partitions. They are memory-mapped on the next run instead of
+                decoding and resampling the file again.
+        """
+        self.cache_dir = cache_dir
+        self._irs = {}
+        self._partitions = {}
+
+    def _key(self, path, *settings):
+        # A changed file on disk gets a new key, so stale entries are never reused
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime_ns) + settings
+
+    def _cached(self, name, key, build):
+        if self.cache_dir is None:
+            return build()
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        cache_file = os.path.join(self.cache_dir, f"{os.path.splitext(os.path.basename(key[0]))[0]}-{name}-{digest}.npy")
+        if not os.path.exists(cache_file):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Written under a temporary name so a parallel run never maps a half-written file
+            partial = f"{cache_file}.{os.getpid()}.npy"
+            np.save(partial, build())
+            os.replace(partial, cache_file)
+        return np.load(cache_file, mmap_mode='r')
+
+    def load(self, path, sample_rate):
+        """
+        The normalised IR at sample_rate.
+
+        Returns:
+            numpy.ndarray: Read-only (frames, channels) impulse response.
+        """
+        key = self._key(path, sample_rate)
+        ir = self._irs.get(key)
+        if ir is None:
+            ir = self._irs[key] = self._cached("ir", key, lambda: self._decode(path, sample_rate))
+            if not isinstance(ir, np.memmap):
+                ir.setflags(write=False)
+        return ir
+
+    def partitions(self, path, sample_rate, block_size, start=0, stop=None, dtype=np.float64):
+        """
+        FFT partitions of the IR, or of its [start:stop] segment, for a
+        PartitionedConvolver with block_size.
+
+        Args:
+            dtype: Precision of the transform; np.float32 gives complex64 spectra.
+
+        Returns:
+            numpy.ndarray: Read-only (partitions, block_size + 1, channels) spectra.
+        """
+        dtype = np.dtype(dtype)
+        key = self._key(path, sample_rate, block_size, start, stop)
+        if dtype != np.float64:
+            # float64 keys are unchanged, so existing disk caches stay valid
+            key += (dtype.name,)
+        spectra = self._partitions.get(key)
+        if spectra is None:
+            spectra = self._partitions[key] = self._cached(
+                "partitions", key, lambda: partition_ir(self.load(path, sample_rate)[start:stop], block_size, dtype))
+            if not isinstance(spectra, np.memmap):
+                spectra.setflags(write=False)
+        return spectra
+
+    def clear(self):
+        """Drops the in-memory IRs and partitions (the disk cache is kept)."""
+        self._irs.clear()
+        self._partitions.clear()
+
+    @staticmethod
+    def _decode(path, sample_rate):
+        import soundfile as sf
+
+        ir, file_rate = sf.read(path, dtype='float64', always_2d=True)
+        if file_rate != sample_rate:
+            ratio = Fraction(sample_rate, file_rate).limit_denominator(1000)
+            ir = resample_poly(ir, ratio.numerator, ratio.denominator, axis=0)
+        energy = np.sum(np.square(ir), axis=0).max()
+        if energy > 0:
+            ir *= IR_NORMALISED_ENERGY / np.sqrt(energy)
+        return ir
 
-def process(audio, sr):
-    # Create a Pedalboard with the Convolution reverb
-    pedalboard = Pedalboard([
-        Convolution(ir_file, 0.35),  # Adjust the mix parameter as needed
-    ])
 
-    # Apply the effects
-    effected = pedalboard(audio, sr)
-    return effected
+# Shared by every reverb in the process, so an IR is read from disk only once
+IR_REGISTRY = IRRegistry()
 
+
+class ConvReverb(object):
+    def __init__(self, sample_rate, ir_path=ir_file, mix=0.35, block_size=1024, registry=None, low_latency=False, max_block_size=8192,
+                 state_dtype=None):
+        """
+        Convolution reverb with IRs from a shared IRRegistry.
+
+        Args:
+            sample_rate (int): Sample rate of the audio; the IR is resampled to it.
+            ir_path (str): Impulse response file (anything soundfile can read).
+            mix (float): Wet level, with the dry signal at 1 - mix.
+            block_size (int): Partition length of the streaming convolver. Smaller
+                blocks lower the process_block() latency and cost more CPU.
+            registry (IRRegistry): Where IRs are loaded from; IR_REGISTRY by default.
+            low_latency (bool): Stream through a NonUniformConvolver: block_size
+                partitions at the head of the IR and partitions growing up to
+                max_block_size for the tail, computed on a worker thread. Long IRs
+                then stream with block_size latency at a fraction of the CPU cost.
+            max_block_size (int): Largest tail partition in low_latency mode.
+            state_dtype: Precision of the spectra, delay lines and overlaps; None
+                follows the audio, so float32 audio convolves in complex64.
+        """
+        self.sample_rate = sample_rate
+        self.ir_path = ir_path
+        self.mix = mix
+        self.block_size = block_size
+        self.registry = IR_REGISTRY if registry is None else registry
+        self.state_dtype = state_dtype
+        # A fixed state precision gets its spectra from the registry; otherwise each
+        # convolver converts the float64 ones once for the precision it runs at
+        spectra_dtype = np.float64 if state_dtype is None else state_dtype
+        if low_latency:
+            length = len(self.registry.load(ir_path, sample_rate))
+            self.convolver = NonUniformConvolver([
+                (start, size, self.registry.partitions(ir_path, sample_rate, size, start, stop, spectra_dtype))
+                for start, stop, size in nonuniform_layout(length, block_size, max_block_size)
+            ], state_dtype=state_dtype)
+        else:
+            self.convolver = PartitionedConvolver(
+                self.registry.partitions(ir_path, sample_rate, block_size, dtype=spectra_dtype), block_size, state_dtype)
+        self._offline = None
+        self._dry = None
+
+    @property
+    def latency(self):
+        """Delay of process_block() against the input, in samples."""
+        return self.convolver.latency
+
+    def reset(self):
+        """Clears the reverb tail so the next block starts from silence."""
+        self.convolver.reset()
+        self._dry = None
+
+    def close(self):
+        """Stops the worker thread of low_latency mode."""
+        if isinstance(self.convolver, NonUniformConvolver):
+            self.convolver.close()
+
+    def _mix(self, dry, wet, shape):
+        wet *= self.mix
+        wet += (1 - self.mix) * (dry if dry.ndim > 1 else dry[:, np.newaxis])
+        return wet.reshape(shape) if wet.shape[1] == 1 and len(shape) == 1 else wet
+
+    def process(self, audio):
+        """
+        Applies the reverb to a whole signal, without latency.
+
+        :param audio: NumPy array of audio samples, (frames,) or (frames, channels).
+        :return: The reverberated audio, in the dtype of audio (float32 or float64). A mono
+            input with a stereo IR comes out stereo.
+        """
+        audio = precision.as_samples(audio)
+        if self._offline is None:
+            block_size = max(self.block_size, OFFLINE_BLOCK_SIZE)
+            spectra_dtype = np.float64 if self.state_dtype is None else self.state_dtype
+            self._offline = PartitionedConvolver(
+                self.registry.partitions(self.ir_path, self.sample_rate, block_size, dtype=spectra_dtype), block_size,
+                self.state_dtype)
+        output = self._mix(audio, self._offline.convolve(audio), audio.shape)
+        return output.astype(audio.dtype, copy=False)
+
+    def process_block(self, block):
+        """
+        Applies the reverb to the next block of a stream. The dry signal is
+        delayed along with the wet one, so the output lags by latency samples.
+
+        :param block: NumPy array with the next audio frames, (frames,) or (frames, channels).
+        :return: The processed frames, in the dtype of block.
+        """
+        block = precision.as_samples(block)
+        wet = self.convolver.process_block(block)
+
+        # Dry delay line of latency frames, followed by the new block
+        frames = block if block.ndim > 1 else block[:, np.newaxis]
+        if self._dry is None or self._dry.shape[1] != frames.shape[1] or self._dry.dtype != block.dtype:
+            self._dry = np.zeros((self.latency, frames.shape[1]), dtype=block.dtype)
+        delayed = np.concatenate([self._dry, frames])
+        self._dry = delayed[len(frames):]
+        output = self._mix(delayed[:len(frames)], wet, block.shape)
+        return output.astype(block.dtype, copy=False)
+
+
+def process(audio, sr):
+    # IR partitions are cached in IR_REGISTRY, so only the first call reads the file
+    return ConvReverb(sr, ir_file, 0.35).process(audio)
@@ -0,0 +1,361 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from . import precision
+
+# Input spectra convolved per pass when a whole signal is processed, which bounds
+# the memory of process() regardless of the signal length
+CHUNK_BLOCKS = 64
+
+
+def nonuniform_layout(length, block_size, max_block_size=8192, growth=4):
+    """
+    Splits an IR of length samples into levels of growing partition size for a
+    NonUniformConvolver. Every level after the head starts at least two of its
+    own blocks into the IR, which leaves one block period to compute it in.
+
+    Args:
+        length (int): IR length in samples.
+        block_size (int): Partition size of the head, which sets the latency.
+        max_block_size (int): Largest partition size, used for the rest of the tail.
+        growth (int): Size ratio between neighbouring levels.
+
+    Returns:
+        list: (start, stop, block_size) of each level, in IR order.
+    """
+    levels = []
+    start = 0
+    size = block_size
+    while start < max(length, 1):
+        next_size = min(size * growth, max_block_size)
+        if next_size <= size:
+            stop = max(length, 1)
+        else:
+            stop = min(max(length, 1), max(start + size, 2 * next_size))
+        levels.append((start, stop, size))
+        start = stop
+        size = max(size, next_size)
+    return levels
+
+
+def partition_ir(ir, block_size, dtype=np.float64):
+    """
+    Splits an impulse response into block_size partitions and transforms each one.
+
+    Args:
+        ir (numpy.ndarray): Impulse response, (frames,) or (frames, channels).
+        block_size (int): Partition length in samples; the FFT size is twice that.
+        dtype: Precision of the transform, np.float32 (complex64 spectra) or np.float64.
+
+    Returns:
+        numpy.ndarray: (partitions, block_size + 1, channels) complex spectra.
+    """
+    ir = np.asarray(ir)
+    if ir.ndim == 1:
+        ir = ir[:, np.newaxis]
+    partitions = max(1, -(-len(ir) // block_size))
+    padded = np.zeros((partitions * block_size, ir.shape[1]), dtype=dtype)
+    padded[:len(ir)] = ir
+    return np.fft.rfft(padded.reshape(partitions, block_size, -1), 2 * block_size, axis=1)
+
+
+class PartitionedConvolver(object):
+    def __init__(self, spectra, block_size, state_dtype=None):
+        """
+        Uniformly partitioned overlap-add convolution with a frequency-domain delay line.
+
+        Args:
+            spectra (numpy.ndarray): Partitioned IR from partition_ir(), shared
+                read-only between convolvers.
+            block_size (int): The block_size the spectra were partitioned with.
+            state_dtype: Precision of the transforms, the delay line and the
+                overlap; None follows the audio (complex64 spectra for float32).
+        """
+        self.spectra = spectra
+        self.block_size = block_size
+        self.state_dtype = state_dtype
+        # Newest partition last, so one slice of the delay line lines up with it.
+        # Converted once per precision the convolver runs at
+        self._reversed_by_dtype = {}
+        self.reset()
+
+    @property
+    def latency(self):
+        """Delay of process_block() against the input, in samples."""
+        return self.block_size
+
+    def reset(self):
+        """Clears the delay line, overlap and block FIFOs so the next block starts from silence."""
+        self._history = None
+        self._overlap = None
+        self._pending = None
+        self._pending_count = 0
+        self._queue = None
+
+    def _output_channels(self, channels):
+        return max(channels, self.spectra.shape[2])
+
+    def _reversed(self, dtype):
+        """The IR spectra newest partition first, at the complex precision of dtype."""
+        reversed_spectra = self._reversed_by_dtype.get(dtype)
+        if reversed_spectra is None:
+            complex_dtype = np.result_type(dtype, np.complex64)
+            reversed_spectra = self._reversed_by_dtype[dtype] = self.spectra[::-1].astype(complex_dtype, copy=False)
+        return reversed_spectra
+
+    def _start(self, channels, dtype):
+        partitions = len(self.spectra)
+        output_channels = self._output_channels(channels)
+        complex_dtype = np.result_type(dtype, np.complex64)
+        self._history = np.zeros((partitions - 1, self.block_size + 1, channels), dtype=complex_dtype)
+        self._overlap = np.zeros((self.block_size, output_channels), dtype=dtype)
+
+    def _convolve_blocks(self, blocks):
+        """
+        Wet output of whole input blocks, (count, block_size, channels), continuing
+        the stream, at the state precision for the blocks' dtype.
+        """
+        count, block_size, channels = blocks.shape
+        partitions = len(self.spectra)
+        dtype = precision.state_dtype(blocks, self.state_dtype)
+        if self._history is None or self._history.shape[2] != channels or self._overlap.dtype != dtype:
+            self._start(channels, dtype)
+        reversed_spectra = self._reversed(dtype)
+
+        # Spectra of the previous partitions - 1 blocks followed by the new ones
+        spectra = np.empty((partitions - 1 + count, block_size + 1, channels), dtype=self._history.dtype)
+        spectra[:partitions - 1] = self._history
+        spectra[partitions - 1:] = np.fft.rfft(blocks.astype(dtype, copy=False), 2 * block_size, axis=1)
+
+        # Output block k sums input block k - p times IR partition p, for every p.
+        # The Python loop runs over whichever of the two is shorter
+        accumulated = np.zeros((count, block_size + 1, self._output_channels(channels)), dtype=self._history.dtype)
+        if count < partitions:
+            for block in range(count):
+                accumulated[block] = (spectra[block:block + partitions] * reversed_spectra).sum(axis=0)
+        else:
+            for offset in range(partitions):
+                accumulated += spectra[offset:offset + count] * reversed_spectra[offset]
+        self._history = spectra[count:].copy()
+
+        tails = np.fft.irfft(accumulated, 2 * block_size, axis=1)
+        wet = tails[:, :block_size]
+        wet[0] += self._overlap
+        wet[1:] += tails[:-1, block_size:]
+        self._overlap = tails[-1, block_size:].copy()
+        return wet.reshape(count * block_size, -1)
+
+    def convolve(self, audio):
+        """
+        Convolves a whole signal with the IR, without latency. The tail past the
+        end of the input is dropped, and the streaming state is left untouched.
+
+        Args:
+            audio (numpy.ndarray): Input audio, (frames,) or (frames, channels).
+
+        Returns:
+            numpy.ndarray: The wet signal, (frames, channels) with channels
+            broadcast between the input and the IR, at the state precision.
+        """
+        audio = precision.as_samples(audio)
+        frames = audio if audio.ndim > 1 else audio[:, np.newaxis]
+        length = len(frames)
+        blocks = -(-length // self.block_size)
+        padded = np.zeros((blocks * self.block_size, frames.shape[1]), dtype=audio.dtype)
+        padded[:length] = frames
+
+        stream_state = (self._history, self._overlap)
+        self._history = None
+        wet = np.empty((len(padded), self._output_channels(frames.shape[1])),
+                       dtype=precision.state_dtype(audio, self.state_dtype))
+        chunk = CHUNK_BLOCKS * self.block_size
+        for start in range(0, len(padded), chunk):
+            section = padded[start:start + chunk]
+            wet[start:start + len(section)] = self._convolve_blocks(
+                section.reshape(-1, self.block_size, frames.shape[1]))
+        self._history, self._overlap = stream_state
+        return wet[:length]
+
+    def process_block(self, block):
+        """
+        Convolves the next block of a stream of any length. Input is gathered
+        into whole partitions, so the wet signal lags by latency samples.
+
+        Args:
+            block (numpy.ndarray): The next input frames, (frames,) or (frames, channels).
+
+        Returns:
+            numpy.ndarray: As many wet frames as were passed in, (frames, channels),
+            at the state precision.
+        """
+        block = precision.as_samples(block)
+        frames = block if block.ndim > 1 else block[:, np.newaxis]
+        channels = frames.shape[1]
+        if self._pending is None or self._pending.shape[1] != channels or self._pending.dtype != block.dtype:
+            self.reset()
+            self._pending = np.zeros((self.block_size, channels), dtype=block.dtype)
+            # The queue always holds block_size - pending_count frames of finished output
+            self._queue = np.zeros((self.block_size, self._output_channels(channels)),
+                                   dtype=precision.state_dtype(block, self.state_dtype))
+
+        # Fill the partial block first, then convolve every whole block at once
+        fill = min(self.block_size - self._pending_count, len(frames))
+        self._pending[self._pending_count:self._pending_count + fill] = frames[:fill]
+        self._pending_count += fill
+        finished = [self._queue]
+        if self._pending_count == self.block_size:
+            whole = (len(frames) - fill) // self.block_size * self.block_size
+            blocks = np.concatenate([self._pending, frames[fill:fill + whole]])
+            finished.append(self._convolve_blocks(blocks.reshape(-1, self.block_size, channels)))
+            rest = frames[fill + whole:]
+            self._pending[:len(rest)] = rest
+            self._pending_count = len(rest)
+        queue = np.concatenate(finished) if len(finished) > 1 else self._queue
+        self._queue = queue[len(frames):]
+        return queue[:len(frames)]
+
+
+class NonUniformConvolver(object):
+    def __init__(self, levels, threaded=True, state_dtype=None):
+        """
+        Low-latency convolution with small partitions at the head of the IR and
+        large ones for the tail. Only the head adds latency; the tail levels
+        are computed on a worker thread while the head keeps streaming.
+
+        Args:
+            levels (list): (start, block_size, spectra) per level, from
+                nonuniform_layout() with each IR segment run through partition_ir().
+            threaded (bool): Compute the tail levels on a worker thread.
+            state_dtype: Precision of every level, as for PartitionedConvolver.
+        """
+        start, block_size, spectra = levels[0]
+        if start != 0:
+            raise ValueError("The first level has to start at the beginning of the IR")
+        self.head = PartitionedConvolver(spectra, block_size, state_dtype)
+        self.tail = [(start, PartitionedConvolver(spectra, block_size, state_dtype))
+                     for start, block_size, spectra in levels[1:]]
+        for start, convolver in self.tail:
+            if start < 2 * convolver.block_size:
+                raise ValueError(f"A level of {convolver.block_size}-sample blocks has to start at least "
+                                 f"{2 * convolver.block_size} samples into the IR, not {start}")
+        self.threaded = threaded
+        self._executor = None
+        self.reset()
+
+    @property
+    def latency(self):
+        """Delay of process_block() against the input, in samples."""
+        return self.head.latency
+
+    def reset(self):
+        """Waits for pending tail blocks, then clears every level so the next block starts from silence."""
+        for _, _, result in getattr(self, "_scheduled", []):
+            if hasattr(result, "result"):
+                result.result()
+        self.head.reset()
+        for _, convolver in self.tail:
+            convolver.reset()
+        self._position = 0  # Input frames consumed, which is also output frames returned
+        self._pending = [None] * len(self.tail)
+        self._pending_count = [0] * len(self.tail)
+        self._blocks_done = [0] * len(self.tail)
+        self._scheduled = []  # (output frame, length, wet block or Future)
+        self._tail_out = None
+        self._tail_head = 0
+
+    def close(self):
+        """Stops the worker thread."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _schedule(self, level, block):
+        start, convolver = self.tail[level]
+        # The wet block of input block k lands at k * block_size + start, plus the head latency
+        output_frame = self._blocks_done[level] * convolver.block_size + start + self.latency
+        self._blocks_done[level] += 1
+        blocks = block[np.newaxis]
+        if self.threaded:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="convolver-tail")
+            # One worker runs blocks in submission order, so each level's state stays sequential
+            result = self._executor.submit(convolver._convolve_blocks, blocks)
+        else:
+            result = convolver._convolve_blocks(blocks)
+        self._scheduled.append((output_frame, convolver.block_size, result))
+
+    def _reserve_tail(self, frames):
+        # The tail accumulator holds output from the current position onwards
+        if self._tail_head + frames > len(self._tail_out):
+            live = self._tail_out[self._tail_head:]
+            grown = np.zeros((max(2 * len(self._tail_out), frames), live.shape[1]), dtype=live.dtype)
+            grown[:len(live)] = live
+            self._tail_out = grown
+            self._tail_head = 0
+
+    def _accumulate(self, output_frame, wet):
+        offset = output_frame - self._position
+        self._reserve_tail(offset + len(wet))
+        index = self._tail_head + offset
+        self._tail_out[index:index + len(wet)] += wet
+
+    def process_block(self, block):
+        """
+        Convolves the next block of a stream of any length.
+
+        Args:
+            block (numpy.ndarray): The next input frames, (frames,) or (frames, channels).
+
+        Returns:
+            numpy.ndarray: As many wet frames as were passed in, (frames, channels),
+            lagging the input by latency samples, at the state precision.
+        """
+        block = precision.as_samples(block)
+        frames = block if block.ndim > 1 else block[:, np.newaxis]
+        channels = frames.shape[1]
+        wet = self.head.process_block(frames)
+        if self._tail_out is None or self._tail_out.shape[1] != wet.shape[1] or self._tail_out.dtype != wet.dtype:
+            self._tail_out = np.zeros((4 * max([convolver.block_size for _, convolver in self.tail] + [len(frames)]),
+                                       wet.shape[1]), dtype=wet.dtype)
+            self._tail_head = 0
+
+        # Gather each tail level's input into whole blocks and hand them to the worker
+        for level, (_, convolver) in enumerate(self.tail):
+            size = convolver.block_size
+            if (self._pending[level] is None or self._pending[level].shape[1] != channels
+                    or self._pending[level].dtype != frames.dtype):
+                self._pending[level] = np.zeros((size, channels), dtype=frames.dtype)
+                self._pending_count[level] = 0
+            pending = self._pending[level]
+            used = 0
+            while used < len(frames):
+                fill = min(size - self._pending_count[level], len(frames) - used)
+                pending[self._pending_count[level]:self._pending_count[level] + fill] = frames[used:used + fill]
+                self._pending_count[level] += fill
+                used += fill
+                if self._pending_count[level] == size:
+                    self._schedule(level, pending.copy())
+                    self._pending_count[level] = 0
+
+        # Collect every tail block that overlaps the frames returned now, waiting if it is late
+        end = self._position + len(frames)
+        waiting = []
+        for output_frame, length, result in self._scheduled:
+            if output_frame < end:
+                self._accumulate(output_frame, result.result() if hasattr(result, "result") else result)
+            else:
+                waiting.append((output_frame, length, result))
+        self._scheduled = waiting
+
+        self._reserve_tail(len(frames))
+        tail = self._tail_out[self._tail_head:self._tail_head + len(frames)]
+        wet += tail
+        tail.fill(0)
+        self._tail_head += len(frames)
+        self._position = end
+        if self._tail_head > len(self._tail_out) // 2:
+            # Shift the live part back to the front; the copy is amortised over many blocks
+            live = len(self._tail_out) - self._tail_head
+            self._tail_out[:live] = self._tail_out[self._tail_head:]
+            self._tail_out[live:] = 0
+            self._tail_head = 0
+        return wet
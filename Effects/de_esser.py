@@ -1,17 +1,38 @@
+from functools import lru_cache, partial
 import numpy as np
 from scipy.signal import butter, sosfilt
+from . import precision
+from .streaming import release, scratch_array
+
+# Frames per pass of process(), which bounds its temporary arrays
+CHUNK_FRAMES = 65536
+
+
+@lru_cache(maxsize=32)
+def _bandpass_sos(fs, lowcut, highcut, order):
+    """Butterworth bandpass design, cached per (sample_rate, low, high, order)."""
+    nyq = 0.5 * fs
+    low = lowcut / nyq
+    high = highcut / nyq
+    sos = butter(order, [low, high], btype='bandpass', analog=False, output='sos')
+    return sos
+
 
 class DeEsser:
-    def __init__(self, sample_rate, sibilance_freq_low=5000, sibilance_freq_high=12000, threshold=-30, reduction_db=6, range_db=10):
+    def __init__(self, sample_rate, sibilance_freq_low=5000, sibilance_freq_high=12000, threshold=-30, reduction_db=6, range_db=10, window_ms=5, lookahead_ms=1, state_dtype=None):
         """
         Initialize the De-Esser with added range parameter.
-        
+
         :param sample_rate: Sampling rate of the audio.
         :param sibilance_freq_low: Lower bound of sibilance frequencies (in Hz).
         :param sibilance_freq_high: Upper bound of sibilance frequencies (in Hz).
         :param threshold: Sibilance reduction threshold in dB.
         :param reduction_db: Maximum reduction amount in dB.
         :param range_db: Dynamic range of sibilance reduction in dB.
+        :param window_ms: Length of the short-term RMS window of the sidechain (in ms).
+        :param lookahead_ms: How far ahead of the current sample the sidechain looks (in ms).
+        :param state_dtype: Precision of the band filter and its state; None follows the audio.
+            The running energy sums are always kept in float64.
         """
         self.sample_rate = sample_rate
         self.sibilance_freq_low = sibilance_freq_low
@@ -19,54 +40,205 @@ class DeEsser:
         self.threshold = threshold
         self.reduction_db = reduction_db
         self.range_db = range_db  # The range of reduction in dB
+        self.window_ms = window_ms
+        self.lookahead_ms = lookahead_ms
+        self.state_dtype = state_dtype
+        self.reset()
+
+    @property
+    def latency(self):
+        """Delay of process_block() against the input, in samples."""
+        return self._window_lookahead()[1]
+
+    def reset(self):
+        """Clears the streaming filter, detector and look-ahead state used by process_block."""
+        self._stream_shape = None
+        self._stream_window = None
+        self._stream_capacity = 0
 
     def _butter_bandpass(self, lowcut, highcut, fs, order=4):
         """Create a bandpass filter to isolate sibilance frequencies."""
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        sos = butter(order, [low, high], btype='bandpass', analog=False, output='sos')
-        return sos
+        return _bandpass_sos(fs, lowcut, highcut, order)
+
+    def _window_lookahead(self):
+        window = max(1, int(self.window_ms * self.sample_rate / 1000))
+        lookahead = max(0, int(self.lookahead_ms * self.sample_rate / 1000))
+        return window, lookahead
+
+    def _sidechain_energy(self, sibilance, empty):
+        """
+        energy[k] is the sum of the first k squared samples of the sibilance band,
+        held at zero for window samples before the start and at the total for
+        lookahead samples past the end, so windows over it never need clipping.
+        """
+        window, lookahead = self._window_lookahead()
+        length = len(sibilance)
+        energy = empty((window + length + 1 + lookahead,) + sibilance.shape[1:])
+        energy[:window + 1] = 0
+        # Chunk by chunk, each chunk continuing the running sum of the one before
+        for start in range(0, length, CHUNK_FRAMES):
+            stop = min(start + CHUNK_FRAMES, length)
+            chunk = energy[window + 1 + start:window + 1 + stop]
+            np.square(sibilance[start:stop], out=chunk)
+            chunk[0] += energy[window + start]
+            np.cumsum(chunk, axis=0, out=chunk)
+            release(sibilance, start, stop)
+            release(energy, window + start, window + stop)
+        energy[window + 1 + length:] = energy[window + length]
+        return energy
+
+    def _sidechain_rms(self, energy, start, stop):
+        """Short-term RMS of the sibilance band over [start, stop), looking lookahead_ms ahead."""
+        window, lookahead = self._window_lookahead()
+        end = window + lookahead + 1
+        windowed = energy[end + start:end + stop] - energy[lookahead + 1 + start:lookahead + 1 + stop]
+        np.maximum(windowed, 0, out=windowed)  # Rounding in the running sum can dip below zero
+        windowed /= window
+        return np.sqrt(windowed, out=windowed)
+
+    def _gain_curve(self, rms):
+        """Turns the sidechain RMS into a linear gain for the sibilance band, in place."""
+        sibilance_db = rms
+        sibilance_db += 1e-10  # Avoid log(0)
+        np.log10(sibilance_db, out=sibilance_db)
+        sibilance_db *= 20
+
+        # Gain reduction grows linearly over range_db above the threshold, up to reduction_db
+        reduction = sibilance_db
+        reduction -= self.threshold
+        reduction /= self.range_db
+        np.clip(reduction, 0, 1, out=reduction)
+        reduction *= -self.reduction_db / 20
+        return np.power(10.0, reduction, out=reduction)
 
-    def process(self, audio):
+    def process(self, audio, scratch_dir=None):
         """
         Apply the de-esser effect to the audio with dynamic range control.
-        
-        :param audio: NumPy array of audio samples.
-        :return: De-essed audio.
+
+        :param audio: NumPy array of audio samples, (frames,) or (frames, channels).
+        :param scratch_dir: Optional directory for the whole-signal intermediates (the
+            sibilance band and its running energy). They then live in memory-mapped
+            scratch files instead of RAM, and so does the returned array.
+        :return: De-essed audio, in the dtype of audio (float32 or float64).
         """
-        # Extract sibilance frequencies using bandpass filter
-        sos = self._butter_bandpass(self.sibilance_freq_low, self.sibilance_freq_high, self.sample_rate)
-        sibilance = sosfilt(sos, audio)
-
-        # Compute the RMS energy of sibilance
-        rms_sibilance = np.sqrt(np.mean(sibilance**2))
-        sibilance_db = 20 * np.log10(rms_sibilance + 1e-10)  # Avoid log(0)
-
-        # Compute dynamic gain reduction (soft-knee compression with range parameter)
-        if sibilance_db > self.threshold:
-            # Calculate the dynamic reduction based on range
-            excess_db = sibilance_db - self.threshold
-            if excess_db < self.range_db:
-                # Linear reduction within the range
-                reduction_ratio = (excess_db / self.range_db) * (self.reduction_db / 20)
-            else:
-                # Full reduction when above the range
-                reduction_ratio = self.reduction_db / 20
+        audio = precision.as_samples(audio)
+        dtype = precision.state_dtype(audio, self.state_dtype)
+        if scratch_dir is None:
+            empty = np.empty
         else:
-            reduction_ratio = 0  # No reduction if under threshold
+            empty = partial(scratch_array, directory=scratch_dir)
 
-        # Apply gain reduction smoothly to only the sibilance frequencies
-        gain = 1.0 - reduction_ratio
+        # Extract sibilance frequencies using bandpass filter
+        sos = self._butter_bandpass(self.sibilance_freq_low, self.sibilance_freq_high, self.sample_rate)
+        sos = sos.astype(dtype)
+        sibilance = empty(audio.shape, dtype=dtype)
+        zi = np.zeros((len(sos), 2) + audio.shape[1:], dtype=dtype)
+        for start in range(0, len(audio), CHUNK_FRAMES):
+            stop = min(start + CHUNK_FRAMES, len(audio))
+            sibilance[start:stop], zi = sosfilt(sos, audio[start:stop], axis=0, zi=zi)
+            release(audio, start, stop)
+            release(sibilance, start, stop)
+        energy = self._sidechain_energy(sibilance, empty)
+        lookahead = self._window_lookahead()[1]
 
-        # Smoothly mix the processed sibilance back with the original audio
-        processed_sibilance = sibilance * gain
-        processed_audio = audio + processed_sibilance
+        # Chunk by chunk: short-term RMS energy of sibilance, one value per sample,
+        # then the band turned down by the gain curve: audio + sibilance * (gain - 1)
+        processed_audio = sibilance if dtype == audio.dtype else empty(audio.shape, dtype=audio.dtype)
+        for start in range(0, len(audio), CHUNK_FRAMES):
+            stop = min(start + CHUNK_FRAMES, len(audio))
+            gain = self._gain_curve(self._sidechain_rms(energy, start, stop))
+            gain -= 1
+            chunk = sibilance[start:stop]
+            chunk *= gain
+            chunk += audio[start:stop]
 
-        # Normalize to prevent clipping
-        processed_audio = np.clip(processed_audio, -1.0, 1.0)
+            # Normalize to prevent clipping
+            np.clip(chunk, -1.0, 1.0, out=chunk)
+            if processed_audio is not sibilance:
+                processed_audio[start:stop] = chunk
+                release(sibilance, start, stop)
+            release(audio, start, stop)
+            release(processed_audio, start, stop)
+            release(energy, lookahead + 1 + start, lookahead + 1 + stop)
 
         return processed_audio
 
+    def _reserve(self, block):
+        # State is (re)built when the channel layout or precision changes; working buffers only grow
+        frame_shape = block.shape[1:]
+        dtype = precision.state_dtype(block, self.state_dtype)
+        window, lookahead = self._window_lookahead()
+        if self._stream_shape != (frame_shape, block.dtype, dtype) or self._stream_window != (window, lookahead):
+            sos = self._butter_bandpass(self.sibilance_freq_low, self.sibilance_freq_high, self.sample_rate)
+            self._zi = np.zeros((len(sos), 2) + frame_shape, dtype=dtype)
+            self._stream_shape = (frame_shape, block.dtype, dtype)
+            self._stream_window = (window, lookahead)
+            self._stream_capacity = 0
+        if self._stream_capacity < len(block):
+            capacity = len(block)
+            # A bigger block mid-stream keeps the RMS window and the look-ahead lines
+            grown = self._stream_capacity > 0
+            # Squared band history (window samples) followed by the new block
+            squares = np.zeros((window + capacity,) + frame_shape)
+            if grown:
+                squares[:window] = self._squares[:window]
+            self._squares = squares
+            self._energy = np.zeros((window + capacity,) + frame_shape)
+            # Look-ahead delay lines for the dry signal and the band, followed by the new block
+            delayed_audio = np.zeros((lookahead + capacity,) + frame_shape, dtype=block.dtype)
+            delayed_band = np.zeros((lookahead + capacity,) + frame_shape, dtype=dtype)
+            if grown:
+                delayed_audio[:lookahead] = self._delayed_audio[:lookahead]
+                delayed_band[:lookahead] = self._delayed_band[:lookahead]
+            self._delayed_audio = delayed_audio
+            self._delayed_band = delayed_band
+            self._out = np.zeros((capacity,) + frame_shape, dtype=block.dtype)
+            self._stream_capacity = capacity
+
+    def process_block(self, block):
+        """
+        De-esses the next block of a stream. Filter and detector state carry over
+        between calls, and the output is delayed by the look-ahead (lookahead_ms)
+        so that it matches process() on the whole signal.
+
+        :param block: NumPy array with the next audio frames, (frames,) or (frames, channels).
+        :return: The processed frames, in the dtype of block. This is an internal buffer that the next call reuses.
+        """
+        block = precision.as_samples(block)
+        if len(block) == 0:
+            return block.copy()
+        self._reserve(block)
+        window, lookahead = self._stream_window
+        length = len(block)
+
+        sos = self._butter_bandpass(self.sibilance_freq_low, self.sibilance_freq_high, self.sample_rate)
+        band, self._zi = sosfilt(sos.astype(self._zi.dtype), block, axis=0, zi=self._zi)
+
+        # Windowed energy ending at each new sample, from a cumulative sum over history + block
+        squares = self._squares[:window + length]
+        energy = self._energy[:window + length]
+        np.square(band, out=squares[window:])
+        np.cumsum(squares, axis=0, out=energy)
+        rms = energy[window:]
+        rms -= energy[:length]
+        np.maximum(rms, 0, out=rms)
+        rms /= window
+        np.sqrt(rms, out=rms)
+        squares[:window] = squares[length:]
+        gain = self._gain_curve(rms)
+
+        # The gain computed at a sample applies to the one lookahead samples earlier
+        delayed_audio = self._delayed_audio[:lookahead + length]
+        delayed_band = self._delayed_band[:lookahead + length]
+        delayed_audio[lookahead:] = block
+        delayed_band[lookahead:] = band
 
+        out = self._out[:length]
+        gain -= 1
+        np.multiply(delayed_band[:length], gain, out=out)
+        out += delayed_audio[:length]
+        np.clip(out, -1.0, 1.0, out=out)
 
+        delayed_audio[:lookahead] = delayed_audio[length:]
+        delayed_band[:lookahead] = delayed_band[length:]
+        return out
@@ -1,16 +1,96 @@
-from pydub import AudioSegment
-import time
 import numpy as np
+from . import precision
 
 class GV_Delay(object):
-    def __init__(self, feedback=0.3, mix=0.5):
+    def __init__(self, feedback=0.3, mix=0.5, sample_rate=48000, state_dtype=None):
         self.vocal_delay_feedback = feedback
         self.vocal_delay_mix = mix
+        self.sample_rate = sample_rate
+        # Precision of the delay line (the feedback comb); None follows the audio
+        self.state_dtype = state_dtype
 
     def set_delay_seconds(self, tempo):
         delay_seconds=60000/(tempo / 2) #quarter note delay
         self.vecal_delay_seconds = delay_seconds
 
+        # Circular delay line for process_block, holding the last delay_samples
+        # outputs of the feedback comb
+        self.delay_samples = int(self.sample_rate * (self.vecal_delay_seconds / 1000.0))
+        self.delay_line = np.zeros(self.delay_samples)
+        self._out = np.zeros(0)
+        self._scratch = np.zeros(0)
+        self.reset()
+
+    def reset(self):
+        """Clears the delay line so the next block starts from silence."""
+        self.delay_line.fill(0)
+        self.write_pos = 0
+
+    def _reserve(self, block):
+        # Buffers only grow, so a steady block size allocates nothing after the first call
+        frame_shape = block.shape[1:]
+        state_dtype = precision.state_dtype(block, self.state_dtype)
+        if self.delay_line.shape[1:] != frame_shape:
+            self.delay_line = np.zeros((self.delay_samples,) + frame_shape, dtype=state_dtype)
+            self.write_pos = 0
+        elif self.delay_line.dtype != state_dtype:
+            self.delay_line = self.delay_line.astype(state_dtype)
+        if self._out.shape[1:] != frame_shape or len(self._out) < len(block) or self._out.dtype != block.dtype:
+            self._out = np.zeros(block.shape, dtype=block.dtype)
+        # Dry path scratch, in the same precision process() computes it in
+        dry_dtype = np.result_type(block.dtype, 1 - self.vocal_delay_mix)
+        if self._scratch.shape[1:] != frame_shape or len(self._scratch) < len(block) or self._scratch.dtype != dry_dtype:
+            self._scratch = np.zeros(block.shape, dtype=dry_dtype)
+
+    def process_block(self, block, out=None):
+        """
+        Applies the delay to one block of a stream, carrying the echo tail
+        over from the previous call.
+
+        Args:
+            block (numpy.ndarray): The next block of input audio.
+            out (numpy.ndarray): Optional array to write the result into. When
+                omitted an internal buffer is reused, so copy the result if it
+                has to outlive the next call.
+
+        Returns:
+            numpy.ndarray: The processed block, bit-exact with process() over
+            the whole stream.
+        """
+        block = precision.as_samples(block)
+        self._reserve(block)
+        length = len(block)
+        if out is None:
+            out = self._out[:length]
+        feedback = self.vocal_delay_feedback
+        mix = self.vocal_delay_mix
+        dry = self._scratch[:length]
+        np.multiply(block, 1 - mix, out=dry)
+
+        if self.delay_samples <= 0:
+            np.multiply(block, feedback, out=out, dtype=self.delay_line.dtype)
+            out += block
+            out *= mix
+            out += dry
+            return out
+
+        # Each chunk stops at the end of the delay line, so no sample in it
+        # depends on another sample of the same chunk
+        start = 0
+        while start < length:
+            stop = min(length, start + self.delay_samples - self.write_pos)
+            line = self.delay_line[self.write_pos:self.write_pos + stop - start]
+            line *= feedback
+            line += block[start:stop]
+
+            np.multiply(line, mix, out=out[start:stop])
+            out[start:stop] += dry[start:stop]
+
+            self.write_pos = (self.write_pos + stop - start) % self.delay_samples
+            start = stop
+
+        return out
+
 
     def process(self, audio, sample_rate):
         """
@@ -26,14 +106,28 @@ class GV_Delay(object):
             numpy.ndarray: The processed audio data with the delay effect.
         """
         delay_samples = int(sample_rate * (self.vecal_delay_seconds / 1000.0))
-        delayed_signal = np.zeros(len(audio))
+        feedback = self.vocal_delay_feedback
+        mix = self.vocal_delay_mix
+        length = len(audio)
+        audio = precision.as_samples(audio)
+        delayed_signal = np.array(audio, dtype=precision.state_dtype(audio, self.state_dtype))
+
+        if delay_samples <= 0:
+            delayed_signal += delayed_signal * feedback
+        stride = delay_samples if delay_samples > 0 else max(length, 1)
+
+        # Feedback comb, one delay_samples-long stride at a time: a stride only
+        # depends on the one before it, so each finished stride is fed forward
+        # into the next and then mixed in place while it is still in cache
+        for start in range(0, length, stride):
+            stop = min(start + stride, length)
+            if delay_samples > 0 and stop < length:
+                ahead = min(stop + delay_samples, length)
+                delayed_signal[stop:ahead] += delayed_signal[start:ahead - delay_samples] * feedback
 
-        for i in range(len(audio)):
-            delayed_signal[i] = audio[i]
-            if i >= delay_samples:
-                delayed_signal[i] += delayed_signal[i - delay_samples] * self.vocal_delay_feedback
-        # Mix
-        output = ((audio * (1 - self.vocal_delay_mix)) + (delayed_signal * self.vocal_delay_mix))
+            current = delayed_signal[start:stop]
+            current *= mix
+            current += audio[start:stop] * (1 - mix)
 
-        return output
+        return delayed_signal.astype(audio.dtype, copy=False)
 
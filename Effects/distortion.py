@@ -1,11 +1,21 @@
+import numpy as np
 
 class Distortion(object):
-    def __init__(self):
+    def __init__(self, oversampling=1):
         self.a = 0.2
+        Distortion.UpdateOversampling(self, oversampling)
 
     def UpdateParams(self, value):
         self.a = value
 
+    def UpdateOversampling(self, factor):
+        # No oversampler (and no scipy.signal import) at the base rate
+        if factor == 1:
+            self.oversampler = None
+        else:
+            from .oversampling import Oversampler
+            self.oversampler = Oversampler(factor)
+
     def TubeSaturation(x, a):
         y = 0
         threshold1 = 1.0 / 3.0
@@ -28,13 +38,52 @@ class Distortion(object):
 
         return y
 
-    def Process(self, inputBuffer, a):
-        Distortion.UpdateParams(self, a)
-        length = len(inputBuffer)
-        for i in range(length):
-            TubeSaturation = Distortion.TubeSaturation(inputBuffer[i], self.a)
-            inputBuffer[i] = TubeSaturation
+    @staticmethod
+    def TubeSaturationArray(x, a, out=None):
+        """Same piecewise curve as TubeSaturation, applied to a whole array at once.
 
+        Works on any shape and keeps the dtype of x; pass out=x to shape in place.
+        """
+        if out is None:
+            out = np.empty_like(x)
+        if (a == 0.0):
+            np.copyto(out, x)
+            return out
+
+        threshold1 = 1.0 / 3.0
+        threshold2 = 2.0 / 3.0
 
+        # The curve is odd, so shape |x| (held at 1.0 past threshold2) and put the sign back
+        magnitude = np.minimum(np.abs(x), threshold2)
+        knee = 2.0 - 3.0 * magnitude
+        knee *= knee
+        knee = (3.0 - knee) / 3.0
+        np.copysign(np.where(magnitude > threshold1, knee, 2.0 * magnitude), x, out=out)
+        return out
 
+    @property
+    def latency(self):
+        """Delay of ProcessBlock() against its input, in samples (0 at the base rate)."""
+        return 0 if self.oversampler is None else self.oversampler.latency
+
+    def Process(self, inputBuffer, a):
+        """Shapes a whole buffer in place; oversampled calls are independent, latency-free renders."""
+        Distortion.UpdateParams(self, a)
+        if self.oversampler is None:
+            Distortion.TubeSaturationArray(inputBuffer, self.a, out=inputBuffer)
+        else:
+            inputBuffer[...] = self.oversampler.process(inputBuffer, Distortion.TubeSaturationArray, self.a)
+
+    def ProcessBlock(self, inputBuffer, a):
+        """Shapes the next block of a stream in place. When oversampling, the resampling
+        filters carry over between calls and the output lags the input by latency samples."""
+        Distortion.UpdateParams(self, a)
+        if self.oversampler is None:
+            Distortion.TubeSaturationArray(inputBuffer, self.a, out=inputBuffer)
+        else:
+            inputBuffer[...] = self.oversampler.process_block(inputBuffer, Distortion.TubeSaturationArray, self.a)
 
+    def Reset(self):
+        """Clears the stream state ProcessBlock() carries between calls."""
+        if self.oversampler is not None:
+            self.oversampler.reset()
@@ -1,42 +1,236 @@
-import pedalboard as pd
 import numpy as np
-import librosa
+from . import precision
+
+# Each detuned tap sweeps through this much delay before its partner tap, half a
+# sweep behind, takes over
+DETUNE_WINDOW_MS = 20
+# Frames rendered per pass by process(), which bounds its temporary arrays
+CHUNK_FRAMES = 65536
+
+
+def spread_voices(count, delay_ms=(12, 35), detune_cents=8, width=1.0):
+    """
+    An even stereo spread of doubled voices for StereoDoubler.
+
+    Args:
+        count (int): Number of voices.
+        delay_ms (tuple): Shortest and longest delay in milliseconds.
+        detune_cents (float): Largest detune; voices alternate sharp and flat.
+        width (float): Pan of the outermost voices, 0 (centre) to 1 (hard left/right).
+
+    Returns:
+        list: (delay_ms, detune_cents, pan) per voice.
+    """
+    delays = np.linspace(delay_ms[0], delay_ms[1], count)
+    detunes = detune_cents * np.linspace(1, 0.5, count) * np.where(np.arange(count) % 2, -1, 1)
+    pans = np.linspace(-width, width, count) if count > 1 else np.zeros(1)
+    # Interleave the delays so neighbouring pans don't get neighbouring delays
+    delays = np.concatenate([delays[0::2], delays[1::2][::-1]])
+    return [(float(delay), float(detune), float(pan)) for delay, detune, pan in zip(delays, detunes, pans)]
+
 
 class Doubler(object):
-    def __init__(self, delay_ms=20, detune_cents=5, mix=0.5):
+    def __init__(self, delay_ms=20, detune_cents=5, mix=0.5, sample_rate=48000):
+        """
+        Doubles a voice with a delayed, slightly detuned copy of itself. The copy
+        is read from a delay line whose delay changes at a steady rate, which
+        shifts its pitch (the Doppler effect). Two interpolated taps half a sweep
+        apart crossfade, so the delay can jump back without a click.
+
+        Args:
+            delay_ms (float): Average delay of the copy in milliseconds.
+            detune_cents (float): Pitch offset of the copy in cents (negative is flat).
+            mix (float): Blend between the original (0) and the doubled (1) signal.
+            sample_rate (int): Sample rate of the audio.
+        """
         self.delay_ms = delay_ms
         self.detune_cents = detune_cents
         self.mix = mix
+        self.sample_rate = sample_rate
+        self.reset()
+
+    def reset(self):
+        """Clears the delay line and restarts the sweeps so the next block starts from silence."""
+        self._history = None
+        self._phase = None
+
+    def _voices(self):
+        """Delay (ms) and detune (cents) of every voice, as arrays."""
+        return np.array([self.delay_ms], dtype=float), np.array([self.detune_cents], dtype=float)
+
+    def _sweep(self):
+        delay_ms, detune_cents = self._voices()
+        delay = delay_ms * self.sample_rate / 1000
+        window = np.minimum(DETUNE_WINDOW_MS * self.sample_rate / 1000, 2 * delay)
+        # The delay changes by 1 - ratio samples per sample, covering the window once per sweep
+        ratio = 2 ** (detune_cents / 1200)
+        rate = np.divide(np.abs(1 - ratio), window, out=np.zeros_like(window), where=window > 0)
+        return delay, window, rate, ratio > 1
 
+    def _history_length(self):
+        delay, window, _, _ = self._sweep()
+        return int(np.ceil(np.max(delay + window / 2))) + 1
 
-    def process(audio, sample_rate, delay_ms=20, detune_cents=5, mix=0.3):
+    def _doubled(self, buffer, start, length, phase):
         """
-        Applies a doubler effect to an audio signal.
-        
-        Parameters:
-        - audio: np.array, input mono audio signal.
-        - sample_rate: int, sample rate of the audio.
-        - delay_ms: int, delay in milliseconds for doubling.
-        - detune_cents: float, pitch shift in cents.
-        - mix: float, blend between original (0) and doubled (1) signal.
-        
-        Returns:
-        - np.array, audio with doubler effect applied.
+        The detuned copies of the length frames from buffer[start] on, every
+        voice read through its two crossfading taps in one batch.
+
+        :return: (copies, (voices, frames) + channel shape, the sweep phases after the last frame).
         """
-        # Convert delay from ms to samples
-        delay_samples = int((delay_ms / 1000) * sample_rate)
+        delay, window, rate, sharp = self._sweep()
+        voices = len(delay)
+        frames = np.arange(length)
+
+        # (voices, 2 taps, frames) matrices of sweep phase and read position
+        phases = phase[:, np.newaxis] + rate[:, np.newaxis] * frames
+        phases = np.stack([phases, phases + 0.5], axis=1)
+        phases %= 1.0
+
+        # Rising pitch needs a shrinking delay, falling pitch a growing one
+        sweep = np.where(sharp[:, np.newaxis, np.newaxis], 1 - phases, phases)
+        positions = (start - delay + window / 2)[:, np.newaxis, np.newaxis] + frames - window[:, np.newaxis, np.newaxis] * sweep
+        index = np.floor(positions).astype(int)
+        fraction = positions - index
+
+        # Each tap fades in and out over its sweep, and the two sum to constant power
+        gains = np.sin(np.pi * phases)
+        upper = gains * fraction
+        lower = gains - upper
+        if buffer.ndim > 1:
+            lower = lower[..., np.newaxis]
+            upper = upper[..., np.newaxis]
+        copies = np.take(buffer, index, axis=0)
+        copies *= lower
+        copies += np.take(buffer, index + 1, axis=0) * upper
+        copies = copies.sum(axis=1)
+        return copies.reshape((voices, length) + buffer.shape[1:]), (phase + rate * length) % 1.0
+
+    def _source(self, audio):
+        """The signal the voices are read from."""
+        return audio
 
-        # Create a delayed version of the signal (zero-padding at the start)
-        delayed_audio = np.pad(audio, (delay_samples, 0), mode='constant')[:len(audio)]
+    def _mix_voices(self, copies, out):
+        out[:] = copies[0]
 
-        # Apply slight pitch shift
-        detune_factor = 2 ** (detune_cents / 1200)  # Convert cents to pitch factor
-        shifted_audio = librosa.effects.pitch_shift(delayed_audio, sr=sample_rate, n_steps=detune_factor)
+    def _output_shape(self, audio):
+        return audio.shape
 
-        # Mix the original and processed signal
-        output = (1 - mix) * audio + mix * shifted_audio
+    def _mix(self, audio, copy):
+        output = copy
+        output *= self.mix
+        output += (1 - self.mix) * (audio if audio.ndim == output.ndim else audio[:, np.newaxis])
 
         # Normalize to prevent clipping
-        output = np.clip(output, -1.0, 1.0)
+        return np.clip(output, -1.0, 1.0, out=output)
+
+    def process(self, audio):
+        """
+        Applies the doubler to a whole signal.
+
+        Args:
+            audio (numpy.ndarray): Input audio, (frames,) or (frames, channels).
+
+        Returns:
+            numpy.ndarray: Audio with the doubler applied, float32 for float32 audio and float64 otherwise.
+        """
+        audio = precision.as_samples(audio)
+        source = self._source(audio)
+        history = self._history_length()
+        # Silence before the start, plus one frame for the interpolation at zero delay
+        buffer = np.zeros((history + len(source) + 1,) + source.shape[1:], dtype=audio.dtype)
+        buffer[history:history + len(source)] = source
+
+        # Voice matrices are (voices, chunk), so the chunk shrinks as voices are added
+        phase = np.zeros(len(self._voices()[0]))
+        chunk = max(1024, CHUNK_FRAMES // len(phase))
+        doubled = np.empty(self._output_shape(audio), dtype=audio.dtype)
+        for start in range(0, len(audio), chunk):
+            stop = min(start + chunk, len(audio))
+            copies, phase = self._doubled(buffer, history + start, stop - start, phase)
+            self._mix_voices(copies, doubled[start:stop])
+        return self._mix(audio, doubled)
+
+    def process_block(self, block):
+        """
+        Applies the doubler to the next block of a stream, without latency.
+        The delay line and the sweeps carry over between calls.
+
+        Args:
+            block (numpy.ndarray): The next input frames, (frames,) or (frames, channels).
+
+        Returns:
+            numpy.ndarray: The processed frames, in the dtype of block.
+        """
+        block = precision.as_samples(block)
+        source = self._source(block)
+        history = self._history_length()
+        if (self._history is None or self._history.shape != (history,) + source.shape[1:]
+                or self._history.dtype != block.dtype):
+            self._history = np.zeros((history,) + source.shape[1:], dtype=block.dtype)
+            self._phase = np.zeros(len(self._voices()[0]))
+
+        buffer = np.concatenate([self._history, source, np.zeros((1,) + source.shape[1:], dtype=block.dtype)])
+        copies, self._phase = self._doubled(buffer, history, len(block), self._phase)
+        self._history = buffer[-history - 1:-1]
+        doubled = np.empty(self._output_shape(block), dtype=block.dtype)
+        self._mix_voices(copies, doubled)
+        return self._mix(block, doubled)
+
+
+class StereoDoubler(Doubler):
+    def __init__(self, voices=4, mix=0.5, sample_rate=48000):
+        """
+        Several doubled voices, each with its own delay, detune and pan, rendered
+        in one batch from a shared delay line and mixed to stereo. Takes mono or
+        stereo input.
+
+        Args:
+            voices: A voice count for an even spread_voices() layout, or a list of
+                (delay_ms, detune_cents, pan) tuples with pan from -1 (left) to 1 (right).
+            mix (float): Blend between the original (0) and the doubled voices (1).
+            sample_rate (int): Sample rate of the audio.
+        """
+        self.voices = spread_voices(voices) if np.isscalar(voices) else list(voices)
+        super().__init__(mix=mix, sample_rate=sample_rate)
+
+    def _voices(self):
+        delay_ms, detune_cents, _ = np.array(self.voices, dtype=float).T
+        return delay_ms, detune_cents
+
+    def pan_gains(self):
+        """(2, voices) constant-power left/right gains, scaled so the voices sum to about unity."""
+        pan = np.array([voice[2] for voice in self.voices], dtype=float)
+        angle = (np.clip(pan, -1, 1) + 1) * np.pi / 4
+        return np.stack([np.cos(angle), np.sin(angle)]) * np.sqrt(2 / len(pan))
+
+    def _source(self, audio):
+        # Stereo input is doubled from its mid signal; the dry signal is mixed in as it is,
+        # so there is no layout to fold more channels into
+        if audio.ndim > 1 and audio.shape[1] > 2:
+            raise ValueError(f"StereoDoubler takes mono or stereo audio, got {audio.shape[1]} channels")
+        return audio if audio.ndim == 1 else audio.mean(axis=1)
+
+    def _output_shape(self, audio):
+        return (len(audio), 2)
+
+    def _mix_voices(self, copies, out):
+        # One matrix product pans and sums every voice into the stereo output
+        np.matmul(copies.T, self.pan_gains().T, out=out)
+
+
+def process(audio, sample_rate, delay_ms=20, detune_cents=5, mix=0.3):
+    """
+    Applies a doubler effect to an audio signal.
+
+    Parameters:
+    - audio: np.array, input audio signal, (frames,) or (frames, channels).
+    - sample_rate: int, sample rate of the audio.
+    - delay_ms: int, delay in milliseconds for doubling.
+    - detune_cents: float, pitch shift in cents.
+    - mix: float, blend between original (0) and doubled (1) signal.
 
-        return output
+    Returns:
+    - np.array, audio with doubler effect applied.
+    """
+    return Doubler(delay_ms, detune_cents, mix, sample_rate).process(audio)
@@ -1,6 +1,6 @@
-from pedalboard import Pedalboard, LowShelfFilter, PeakFilter, HighpassFilter
 import numpy as np
-from scipy.signal import lfilter
+from scipy.signal import sosfilt
+from . import biquad, precision, sidechain
 
 def peaking_eq(audio, sample_rate, center_freq, q_factor, gain_db):
     """
@@ -16,53 +16,199 @@ def peaking_eq(audio, sample_rate, center_freq, q_factor, gain_db):
     Returns:
         numpy.ndarray: Filtered audio signal.
     """
-    A = 10**(gain_db / 40)  # Amplitude from dB gain
-    omega = 2 * np.pi * center_freq / sample_rate
-    alpha = np.sin(omega) / (2 * q_factor)
-
-    # Biquad peaking EQ coefficients
-    b0 = 1 + alpha * A
-    b1 = -2 * np.cos(omega)
-    b2 = 1 - alpha * A
-    a0 = 1 + alpha / A
-    a1 = -2 * np.cos(omega)
-    a2 = 1 - alpha / A
-
-    # Normalize coefficients
-    b = [b0 / a0, b1 / a0, b2 / a0]
-    a = [1, a1 / a0, a2 / a0]
-
     # Apply filter
-    filtered_audio = lfilter(b, a, audio)
-
+    filtered_audio = sosfilt(biquad.peaking(sample_rate, center_freq, q_factor, gain_db), audio)
     return filtered_audio
 
-def create_dyn_eq(self, audio, low_gain, peak_cutoff_1, peak_resonance_1, peak_gain_1, peak_cutoff_2, peak_resonance_2, peak_gain_2, low_freq=400):
-    """
-    Creates a 3-band EQ pedalboard.
 
-    Args:
-        low_gain (float): Gain for the low shelf filter in dB.
-        mid_gain (float): Gain for the peak filter in dB.
-        high_gain (float): Gain for the high shelf filter in dB.
-        low_freq (float): Cutoff frequency for the low shelf filter in Hz.
-        high_freq (float): Cutoff frequency for the high shelf filter in Hz.
+# The filter a band listens to, by band type
+SIDECHAIN_KINDS = {"peaking": "band_pass", "low_shelf": "low_pass", "high_shelf": "high_pass"}
 
-    Returns:
-        Pedalboard: A Pedalboard object containing the 3-band EQ.
-    """
-    peak_one = peaking_eq(audio, self.sample_rate, peak_cutoff_1, peak_resonance_1, peak_gain_1)
-    peak_two = peaking_eq(peak_one, self.sample_rate, peak_cutoff_1, peak_resonance_1, peak_gain_1)
 
+class DynamicBand(object):
+    def __init__(self, kind, freq, q=biquad.BUTTERWORTH_Q, gain_db=0.0, threshold_db=0.0, ratio=1.0, attack_ms=5, release_ms=80, range_db=12):
+        """
+        One band of a DynamicEQ. Above threshold_db the band's own level pulls
+        its gain down like a compressor with ratio, by at most range_db.
 
+        Args:
+            kind (str): "peaking", "low_shelf" or "high_shelf"; "high_pass" and
+                "low_pass" bands are static filters (q=None gives first order).
+            freq (float): Centre or corner frequency in Hz.
+            q (float): Quality factor of the filter and of its sidechain band-pass.
+            gain_db (float): Static gain of the band in dB.
+            threshold_db (float): Band level where the gain reduction starts (dB).
+            ratio (float): Compression ratio above the threshold; 1 keeps the band static.
+            attack_ms (float): Time for the reduction to move in, in milliseconds.
+            release_ms (float): Time for it to recover, in milliseconds.
+            range_db (float): Largest dynamic gain reduction in dB.
+        """
+        if kind not in SIDECHAIN_KINDS and kind not in ("high_pass", "low_pass"):
+            raise ValueError(f"Unknown band type {kind!r}")
+        self.kind = kind
+        self.freq = freq
+        self.q = q
+        self.gain_db = gain_db
+        self.threshold_db = threshold_db
+        self.ratio = ratio
+        self.attack_ms = attack_ms
+        self.release_ms = release_ms
+        self.range_db = range_db
 
-    board = Pedalboard([
-        HighpassFilter(cutoff_frequency_hz=low_freq)
-    ])
-    return board(peak_two, self.sample_rate)
+    @property
+    def dynamic(self):
+        return self.kind in SIDECHAIN_KINDS and self.ratio != 1 and self.range_db > 0
 
-def process(self, audio):
-    # To process audio with the EQ:
-    output = create_dyn_eq(self, audio, -18, 550, 2.459, -0.5, 1500, 1, -1.4, low_freq=100)
+    def section(self, sample_rate, gain_db=None):
+        """The band's filter as one second-order section, at gain_db or its static gain."""
+        gain_db = self.gain_db if gain_db is None else gain_db
+        if self.kind in ("high_pass", "low_pass"):
+            return biquad.design(self.kind, sample_rate, self.freq, self.q)
+        return biquad.design(self.kind, sample_rate, self.freq, self.q, gain_db)
+
+    def sidechain(self, sample_rate):
+        kind = SIDECHAIN_KINDS[self.kind]
+        return biquad.design(kind, sample_rate, self.freq, self.q if kind == "band_pass" else biquad.BUTTERWORTH_Q)
+
+
+class DynamicEQ(object):
+    def __init__(self, sample_rate, bands, block_size=32, lookahead_ms=0, state_dtype=None):
+        """
+        EQ with any number of static and dynamic bands, all applied as one
+        second-order-sections cascade whose dynamic sections are redesigned
+        every block_size samples.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            bands (list): DynamicBand instances, applied in order.
+            block_size (int): Samples per sidechain measurement and coefficient update.
+            lookahead_ms (float): How far ahead of the audio the sidechains listen.
+                process_block() delays its output by this much.
+            state_dtype: Precision of the cascade and its state; None follows the audio.
+        """
+        self.sample_rate = sample_rate
+        self.bands = list(bands)
+        self.block_size = block_size
+        self.lookahead_ms = lookahead_ms
+        self.state_dtype = state_dtype
+        self.gain_reduction_db = np.zeros(len(self.bands))
+        self.reset()
+
+    @property
+    def latency(self):
+        """Delay of process_block() against the input, in samples."""
+        return int(round(self.lookahead_ms * self.sample_rate / 1000))
+
+    def reset(self):
+        """Clears the filter, sidechain, ballistics and look-ahead state used by process_block."""
+        self._state = None
+        self._delay = np.zeros(0)
 
-    return output
\ No newline at end of file
+    def _start(self, audio):
+        # Cascade state, one sidechain state per band, gain reduction per band, level meter
+        dtype = precision.state_dtype(audio, self.state_dtype)
+        return (np.zeros((len(self.bands), 2) + audio.shape[1:], dtype=dtype),
+                [np.zeros((1, 2)) for _ in self.bands],
+                np.zeros(len(self.bands)),
+                sidechain.BlockLevel(self.block_size))
+
+    def _band_reduction(self, band, level_db, reduction):
+        """
+        Gain reduction (dB) of the block in progress, held from the last complete
+        one, followed by the smoothed reduction after each newly completed block.
+        """
+        targets = np.clip((level_db - band.threshold_db) * (1 - 1 / band.ratio), 0, band.range_db)
+        attack_coeff = np.exp(-self.block_size / (band.attack_ms / 1000 * self.sample_rate))
+        release_coeff = np.exp(-self.block_size / (band.release_ms / 1000 * self.sample_rate))
+        reductions = np.concatenate([[reduction], targets])
+        sidechain.smooth(reductions[1:], attack_coeff, release_coeff, reduction)
+        return reductions
+
+    def _run(self, audio, sidechain_input, state):
+        """Filters audio with coefficients driven by sidechain_input (same length), continuing state."""
+        zi, sidechain_zi, reductions, level = state
+        # The sections of each block follow the level of the block before it, so a
+        # block split across calls gets the same coefficients as in one call
+        offset = level.phase
+        blocks = level.blocks(len(audio))
+        detector = sidechain_input if sidechain_input.ndim == 1 else sidechain_input.mean(axis=1)
+        dynamic = [index for index, band in enumerate(self.bands) if band.dynamic]
+        band_signals = np.empty((len(audio), len(dynamic)))
+        for column, index in enumerate(dynamic):
+            band_signals[:, column], sidechain_zi[index] = sosfilt(
+                self.bands[index].sidechain(self.sample_rate), detector, zi=sidechain_zi[index])
+        level_db = level.process(band_signals)
+
+        sos_blocks = np.empty((blocks, len(self.bands), 6))
+        for index, band in enumerate(self.bands):
+            if not band.dynamic:
+                sos_blocks[:, index] = band.section(self.sample_rate)
+                continue
+            reduction_db = self._band_reduction(band, level_db[:, dynamic.index(index)], reductions[index])
+            reductions[index] = reduction_db[-1]
+            sos_blocks[:, index] = biquad.gain_sweep(band.kind, self.sample_rate, band.freq, band.q,
+                                                     band.gain_db - reduction_db[:blocks])
+        self.gain_reduction_db = reductions.copy()
+        return biquad.sosfilt_blocks(sos_blocks, audio, self.block_size, zi, offset)
+
+    def process(self, audio):
+        """
+        Applies the EQ to a whole signal. The sidechains look ahead by
+        lookahead_ms without delaying the output. Streaming state is left untouched.
+
+        :param audio: NumPy array of audio samples, (frames,) or (frames, channels).
+        :return: The equalised audio, in the dtype of audio (float32 or float64).
+        """
+        audio = precision.as_samples(audio)
+        if len(audio) == 0:
+            return audio.copy()
+        # The same delayed run as process_block(), flushed by lookahead samples of
+        # silence and then trimmed, so the output lines up with the input
+        silence = np.zeros((self.latency,) + audio.shape[1:], dtype=audio.dtype)
+        delayed = np.concatenate([silence, audio])
+        output = self._run(delayed, np.concatenate([audio, silence]), self._start(audio))
+        return output[self.latency:]
+
+    def process_block(self, block):
+        """
+        Applies the EQ to the next block of a stream. The audio runs through a
+        look-ahead delay line, so the output lags the input by latency samples.
+
+        :param block: NumPy array with the next audio frames, (frames,) or (frames, channels).
+        :return: The processed frames, in the dtype of block.
+        """
+        block = precision.as_samples(block)
+        if len(block) == 0:
+            return block.copy()
+        frame_shape = block.shape[1:]
+        lookahead = self.latency
+        if (self._state is None or self._state[0].shape[2:] != frame_shape
+                or self._state[0].dtype != precision.state_dtype(block, self.state_dtype)
+                or self._delay.dtype != block.dtype):
+            self._state = self._start(block)
+            self._delay = np.zeros((lookahead,) + frame_shape, dtype=block.dtype)
+
+        # Look-ahead delay line followed by the new block; the buffer only grows
+        if len(self._delay) < lookahead + len(block) or self._delay.shape[1:] != frame_shape:
+            grown = np.zeros((lookahead + len(block),) + frame_shape, dtype=block.dtype)
+            grown[:lookahead] = self._delay[:lookahead]
+            self._delay = grown
+        delayed = self._delay[:lookahead + len(block)]
+        delayed[lookahead:] = block
+        output = self._run(delayed[:len(block)], block, self._state)
+        delayed[:lookahead] = delayed[len(block):]
+        return output
+
+
+def vocal_bands():
+    """The vocal preset: a low cut, and two mid peaks that duck when their band gets loud."""
+    return [
+        DynamicBand("high_pass", 100, q=None),
+        DynamicBand("peaking", 550, q=2.459, gain_db=-0.5, threshold_db=-30, ratio=2),
+        DynamicBand("peaking", 1500, q=1, gain_db=-1.4, threshold_db=-30, ratio=2),
+    ]
+
+
+def process(audio, sample_rate):
+    # To process audio with the EQ:
+    return DynamicEQ(sample_rate, vocal_bands()).process(audio)
@@ -1,4 +1,5 @@
-from pedalboard import Pedalboard, Gain
+import numpy as np
+from . import precision
 
 def process(audio, sample_rate, gain_db):
     """Applies gain to the audio signal.
@@ -6,15 +7,12 @@ def process(audio, sample_rate, gain_db):
     Args:
         audio (np.ndarray): Input audio data.
         sample_rate (int): Sample rate of the audio.
+        gain_db (float): Gain in dB.
 
     Returns:
-        np.ndarray: Processed audio with gain applied.
+        np.ndarray: Processed audio with gain applied, in the dtype of audio (float32 or float64).
     """
-    # Define the pedalboard with effects
-    board = Pedalboard([
-        Gain(gain_db) # Apply gain of 3 dB
-    ])
+    audio = precision.as_samples(audio)
 
-    # Process audio through the pedalboard
-    processed_audio = board(audio, sample_rate)
-    return processed_audio
\ No newline at end of file
+    # A scalar multiply in the audio's own precision; the same gain as Pedalboard's Gain
+    return np.multiply(audio, audio.dtype.type(10 ** (gain_db / 20)))
@@ -1,13 +1,23 @@
-import pedalboard as pb
+from scipy.signal import sosfilt
+from . import biquad, precision
 
 class HiPass(object):
-    def __init__(self):
+    def __init__(self, state_dtype=None):
         self.cutoff = 125
+        # Precision of the filter arithmetic; None filters in the precision of the audio
+        self.state_dtype = state_dtype
 
     def update_params(self, freq):
         self.cutoff = freq
 
     def process(self, buffer, samplerate):
-        highpass_filter = pb.HighpassFilter(125)  # Set the desired cutoff frequency
-        output = highpass_filter(buffer, samplerate, len(buffer))
-        return output
+        """
+        First-order (6 dB/octave) high-pass at the configured cutoff. buffer is
+        (frames,), (frames, channels) or Pedalboard's (channels, frames), and comes
+        back in the same layout; the longer axis is taken as time.
+        """
+        buffer = precision.as_samples(buffer)
+        highpass_filter = biquad.high_pass(samplerate, self.cutoff, q=None)
+        output = sosfilt(highpass_filter.astype(precision.state_dtype(buffer, self.state_dtype)), buffer,
+                         axis=biquad.frame_axis(buffer))
+        return output.astype(buffer.dtype, copy=False)
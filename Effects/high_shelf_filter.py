@@ -1,21 +1,25 @@
-from pedalboard import Pedalboard, HighShelfFilter, Gain
+from scipy.signal import sosfilt
+from . import biquad, precision
 
-def process(input_audio, sample_rate, cutoff_freq=3480, gain_db=3):
+def process(input_audio, sample_rate, cutoff_freq=3480, gain_db=3, state_dtype=None):
     """
     Apply a high-shelf filter with specified cutoff frequency and gain.
     
-    :param input_audio: The input audio signal (numpy array).
+    :param input_audio: The input audio signal (numpy array): (frames,), (frames, channels) or Pedalboard's
+        (channels, frames). The longer axis is taken as time, and the output keeps the layout.
     :param sample_rate: The sample rate of the audio signal.
     :param cutoff_freq: The cutoff frequency for the high-shelf filter in Hz.
     :param gain_db: The gain to apply to the frequencies above the cutoff (in dB).
-    :return: The filtered audio signal.
+    :param state_dtype: Precision of the filter arithmetic; None filters in the precision of the audio.
+    :return: The filtered audio signal, in the dtype of input_audio (float32 or float64).
     """
-    # Create a Pedalboard with the HighShelfFilter
-    board = Pedalboard([
-        HighShelfFilter(cutoff_frequency_hz=cutoff_freq, gain_db=gain_db),
-    ])
+    input_audio = precision.as_samples(input_audio)
+
+    # Design the high-shelf filter (cached per setting)
+    sos = biquad.high_shelf(sample_rate, cutoff_freq, gain_db)
     
-    # Apply the high-shelf filter to the audio signal
-    processed_audio = board(input_audio, sample_rate)
+    # Apply the high-shelf filter to the audio signal along its time axis
+    processed_audio = sosfilt(sos.astype(precision.state_dtype(input_audio, state_dtype)), input_audio,
+                              axis=biquad.frame_axis(input_audio))
     
-    return processed_audio
\ No newline at end of file
+    return processed_audio.astype(input_audio.dtype, copy=False)
\ No newline at end of file
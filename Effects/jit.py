@@ -0,0 +1,51 @@
+import numpy as np
+
+_NOT_COMPILED = object()
+
+
+class LazyKernel(object):
+    def __init__(self, func, outputs=()):
+        """
+        Wraps a plain-Python kernel that Numba compiles on first use, so importing
+        an effect never pays for importing Numba. Call it like func itself.
+
+        Args:
+            func (callable): The kernel, written in the subset of Python Numba accepts.
+            outputs (tuple): Positions of the 1-D array arguments the kernel writes to.
+        """
+        self.func = func
+        self.outputs = outputs
+        self._compiled = _NOT_COMPILED
+
+    def compiled(self):
+        """The Numba-compiled kernel, or None when Numba is not installed."""
+        if self._compiled is _NOT_COMPILED:
+            try:
+                from numba import njit
+            except ImportError:  # Numba is optional, __call__ falls back to self.func
+                self._compiled = None
+            else:
+                self._compiled = njit(cache=True, nogil=True)(self.func)
+        return self._compiled
+
+    def __call__(self, *args):
+        """Runs the compiled kernel, or without Numba the Python one on lists."""
+        kernel = self.compiled()
+        if kernel is not None:
+            return kernel(*args)
+
+        # Python floats in a list are much faster to loop over than array elements.
+        # An array passed twice (read and written in place) becomes one list
+        lists = []
+        converted = list(args)
+        for position, arg in enumerate(args):
+            if isinstance(arg, np.ndarray) and arg.ndim == 1:
+                match = next((values for array, values in lists if array is arg), None)
+                if match is None:
+                    match = arg.tolist()
+                    lists.append((arg, match))
+                converted[position] = match
+        result = self.func(*converted)
+        for position in self.outputs:
+            args[position][:] = converted[position]
+        return result
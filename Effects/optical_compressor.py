@@ -1,7 +1,102 @@
+from functools import lru_cache
 import numpy as np
+from .jit import LazyKernel
+
+
+def _envelope_gain(levels, gains, attack_coeff, release_coeff, threshold_linear, ratio, envelope, gain):
+    # levels holds |sample|; gains receives the smoothed gain for each sample
+    for i in range(len(levels)):
+        # Envelope follower (simple peak detection)
+        envelope = max(levels[i], envelope * attack_coeff)
+
+        # Compression (apply soft knee curve)
+        if envelope > threshold_linear:
+            # Simple ratio compression, clipped to [0, 1]
+            compressed_gain = 1 - (1 - ratio) * (envelope - threshold_linear) / envelope
+            compressed_gain = min(max(compressed_gain, 0.0), 1.0)
+        else:
+            compressed_gain = 1.0
+
+        # Smooth the gain using release coefficient
+        if compressed_gain < gain:
+            gain = compressed_gain + (gain - compressed_gain) * release_coeff
+        else:
+            gain = compressed_gain
+        gains[i] = gain
+    return envelope, gain
+
+
+# Opto release model: a fast first stage while the gain reduction is deeper than
+# OPTO_KNEE_DB, then a slow tail. Both stages lengthen with how long the cell has
+# been held in gain reduction (up to OPTO_MAX_DWELL seconds)
+OPTO_FAST_RELEASE = (0.06, 0.12)
+OPTO_SLOW_RELEASE = (0.5, 5.0)
+OPTO_KNEE_DB = 3.0
+OPTO_MAX_DWELL = 10.0
+OPTO_DWELL_GAIN = 10 ** (-1 / 20)  # Counts as compressed below -1 dB of gain
+OPTO_DWELL_RECOVERY = 2.0  # Time constant of the cell forgetting its history
+OPTO_DEPTH_BINS = 256
+OPTO_DWELL_BINS = 64
+
+
+def _opto_envelope_gain(levels, gains, attack_coeff, release_table, dwell_index_scale, dwell_limit, dwell_decay, threshold_linear, ratio, envelope, gain, dwell):
+    # Same detector as _envelope_gain, a hard-knee ratio curve, and a program-dependent
+    # release: the coefficient is looked up by current gain (depth) and time spent compressed (dwell)
+    depth_bins, dwell_bins = release_table.shape
+    slope = 1 - 1 / ratio
+    for i in range(len(levels)):
+        envelope = max(levels[i], envelope * attack_coeff)
+
+        # Above the threshold the output level rises 1/ratio dB per dB of input
+        if envelope > threshold_linear:
+            compressed_gain = (threshold_linear / envelope) ** slope
+        else:
+            compressed_gain = 1.0
+
+        if compressed_gain < gain:
+            gain = compressed_gain + (gain - compressed_gain) * attack_coeff
+        else:
+            depth = min(int(gain * (depth_bins - 1)), depth_bins - 1)
+            held = min(int(dwell * dwell_index_scale), dwell_bins - 1)
+            gain = compressed_gain + (gain - compressed_gain) * release_table[depth, held]
+
+        # The cell charges up while it is held in gain reduction and slowly recovers otherwise
+        if gain < OPTO_DWELL_GAIN:
+            dwell = min(dwell + 1.0, dwell_limit)
+        else:
+            dwell *= dwell_decay
+        gains[i] = gain
+    return envelope, gain, dwell
+
+
+@lru_cache(maxsize=None)
+def opto_release_table(sample_rate):
+    """
+    Release coefficients indexed by [gain bin, dwell bin], built once per sample rate.
+
+    Returns:
+        numpy.ndarray: (OPTO_DEPTH_BINS, OPTO_DWELL_BINS) read-only table of one-pole coefficients.
+    """
+    gain = np.linspace(0, 1, OPTO_DEPTH_BINS)
+    with np.errstate(divide='ignore'):
+        depth_db = -20 * np.log10(gain)
+    history = np.linspace(0, 1, OPTO_DWELL_BINS)
+
+    fast = OPTO_FAST_RELEASE[0] + (OPTO_FAST_RELEASE[1] - OPTO_FAST_RELEASE[0]) * history
+    slow = OPTO_SLOW_RELEASE[0] + (OPTO_SLOW_RELEASE[1] - OPTO_SLOW_RELEASE[0]) * history
+    release_time = np.where(depth_db[:, np.newaxis] > OPTO_KNEE_DB, fast, slow)
+
+    table = np.exp(-1 / (release_time * sample_rate))
+    table.setflags(write=False)
+    return table
+
+
+_envelope_gain_kernel = LazyKernel(_envelope_gain, outputs=(1,))
+_opto_envelope_gain_kernel = LazyKernel(_opto_envelope_gain, outputs=(1,))
+
 
 class OpticalCompressor:
-    def __init__(self, sample_rate, attack_time=0.005, release_time=0.2, threshold=-12, ratio=4, makeup_gain=True, make_up_gain=3):
+    def __init__(self, sample_rate, attack_time=0.005, release_time=0.2, threshold=-12, ratio=4, makeup_gain=True, make_up_gain=3, release_mode="classic"):
         self.attack_time = attack_time
         self.release_time = release_time
         self.comp_threshold = 10**(threshold / 20)  # Convert threshold to linear scale
@@ -9,6 +104,14 @@ class OpticalCompressor:
         self.sample_rate = sample_rate
         self.comp_makeup_gain = make_up_gain
 
+        # "classic" uses release_time; "opto" releases in two program-dependent
+        # stages from opto_release_table, ignoring release_time
+        self.release_mode = release_mode
+
+        # Streaming state for process_block
+        self._gains = np.zeros(0)
+        self.reset()
+
     # Function to convert dB to linear gain
     @staticmethod
     def db_to_linear(db):
@@ -19,43 +122,57 @@ class OpticalCompressor:
     def linear_to_db(linear):
         return 20 * np.log10(linear)
 
-    def compressor(self, audio):
-        # Convert threshold to linear gain
-        threshold_linear = self.opt_compressor.db_to_linear(self.comp_threshold)
-        
+    def reset(self):
+        """Returns the streaming envelope, gain and opto history to their resting state."""
+        self.envelope = 0.0
+        self.gain = 1.0
+        self.dwell = 0.0
+
+    def _compress(self, audio, gains, envelope, gain, dwell):
+        # The classic curve has always converted the (already linear) threshold
+        # again; the opto curve uses it as it is
+        threshold_linear = self.db_to_linear(self.comp_threshold)
+
         # Attack and release coefficients (simple exponential smoothing)
         attack_coeff = np.exp(-1 / (self.attack_time * self.sample_rate))
         release_coeff = np.exp(-1 / (self.release_time * self.sample_rate))
 
-        # Initialize variables
-        gain = 1.0
-        envelope = 0.0
-        output_audio = np.zeros_like(audio)
-
-        for i, sample in enumerate(audio):
-            # Envelope follower (simple peak detection)
-            envelope = max(abs(sample), envelope * attack_coeff)
-            
-            # Compression (apply soft knee curve)
-            if envelope > threshold_linear:
-                # Simple ratio compression
-                compressed_gain = 1 - (1 - self.comp_ratio) * (envelope - threshold_linear) / envelope
-                compressed_gain = np.clip(compressed_gain, 0, 1)  # Ensure gain doesn't exceed 1
-            else:
-                compressed_gain = 1
-            
-            # Smooth the gain using release coefficient
-            if compressed_gain < gain:
-                gain = compressed_gain + (gain - compressed_gain) * release_coeff
-            else:
-                gain = compressed_gain
-
-            # Apply compression and make-up gain
-            output_audio[i] = sample * gain * self.opt_compressor.db_to_linear(self.comp_makeup_gain)
+        # One linked detector: the loudest channel of each frame drives the gain of all of them
+        if audio.ndim == 1:
+            np.abs(audio, out=gains)
+        else:
+            np.max(np.abs(audio), axis=1, out=gains)
+        if self.release_mode == "opto":
+            release_table = opto_release_table(self.sample_rate)
+            dwell_limit = OPTO_MAX_DWELL * self.sample_rate
+            dwell_decay = np.exp(-1 / (OPTO_DWELL_RECOVERY * self.sample_rate))
+            envelope, gain, dwell = _opto_envelope_gain_kernel(gains, gains, attack_coeff, release_table,
+                                                               (OPTO_DWELL_BINS - 1) / dwell_limit, dwell_limit,
+                                                               dwell_decay, self.comp_threshold, self.comp_ratio,
+                                                               envelope, gain, dwell)
+        else:
+            envelope, gain = _envelope_gain_kernel(gains, gains, attack_coeff, release_coeff, threshold_linear,
+                                                   self.comp_ratio, envelope, gain)
+
+        # Apply compression and make-up gain
+        gains *= self.db_to_linear(self.comp_makeup_gain)
+        output_audio = np.empty_like(audio)
+        np.multiply(audio, gains if audio.ndim == 1 else gains[:, np.newaxis], out=output_audio)
+        return output_audio, envelope, gain, dwell
 
+    def compressor(self, audio):
+        output_audio, _, _, _ = self._compress(audio, np.zeros(len(audio)), 0.0, 1.0, 0.0)
         return output_audio
 
     def process(self, audio):
-        # Apply the compressor effect
-        processed_audio = self.opt_compressor.compressor(self, audio)
+        # Apply the compressor effect; audio is (frames,) or (frames, channels)
+        processed_audio = self.compressor(audio)
         return processed_audio
+
+    def process_block(self, block):
+        """Compresses the next block of a stream, carrying envelope and gain over from the previous call."""
+        if len(self._gains) < len(block):
+            self._gains = np.zeros(len(block))
+        output_audio, self.envelope, self.gain, self.dwell = self._compress(block, self._gains[:len(block)], self.envelope,
+                                                                            self.gain, self.dwell)
+        return output_audio
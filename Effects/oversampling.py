@@ -0,0 +1,119 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import firwin, upfirdn
+from . import precision
+
+OVERSAMPLING_FACTORS = (1, 2, 4, 8)
+
+
+@lru_cache(maxsize=None)
+def _anti_alias_kernel(factor, taps_per_phase, dtype=np.float64):
+    """Linear-phase low-pass at the base-rate Nyquist, designed once per setting and precision.
+
+    The length is 2 * taps_per_phase * factor + 1 so the group delay is a whole
+    number of base-rate samples and can be trimmed off exactly after decimating.
+    """
+    numtaps = 2 * taps_per_phase * factor + 1
+    kernel = firwin(numtaps, 0.9 / factor, window=('kaiser', 8.0)).astype(dtype)
+    kernel.setflags(write=False)
+    return kernel
+
+
+class Oversampler(object):
+    def __init__(self, factor=2, taps_per_phase=16, state_dtype=None):
+        """
+        Runs a nonlinear stage at factor times the base sample rate, using
+        polyphase FIR resampling on the way up and down.
+
+        Args:
+            factor (int): Oversampling factor, one of 1, 2, 4 or 8 (1 disables it).
+            taps_per_phase (int): Half-length of each polyphase branch; longer
+                kernels give a steeper anti-aliasing filter.
+            state_dtype: Precision the resampling filters run at; None follows
+                the signal, so float32 stays float32 at the oversampled rate.
+        """
+        if factor not in OVERSAMPLING_FACTORS:
+            raise ValueError(f"Oversampling factor must be one of {OVERSAMPLING_FACTORS}, got {factor}")
+        self.factor = factor
+        self.taps_per_phase = taps_per_phase
+        self.state_dtype = state_dtype
+        self.reset()
+
+    @property
+    def latency(self):
+        """Delay of process_block() against its input, in base-rate samples."""
+        return 0 if self.factor == 1 else 2 * self.taps_per_phase
+
+    def reset(self):
+        """Clears the filter history process_block() carries between calls."""
+        self._input_history = None
+        self._shaped_history = None
+
+    def _kernel(self, signal):
+        dtype = precision.state_dtype(signal, self.state_dtype)
+        return _anti_alias_kernel(self.factor, self.taps_per_phase, dtype), dtype
+
+    def upsample(self, signal):
+        """Interpolates signal (frames along axis 0) to factor times its rate."""
+        kernel, dtype = self._kernel(signal)
+        delay = self.taps_per_phase * self.factor
+        upsampled = upfirdn(kernel * dtype.type(self.factor), signal.astype(dtype, copy=False), up=self.factor, axis=0)
+        return upsampled[delay:delay + len(signal) * self.factor]
+
+    def downsample(self, signal, length):
+        """Band-limits and decimates an upsampled signal back to length base-rate frames."""
+        kernel, dtype = self._kernel(signal)
+        decimated = upfirdn(kernel, signal.astype(dtype, copy=False), down=self.factor, axis=0)
+        return decimated[self.taps_per_phase:self.taps_per_phase + length]
+
+    def process(self, signal, stage, *args):
+        """
+        Applies stage(signal, *args) at the oversampled rate.
+
+        Args:
+            signal (numpy.ndarray): Input audio, frames along axis 0.
+            stage (callable): The nonlinear function to run oversampled.
+
+        Returns:
+            numpy.ndarray: The processed signal at the base rate, in the input dtype.
+        """
+        signal = precision.as_samples(signal)
+        if self.factor == 1:
+            return stage(signal, *args)
+
+        shaped = stage(self.upsample(signal), *args)
+        return self.downsample(shaped, len(signal)).astype(signal.dtype, copy=False)
+
+    def process_block(self, block, stage, *args):
+        """
+        Streaming process(): both resampling filters run causally and carry their
+        history from one call to the next, so consecutive blocks join up without
+        a seam. The output lags the input by latency samples; stage must be
+        memoryless (a waveshaper) and map 0 to 0.
+
+        Args:
+            block (numpy.ndarray): The next block of input audio, frames along axis 0.
+            stage (callable): The nonlinear function to run oversampled.
+
+        Returns:
+            numpy.ndarray: The processed block at the base rate, in the input dtype.
+        """
+        block = precision.as_samples(block)
+        if self.factor == 1:
+            return stage(block, *args)
+
+        kernel, dtype = self._kernel(block)
+        # A full kernel length of history in, at each rate
+        history = 2 * self.taps_per_phase
+        if self._input_history is None or self._input_history.shape[1:] != block.shape[1:]:
+            self._input_history = np.zeros((history,) + block.shape[1:], dtype=dtype)
+            self._shaped_history = np.zeros((history * self.factor,) + block.shape[1:], dtype=dtype)
+        length = len(block)
+        signal = np.concatenate([self._input_history.astype(dtype, copy=False), block.astype(dtype, copy=False)])
+        upsampled = upfirdn(kernel * dtype.type(self.factor), signal, up=self.factor, axis=0)
+        upsampled = upsampled[history * self.factor:(history + length) * self.factor]
+        shaped = np.concatenate([self._shaped_history.astype(dtype, copy=False), stage(upsampled, *args)])
+        decimated = upfirdn(kernel, shaped, down=self.factor, axis=0)[history:history + length]
+        self._input_history = signal[-history:]
+        self._shaped_history = shaped[-history * self.factor:]
+        return decimated.astype(block.dtype, copy=False)
@@ -0,0 +1,26 @@
+"""
+Sample and state precision shared by the effects. float32 audio comes back
+as float32 and float64 audio as float64; anything else is processed as
+float64. Filter, delay and envelope state runs at each effect's
+state_dtype: None follows the samples, np.float64 keeps float32 audio
+filtering in double precision.
+"""
+import numpy as np
+
+SAMPLE_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+
+def sample_dtype(audio):
+    """The dtype an effect returns for audio."""
+    dtype = np.asarray(audio).dtype
+    return dtype if dtype in SAMPLE_DTYPES else np.dtype(np.float64)
+
+
+def as_samples(audio):
+    """audio as a float32 or float64 array, copied only when it is neither."""
+    return np.asarray(audio, dtype=sample_dtype(audio))
+
+
+def state_dtype(audio, dtype=None):
+    """The precision state runs at for audio: dtype if given, else the sample dtype."""
+    return sample_dtype(audio) if dtype is None else np.dtype(dtype)
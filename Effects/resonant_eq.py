@@ -1,8 +1,9 @@
 import numpy as np
-from scipy.signal import lfilter
+from scipy.signal import sosfilt
+from . import biquad, precision, sidechain
 
 class ResonantEQ:
-    def __init__(self, sample_rate, attack_time, release_time, depth=1.0):
+    def __init__(self, sample_rate, attack_time, release_time, depth=1.0, state_dtype=None):
         self.sample_rate = sample_rate
         
         # Default EQ settings
@@ -30,6 +31,34 @@ class ResonantEQ:
         self.previous_gain_1 = self.peak_1_gain
         self.previous_gain_2 = self.peak_2_gain
 
+        # Cascade of every band as second-order sections, designed lazily and only
+        # again after a setter changes it; zi carries the filter state between calls
+        self.sos = None
+        self.zi = None
+        # Precision of the cascade and zi; None follows the audio
+        self.state_dtype = state_dtype
+
+        # Dynamic mode: each peak's gain follows the level of its own band (see set_dynamic_values)
+        self.dynamic = False
+        self.dyn_threshold_db = -30
+        self.dyn_range_db = 12
+        self.dyn_block_size = 32
+        self.gain_tables = None
+        self.sidechain_zi = None
+        self.level = None
+
+    # Number of gain steps in each peak's gain->coefficient table
+    GAIN_TABLE_SIZE = 65
+
+    def reset(self):
+        """Clears the filter state so the next call starts from silence."""
+        self.zi = None
+        self.sidechain_zi = None
+        self.level = None
+        if self.dynamic:
+            self.previous_gain_1 = 0.0
+            self.previous_gain_2 = 0.0
+
     def set_peak_values(self, peak_1_freq, peak_1_gain, peak_1_q, peak_2_freq, peak_2_gain, peak_2_q):
         self.peak_1_freq = peak_1_freq
         self.peak_1_gain = peak_1_gain
@@ -37,6 +66,8 @@ class ResonantEQ:
         self.peak_2_freq = peak_2_freq
         self.peak_2_gain = peak_2_gain
         self.peak_2_q = peak_2_q
+        self.sos = None
+        self.gain_tables = None
 
     def set_filter_values(self, low_freq, high_freq, low_gain_db, mid_gain_db, high_gain_db):
         self.low_freq = low_freq
@@ -44,71 +75,153 @@ class ResonantEQ:
         self.low_gain_db = low_gain_db
         self.mid_gain_db = mid_gain_db
         self.high_gain_db = high_gain_db
+        self.sos = None
 
-    @staticmethod
-    def peaking_eq(self, audio, sample_rate, center_freq, q_factor, gain_db, attack_coeff, release_coeff, previous_gain):
+    def set_dynamic_values(self, enabled, threshold_db=-30, range_db=12, block_size=32):
         """
-        Applies a true peaking EQ filter, with attack and release smoothing on the gain.
-        
+        Turns the dynamic EQ mode on or off.
+
         Args:
-            audio (numpy.ndarray): Input audio signal.
-            sample_rate (int): Sample rate of the audio.
-            center_freq (float): Frequency to boost (Hz).
-            q_factor (float): Quality factor (higher = narrower peak).
-            gain_db (float): Gain boost in dB.
-            attack_coeff (float): Attack smoothing coefficient.
-            release_coeff (float): Release smoothing coefficient.
-            previous_gain (float): Previous gain value for smoothing.
+            enabled (bool): When True each peak only applies its gain (times depth)
+                while its band is loud: none below threshold_db, all of it range_db above.
+            threshold_db (float): Band level where the peak starts to engage (dB).
+            range_db (float): Level span over which the peak reaches full gain (dB).
+            block_size (int): Samples per coefficient update.
+        """
+        self.dynamic = enabled
+        self.dyn_threshold_db = threshold_db
+        self.dyn_range_db = range_db
+        self.dyn_block_size = block_size
+        self.gain_tables = None
+        self.level = None
+        # The peaks engage from flat
+        self.previous_gain_1 = 0.0
+        self.previous_gain_2 = 0.0
+
+    def design_sos(self):
+        """
+        Stacks low shelf, both peaks and high shelf into one (4, 6) second-order
+        sections matrix, with the mid gain folded into the first section.
+        """
+        sos = biquad.cascade(
+            biquad.low_shelf(self.sample_rate, self.low_freq, self.low_gain_db),
+            biquad.peaking(self.sample_rate, self.peak_1_freq, self.peak_1_q, self.peak_1_gain),
+            biquad.peaking(self.sample_rate, self.peak_2_freq, self.peak_2_q, self.peak_2_gain),
+            biquad.high_shelf(self.sample_rate, self.high_freq, self.high_gain_db),
+        )
+        sos[0, :3] *= 10**(self.mid_gain_db / 20)
+        return sos
+
+    def design_gain_tables(self):
+        """
+        Precomputes, for each peak, its section at GAIN_TABLE_SIZE gains between
+        0 dB and gain * depth, plus the band-pass used as its sidechain.
 
         Returns:
-            numpy.ndarray: Filtered audio signal.
-            float: New gain value for future processing.
+            list: (lowest gain, highest gain, (GAIN_TABLE_SIZE, 6) table, sidechain sos) per peak.
         """
-        effective_gain_db = gain_db * self.res_eq_depth
-
-        A = 10**(gain_db / 40)  # Amplitude from dB gain
-        omega = 2 * np.pi * center_freq / sample_rate
-        alpha = np.sin(omega) / (2 * q_factor)
-
-        b0 = 1 + alpha * A
-        b1 = -2 * np.cos(omega)
-        b2 = 1 - alpha * A
-        a0 = 1 + alpha / A
-        a1 = -2 * np.cos(omega)
-        a2 = 1 - alpha / A
-
-        # Normalize coefficients
-        b = [b0 / a0, b1 / a0, b2 / a0]
-        a = [1, a1 / a0, a2 / a0]
-
-        # Apply filter
-        filtered_audio = lfilter(b, a, audio)
+        tables = []
+        for freq, q, gain in ((self.peak_1_freq, self.peak_1_q, self.peak_1_gain),
+                              (self.peak_2_freq, self.peak_2_q, self.peak_2_gain)):
+            target = gain * self.res_eq_depth
+            grid = np.linspace(min(0, target), max(0, target), self.GAIN_TABLE_SIZE)
+            table = biquad.cascade(*[biquad.peaking(self.sample_rate, freq, q, g) for g in grid])
+            sidechain = biquad.band_pass(self.sample_rate, freq, q)
+            tables.append((grid[0], grid[-1], table, sidechain))
+        return tables
+
+    def _dynamic_sections(self, level_db, lowest, highest, table, previous_gain, blocks):
+        """
+        Peak sections for the blocks of the grid the call touches: the block in
+        progress keeps previous_gain, each later one follows the level of the
+        block before it. Returns them and the gain after the last complete block.
+        """
+        activity = np.clip((level_db - self.dyn_threshold_db) / self.dyn_range_db, 0, 1)
+
+        # Attack while the peak engages further, release while it backs off: smooth
+        # how far it is engaged, in the direction of its full gain
+        peak = highest if highest > 0 else lowest
+        direction = -1.0 if peak < 0 else 1.0
+        engaged = np.concatenate([[previous_gain * direction], activity * abs(peak)])
+        sidechain.smooth(engaged[1:], self.attack_coeff ** self.dyn_block_size,
+                         self.release_coeff ** self.dyn_block_size, engaged[0])
+        gains = engaged * direction
+
+        # Linear interpolation between neighbouring table entries
+        position = gains[:blocks] - lowest
+        if highest > lowest:
+            position *= (len(table) - 1) / (highest - lowest)
+        index = np.clip(position.astype(int), 0, len(table) - 2)
+        fraction = np.clip(position - index, 0, 1)[:, np.newaxis]
+        sections = table[index] * (1 - fraction) + table[index + 1] * fraction
+        return sections, gains[-1]
+
+    def _process_dynamic(self, audio):
+        if self.gain_tables is None:
+            self.gain_tables = self.design_gain_tables()
+        if self.sidechain_zi is None:
+            self.sidechain_zi = [np.zeros((1, 2)), np.zeros((1, 2))]
+        if self.level is None:
+            self.level = sidechain.BlockLevel(self.dyn_block_size)
+        length = len(audio)
+
+        # One sidechain for all channels, measured on a grid that runs on across calls
+        detector = audio if np.ndim(audio) == 1 else np.mean(audio, axis=1)
+        band_signals = np.empty((length, 2))
+        for band in (0, 1):
+            band_signals[:, band], self.sidechain_zi[band] = sosfilt(self.gain_tables[band][3], detector,
+                                                                     zi=self.sidechain_zi[band])
+        offset = self.level.phase
+        blocks = self.level.blocks(length)
+        level_db = self.level.process(band_signals)
+        peaks = []
+        for band, previous_gain in ((0, self.previous_gain_1), (1, self.previous_gain_2)):
+            lowest, highest, table, _ = self.gain_tables[band]
+            peaks.append(self._dynamic_sections(level_db[:, band], lowest, highest, table, previous_gain, blocks))
+        (peak_1, self.previous_gain_1), (peak_2, self.previous_gain_2) = peaks
+
+        sos_blocks = np.repeat(self.sos[np.newaxis], blocks, axis=0)
+        sos_blocks[:, 1] = peak_1
+        sos_blocks[:, 2] = peak_2
+        return biquad.sosfilt_blocks(sos_blocks, audio, self.dyn_block_size, self.zi, offset)
 
+    @staticmethod
+    def _smooth_gain(gain_db, previous_gain, attack_coeff, release_coeff):
         # Update the gain based on the attack or release times
         if gain_db > previous_gain:
             # Attack phase: gain increases
-            new_gain = attack_coeff * previous_gain + (1 - attack_coeff) * gain_db
-        else:
-            # Release phase: gain decreases
-            new_gain = release_coeff * previous_gain + (1 - release_coeff) * gain_db
-
-        return filtered_audio, new_gain
+            return attack_coeff * previous_gain + (1 - attack_coeff) * gain_db
+        # Release phase: gain decreases
+        return release_coeff * previous_gain + (1 - release_coeff) * gain_db
 
     def process(self, audio):
-        """Processes the audio with EQ and peaks, applying attack and release smoothing."""
-        # Apply the first peaking EQ filter with attack/release smoothing
-        peak_one, new_gain_1 = self.peaking_eq(self, audio, self.sample_rate, self.peak_1_freq, self.peak_1_q, self.peak_1_gain, 
-                                               self.attack_coeff, self.release_coeff, self.previous_gain_1)
-        
-        # Apply the second peaking EQ filter with attack/release smoothing
-        peak_two, new_gain_2 = self.peaking_eq(self, peak_one, self.sample_rate, self.peak_2_freq, self.peak_2_q, self.peak_2_gain, 
-                                               self.attack_coeff, self.release_coeff, new_gain_1)
+        """
+        Processes the audio with EQ and peaks in a single sosfilt pass over all
+        bands. Filter state carries over between calls, so consecutive blocks
+        join without clicks; call reset() before an unrelated signal. In dynamic
+        mode the peak sections are updated every dyn_block_size samples.
+        float32 audio comes back as float32, anything else as float64.
+        """
+        audio = precision.as_samples(audio)
+        if len(audio) == 0:
+            return audio.copy()
+        if self.sos is None:
+            self.sos = self.design_sos()
+        state_shape = (len(self.sos), 2) + np.shape(audio)[1:]
+        dtype = precision.state_dtype(audio, self.state_dtype)
+        if self.zi is None or self.zi.shape != state_shape or self.zi.dtype != dtype:
+            self.zi = np.zeros(state_shape, dtype=dtype)
+
+        if self.dynamic:
+            return self._process_dynamic(audio)
+
+        filtered_audio, self.zi = sosfilt(self.sos.astype(dtype, copy=False), audio, axis=0, zi=self.zi)
 
         # Update the previous gain values for the next process call
-        self.previous_gain_1 = new_gain_1
-        self.previous_gain_2 = new_gain_2
+        self.previous_gain_1 = self._smooth_gain(self.peak_1_gain, self.previous_gain_1, self.attack_coeff, self.release_coeff)
+        self.previous_gain_2 = self._smooth_gain(self.peak_2_gain, self.previous_gain_2, self.attack_coeff, self.release_coeff)
 
-        return peak_two
+        return filtered_audio.astype(audio.dtype, copy=False)
 
     
             # # Apply band EQ using Pedalboard
@@ -0,0 +1,72 @@
+"""
+Sidechain detection shared by the dynamic EQs: short-term RMS on a grid of
+blocks that runs on from one call to the next, and one-pole ballistics over
+the per-block targets.
+"""
+import numpy as np
+from .jit import LazyKernel
+
+
+def _smooth(targets, attack_coeff, release_coeff, value):
+    # One-pole ballistics over per-block targets, in place
+    for i in range(len(targets)):
+        coeff = attack_coeff if targets[i] > value else release_coeff
+        value = coeff * value + (1 - coeff) * targets[i]
+        targets[i] = value
+    return value
+
+# smooth(targets, attack_coeff, release_coeff, value) smooths targets in place,
+# with attack_coeff while a target is above the running value, and returns the last value
+smooth = LazyKernel(_smooth, outputs=(0,))
+
+
+class BlockLevel(object):
+    def __init__(self, block_size):
+        """
+        Short-term RMS level of a sidechain, one reading per block_size frames.
+        The grid runs on across calls: a block split between two calls is read
+        once its last frame arrives, so the readings do not depend on how the
+        signal is cut into calls.
+
+        Args:
+            block_size (int): Frames per reading.
+        """
+        self.block_size = block_size
+        self.reset()
+
+    def reset(self):
+        """Starts a new grid, with no frames of the current block seen yet."""
+        # Frames of the current block seen so far, and their sum of squares
+        self.phase = 0
+        self._partial = 0.0
+
+    def blocks(self, length):
+        """Blocks of the grid the next length frames touch, the current one included."""
+        return -(-(self.phase + length) // self.block_size)
+
+    def process(self, signal):
+        """
+        Measures the next frames of the sidechain.
+
+        Args:
+            signal (numpy.ndarray): (frames,) or (frames, bands) sidechain signal.
+
+        Returns:
+            numpy.ndarray: RMS level in dB of every block signal completes,
+            (blocks,) + signal.shape[1:]; no rows while the current block is still filling.
+        """
+        block_size = self.block_size
+        squares = np.square(signal, dtype=np.float64)
+        head = min(block_size - self.phase, len(squares))
+        first = self._partial + squares[:head].sum(axis=0)
+        if self.phase + head < block_size:
+            self._partial = first
+            self.phase += head
+            return np.zeros((0,) + squares.shape[1:])
+
+        whole = (len(squares) - head) // block_size
+        stop = head + whole * block_size
+        sums = np.concatenate([[first], squares[head:stop].reshape((whole, block_size) + squares.shape[1:]).sum(axis=1)])
+        self._partial = squares[stop:].sum(axis=0)
+        self.phase = len(squares) - stop
+        return 20 * np.log10(np.sqrt(sums / block_size) + 1e-10)
@@ -0,0 +1,163 @@
+"""
+Block-by-block file rendering. Audio goes from soundfile through an effect
+chain to the output in fixed-size blocks, so the memory used does not grow
+with the length of the file. Whole-file intermediates go to memory-mapped
+scratch files instead of RAM.
+"""
+import mmap
+import tempfile
+import numpy as np
+from .chain import EffectChain
+
+# Frames per block read from, pushed through the chain and written to disk
+BLOCK_SIZE = 8192
+
+# Linux maps up to this much around a faulting page of a file mapping
+FAULT_AROUND_BYTES = 65536
+
+
+def scratch_array(shape, dtype=np.float64, directory=None):
+    """
+    An uninitialised array backed by a temporary file rather than RAM, for
+    whole-file intermediates. The file has no name on disk and its space is
+    freed when the array is garbage collected.
+
+    Args:
+        shape (tuple): Array shape.
+        dtype: Array dtype.
+        directory (str): Where the file goes; the system temporary directory by default.
+
+    Returns:
+        numpy.memmap: The scratch array (a plain empty array if it has no elements).
+    """
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    # The mapping keeps the unlinked file alive after the handle is closed
+    with tempfile.TemporaryFile(dir=directory) as backing:
+        return np.memmap(backing, dtype=dtype, mode='w+', shape=shape)
+
+
+def release(array, start=0, stop=None):
+    """
+    Drops rows [start, stop) of a scratch_array from the process's resident
+    memory once they have been used. The data stays in the file and is paged
+    back in if touched again. Does nothing for arrays in RAM.
+    """
+    mapping = array
+    while mapping is not None and not isinstance(mapping, mmap.mmap):
+        mapping = getattr(mapping, "base", None)
+    if mapping is None or not hasattr(mapping, "madvise"):
+        return
+    row = array.itemsize * int(np.prod(array.shape[1:]))
+    stop = len(array) if stop is None else stop
+    # Page faults map in the pages around them too (fault-around), so the pages
+    # just before start are dropped again. File pages are only unmapped, never
+    # lost, so rows sharing a page with the range keep their data
+    first = max(0, start * row - FAULT_AROUND_BYTES) // mmap.PAGESIZE * mmap.PAGESIZE
+    last = stop * row
+    if last > first:
+        mapping.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+
+class ScratchWriter(object):
+    def __init__(self, frames, channels, directory=None, dtype=np.float64):
+        """
+        A sink for stream() that keeps the rendered audio in a scratch_array,
+        and its peak, for whole-file passes such as normalisation.
+
+        Args:
+            frames (int): Frames that will be written.
+            channels (int): Channels per frame.
+            directory (str): Where the scratch file goes.
+            dtype: Sample precision the audio is kept in.
+        """
+        self.audio = scratch_array((frames, channels), dtype, directory)
+        self.frames = 0
+        self.peak = 0.0
+
+    def write(self, frames):
+        self.audio[self.frames:self.frames + len(frames)] = frames
+        release(self.audio, self.frames, self.frames + len(frames))
+        self.frames += len(frames)
+        if len(frames):
+            self.peak = max(self.peak, float(np.abs(frames).max()))
+
+
+def stream(chain, source, sink, block_size=BLOCK_SIZE):
+    """
+    Pushes every block of source through a prepared chain into sink. The
+    chain's latency is trimmed off the start and flushed out with silence at
+    the end, so the output lines up with the input.
+
+    Args:
+        chain (EffectChain): Prepared for source's sample rate and channels, with
+            at least block_size frames. Blocks are read in its dtype.
+        source (soundfile.SoundFile): Input, read from its current position.
+        sink: Anything with a write(frames) method, e.g. a soundfile.SoundFile.
+        block_size (int): Frames per block.
+
+    Returns:
+        int: Frames written to sink.
+    """
+    output = np.empty((block_size, chain.output_channels), dtype=chain.dtype)
+    skip = chain.latency
+    written = 0
+
+    def write(frames):
+        nonlocal skip, written
+        sink.write(frames[skip:])
+        written += max(0, len(frames) - skip)
+        skip = max(0, skip - len(frames))
+
+    for block in source.blocks(block_size, dtype=chain.dtype.name, always_2d=True):
+        chain.process_block(block, output[:len(block)])
+        write(output[:len(block)])
+
+    silence = np.zeros((block_size, source.channels), dtype=chain.dtype)
+    for flush in range(0, chain.latency, block_size):
+        length = min(block_size, chain.latency - flush)
+        chain.process_block(silence[:length], output[:length])
+        write(output[:length])
+    return written
+
+
+def stream_file(effect, input_path, output_path, block_size=BLOCK_SIZE, subtype=None, normalise_db=None,
+                scratch_dir=None):
+    """
+    Renders a file through an effect without loading it: peak memory stays the
+    same for a minute or a two-hour stem.
+
+    Args:
+        effect: An EffectChain, or any single effect as_effect() accepts. The
+            render runs at the chain's dtype, float64 for a single effect.
+        input_path (str): Input file (anything soundfile can read).
+        output_path (str): Output file, in the input's format.
+        block_size (int): Frames per block.
+        subtype (str): soundfile subtype of the output, e.g. "FLOAT"; the input's by default.
+        normalise_db (float): Peak level to normalise the output to, in dBFS. The
+            render is kept in a scratch file until its peak is known.
+        scratch_dir (str): Where that scratch file goes.
+
+    Returns:
+        int: Frames written.
+    """
+    import soundfile as sf
+
+    chain = effect if isinstance(effect, EffectChain) else EffectChain([effect])
+    with sf.SoundFile(input_path) as source:
+        chain.prepare(source.samplerate, block_size, source.channels)
+        with sf.SoundFile(output_path, 'w', source.samplerate, chain.output_channels, subtype or source.subtype,
+                          format=source.format) as sink:
+            if normalise_db is None:
+                return stream(chain, source, sink, block_size)
+
+            render = ScratchWriter(source.frames, chain.output_channels, scratch_dir, chain.dtype)
+            stream(chain, source, render, block_size)
+            gain = 10 ** (normalise_db / 20) / render.peak if render.peak > 0 else 1.0
+            block = np.empty((block_size, chain.output_channels), dtype=chain.dtype)
+            for start in range(0, render.frames, block_size):
+                stop = min(start + block_size, render.frames)
+                np.multiply(render.audio[start:stop], gain, out=block[:stop - start])
+                release(render.audio, start, stop)
+                sink.write(block[:stop - start])
+            return render.frames
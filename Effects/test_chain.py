@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from .chain import EffectChain
+from .three_band_eq import ThreeBandEQ
+
+
+@pytest.mark.parametrize("fuse", [True, False])
+def test_three_band_eq_runs_at_its_own_rate(fuse):
+    audio = np.random.default_rng(0).standard_normal((4800, 2))
+    chain = EffectChain([ThreeBandEQ(48000)], fuse=fuse)
+    chain.prepare(48000, 512, 2)
+    np.testing.assert_allclose(chain.process(audio), ThreeBandEQ(48000).process(audio), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("fuse", [True, False])
+def test_three_band_eq_is_refused_at_another_rate(fuse):
+    chain = EffectChain([ThreeBandEQ(48000)], fuse=fuse)
+    with pytest.raises(ValueError, match="48000 Hz, the chain runs at 44100 Hz"):
+        chain.prepare(44100, 512, 2)
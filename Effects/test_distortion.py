@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from .chain import EffectChain
+from .distortion import Distortion
+
+SAMPLE_RATE = 48000
+
+
+def stereo(frames=SAMPLE_RATE // 2):
+    return np.random.default_rng(0).uniform(-0.8, 0.8, (frames, 2))
+
+
+@pytest.mark.parametrize("block_size", [512, 100, 7])
+def test_oversampled_stream_has_no_seams_at_block_edges(block_size):
+    audio = stereo()
+    chain = EffectChain([Distortion(4)])
+    chain.prepare(SAMPLE_RATE, block_size, 2)
+    streamed = chain.process(audio)
+
+    rendered = audio.copy()
+    Distortion(4).Process(rendered, 0.2)
+    # The whole-buffer render drops the resampling filters' ringing past both ends
+    edge = 16
+    np.testing.assert_allclose(streamed[edge:-edge], rendered[edge:-edge], rtol=0, atol=1e-12)
+
+
+def test_oversampled_stream_reports_the_resampling_latency():
+    distortion = Distortion(4)
+    assert distortion.latency == 2 * distortion.oversampler.taps_per_phase
+    assert Distortion().latency == 0
+
+    chain = EffectChain([Distortion(4)])
+    chain.prepare(SAMPLE_RATE, 512, 2)
+    assert chain.latency == distortion.latency
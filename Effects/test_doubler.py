@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from .doubler import StereoDoubler
+
+
+@pytest.mark.parametrize("shape", [(1000,), (1000, 1), (1000, 2)])
+def test_stereo_doubler_widens_mono_and_stereo(shape):
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, shape)
+    assert StereoDoubler().process(audio).shape == (1000, 2)
+    assert StereoDoubler().process_block(audio).shape == (1000, 2)
+
+
+def test_stereo_doubler_refuses_more_than_two_channels():
+    audio = np.zeros((1000, 3))
+    with pytest.raises(ValueError, match="mono or stereo audio, got 3 channels"):
+        StereoDoubler().process(audio)
+    with pytest.raises(ValueError, match="mono or stereo audio, got 3 channels"):
+        StereoDoubler().process_block(audio)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from .dynamic_eq import DynamicBand, DynamicEQ, vocal_bands
+
+SAMPLE_RATE = 48000
+
+
+def streamed(eq, audio, host_block):
+    return np.concatenate([eq.process_block(audio[start:start + host_block])
+                           for start in range(0, len(audio), host_block)])
+
+
+@pytest.mark.parametrize("lookahead_ms", [0, 2])
+@pytest.mark.parametrize("host_block", [1, 8, 100, 333])
+def test_stream_matches_process_for_any_host_block_size(host_block, lookahead_ms):
+    audio = np.random.default_rng(0).standard_normal((SAMPLE_RATE // 2, 2)) * 0.3
+    expected = DynamicEQ(SAMPLE_RATE, vocal_bands(), lookahead_ms=lookahead_ms).process(audio)
+
+    eq = DynamicEQ(SAMPLE_RATE, vocal_bands(), lookahead_ms=lookahead_ms)
+    output = streamed(eq, audio, host_block)[eq.latency:]
+    np.testing.assert_allclose(output, expected[:len(output)], rtol=0, atol=1e-12)
+
+
+def test_attack_time_does_not_depend_on_the_host_block_size():
+    band = DynamicBand("peaking", 1000, q=1, threshold_db=-40, ratio=10, attack_ms=50, release_ms=200, range_db=24)
+    tone = np.sin(2 * np.pi * 1000 * np.arange(SAMPLE_RATE // 10) / SAMPLE_RATE)
+    reductions = []
+    for host_block in (8, 32, 1000):
+        eq = DynamicEQ(SAMPLE_RATE, [band])
+        streamed(eq, tone, host_block)
+        reductions.append(eq.gain_reduction_db[0])
+    assert reductions[0] > 0
+    assert reductions == pytest.approx([reductions[0]] * 3, abs=1e-9)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from .de_esser import DeEsser
+from .doubler import StereoDoubler
+from .resonant_eq import ResonantEQ
+from .three_band_eq import ThreeBandEQ
+from .tube_amp_eq import PultecEQP1A
+
+SAMPLE_RATE = 48000
+
+
+def dynamic_resonant_eq():
+    eq = ResonantEQ(SAMPLE_RATE, 0.01, 0.1)
+    eq.set_dynamic_values(True)
+    return eq
+
+
+STREAMS = {
+    "DeEsser": lambda: DeEsser(SAMPLE_RATE).process_block,
+    "ThreeBandEQ": lambda: ThreeBandEQ(SAMPLE_RATE).process,
+    "ResonantEQ": lambda: ResonantEQ(SAMPLE_RATE, 0.01, 0.1).process,
+    "ResonantEQ, dynamic": lambda: dynamic_resonant_eq().process,
+    "StereoDoubler": lambda: StereoDoubler(sample_rate=SAMPLE_RATE).process_block,
+    "PultecEQP1A": lambda: PultecEQP1A(SAMPLE_RATE, 100, 0.5, 6, -3, 8000, 0.5, 3, -3).process_block,
+}
+
+
+@pytest.mark.parametrize("name", STREAMS)
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize("shape", [(2048,), (2048, 2)])
+def test_empty_block_passes_through_and_leaves_the_stream_alone(name, dtype, shape):
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, shape).astype(dtype)
+    whole = STREAMS[name]()
+    expected = np.concatenate([np.array(whole(audio[:1000]), copy=True), np.array(whole(audio[1000:]), copy=True)])
+
+    process = STREAMS[name]()
+    first = np.array(process(audio[:1000]), copy=True)
+    empty = process(audio[:0])
+    assert empty.shape == (0,) + first.shape[1:]
+    assert empty.dtype == dtype
+    np.testing.assert_array_equal(np.concatenate([first, process(audio[1000:])]), expected)
+
+
+@pytest.mark.parametrize("low_latency", [False, True])
+def test_conv_reverb_passes_empty_blocks_through(low_latency, tmp_path):
+    sf = pytest.importorskip("soundfile")
+    from .conv_reverb import ConvReverb, IRRegistry
+
+    path = str(tmp_path / "ir.wav")
+    sf.write(path, np.random.default_rng(1).standard_normal((4800, 2)) * 0.1, SAMPLE_RATE, subtype='FLOAT')
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, 2048)
+
+    def reverb():
+        return ConvReverb(SAMPLE_RATE, path, 0.3, block_size=256, low_latency=low_latency, registry=IRRegistry())
+
+    whole = reverb()
+    expected = np.concatenate([whole.process_block(audio[:1000]), whole.process_block(audio[1000:])])
+    stream = reverb()
+    output = [stream.process_block(audio[:0]), stream.process_block(audio[:1000]),
+              stream.process_block(audio[:0]), stream.process_block(audio[1000:])]
+    assert output[0].shape == output[2].shape == (0, 2)
+    np.testing.assert_array_equal(np.concatenate(output), expected)
+    whole.close()
+    stream.close()
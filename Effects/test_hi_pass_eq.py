@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from . import high_shelf_filter
+from .hi_pass_eq import HiPass
+
+SAMPLE_RATE = 48000
+
+
+def stereo(frames=SAMPLE_RATE):
+    return (np.random.default_rng(0).standard_normal((frames, 2)) * 0.1).astype(np.float32)
+
+
+@pytest.mark.parametrize("layout", ["frames first", "channels first"])
+def test_matches_pedalboard_in_either_layout(layout):
+    pedalboard = pytest.importorskip("pedalboard")
+    audio = stereo() if layout == "frames first" else stereo().T.copy()
+
+    expected = pedalboard.HighpassFilter(125)(audio, SAMPLE_RATE)
+    np.testing.assert_allclose(HiPass().process(audio, SAMPLE_RATE), expected, atol=1e-6)
+
+    expected = pedalboard.Pedalboard([pedalboard.HighShelfFilter(3480, 3)])(audio, SAMPLE_RATE)
+    np.testing.assert_allclose(high_shelf_filter.process(audio, SAMPLE_RATE), expected, atol=1e-6)
+
+
+def test_layouts_give_the_same_channels():
+    audio = stereo()
+    np.testing.assert_array_equal(HiPass().process(audio.T, SAMPLE_RATE).T, HiPass().process(audio, SAMPLE_RATE))
+
+
+def test_square_audio_is_rejected():
+    with pytest.raises(ValueError, match="Ambiguous"):
+        HiPass().process(np.zeros((2, 2)), SAMPLE_RATE)
+    with pytest.raises(ValueError, match="Ambiguous"):
+        high_shelf_filter.process(np.zeros((2, 2)), SAMPLE_RATE)
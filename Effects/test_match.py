@@ -1,12 +1,12 @@
 import numpy as np
-import os
-import soundfile as sf
 
 class Tests:
     def test_diff(input, output):
         print("Comparison: ", np.allclose(input, output))
 
 if __name__ == "__main__":
+    import soundfile as sf
+
     input = "Audio/Output/M_T1_Dry_ResEq1.wav"
     output = "Audio/Output/M_T1_Dry_ResEq1_Mix.wav"
 
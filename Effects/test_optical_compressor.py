@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from .optical_compressor import OpticalCompressor
+
+SAMPLE_RATE = 48000
+
+
+def tone(amplitude, seconds=1.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * 200 * t)
+
+
+def settled_gain_db(compressor, amplitude):
+    """Gain in dB over the second half of a steady tone, once the envelope has settled."""
+    output = compressor.process(tone(amplitude))
+    half = len(output) // 2
+    return 20 * np.log10(np.abs(output[half:]).max() / amplitude)
+
+
+def test_opto_leaves_audio_below_threshold_alone():
+    compressor = OpticalCompressor(SAMPLE_RATE, threshold=-12, ratio=4, make_up_gain=0, release_mode="opto")
+    assert settled_gain_db(compressor, 0.1) == pytest.approx(0.0, abs=1e-9)
+
+
+@pytest.mark.parametrize("amplitude", [1.0, 4.0])
+def test_opto_reduces_gain_above_threshold_by_the_ratio(amplitude):
+    compressor = OpticalCompressor(SAMPLE_RATE, threshold=-12, ratio=4, make_up_gain=0, release_mode="opto")
+    over_db = 20 * np.log10(amplitude) + 12
+    # 4:1 keeps a quarter of the overshoot; the peak detector ripples a little above it
+    assert settled_gain_db(compressor, amplitude) == pytest.approx(-over_db * 3 / 4, abs=1.0)
+
+
+def test_opto_releases_after_the_loud_part():
+    compressor = OpticalCompressor(SAMPLE_RATE, threshold=-12, ratio=4, make_up_gain=0, release_mode="opto")
+    loud = compressor.process_block(tone(1.0))
+    quiet = compressor.process_block(tone(0.1, seconds=6.0))
+    assert np.abs(loud[-1000:]).max() < 0.5
+    # The gain recovers to unity over the slow stage of the release
+    assert np.abs(quiet[-SAMPLE_RATE // 10:]).max() == pytest.approx(0.1, rel=0.01)
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_chain_runs_a_linked_detector_over_every_channel(channels):
+    from .chain import EffectChain
+
+    loud = tone(1.0)
+    audio = np.stack([loud, 0.5 * loud], axis=1)[:, :channels]
+    chain = EffectChain([OpticalCompressor(SAMPLE_RATE, release_mode="opto")])
+    chain.prepare(SAMPLE_RATE, 512, channels)
+    output = chain.process(audio)
+    # Every channel gets the gain of the loudest one, so the balance between them is kept
+    expected = OpticalCompressor(SAMPLE_RATE, release_mode="opto").process(loud)
+    np.testing.assert_allclose(output, expected[:, np.newaxis] * [1.0, 0.5][:channels], rtol=1e-12)
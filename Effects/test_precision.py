@@ -0,0 +1,179 @@
+"""
+Every effect returns float32 for float32 input and float64 for float64 input,
+and stays within a bound of its float64 render with the state in float32 and
+in float64.
+"""
+import numpy as np
+import pytest
+from . import gain, high_shelf_filter
+from .chain import EffectChain, Gain
+from .conv_reverb import ConvReverb, IRRegistry
+from .convolution import PartitionedConvolver, partition_ir
+from .de_esser import DeEsser
+from .delay import GV_Delay
+from .distortion import Distortion
+from .doubler import Doubler, StereoDoubler
+from .dynamic_eq import DynamicEQ, vocal_bands
+from .hi_pass_eq import HiPass
+from .mix import Mixer
+from .optical_compressor import OpticalCompressor
+from .oversampling import Oversampler
+from .resonant_eq import ResonantEQ
+from .three_band_eq import ThreeBandEQ
+from .tube_amp_eq import PultecEQP1A
+from .vca_compressor import VCA_Compressor
+
+SAMPLE_RATE = 48000
+BLOCK_SIZE = 512
+
+
+@pytest.fixture(scope="module")
+def stereo():
+    return np.random.default_rng(0).uniform(-0.25, 0.25, (2 * SAMPLE_RATE, 2))
+
+
+@pytest.fixture(scope="module")
+def ir_path(tmp_path_factory):
+    """A half-second decaying stereo noise burst standing in for a reverb IR."""
+    sf = pytest.importorskip("soundfile")
+    path = str(tmp_path_factory.mktemp("ir") / "plate.wav")
+    frames = SAMPLE_RATE // 2
+    decay = np.exp(-6.9 * np.arange(frames) / frames)[:, np.newaxis]  # -60 dB at the end
+    sf.write(path, np.random.default_rng(1).standard_normal((frames, 2)) * decay, SAMPLE_RATE, subtype='FLOAT')
+    return path
+
+
+def streamed(effect, audio):
+    """process_block() over the whole signal in BLOCK_SIZE pieces."""
+    blocks = [np.array(effect.process_block(audio[start:start + BLOCK_SIZE]), copy=True)
+              for start in range(0, len(audio), BLOCK_SIZE)]
+    return np.concatenate(blocks)
+
+
+def delay(audio, state_dtype):
+    gv_delay = GV_Delay(sample_rate=SAMPLE_RATE, state_dtype=state_dtype)
+    gv_delay.set_delay_seconds(120)
+    return gv_delay.process(audio, SAMPLE_RATE)
+
+
+def vca(audio, state_dtype):
+    compressor = VCA_Compressor()
+    compressor.Setup(BLOCK_SIZE, audio.shape[1], SAMPLE_RATE, state_dtype=state_dtype)
+    audio = audio.copy()
+    compressor.Process(audio)
+    return audio
+
+
+def distortion(audio, state_dtype, oversampling=1):
+    audio = audio.copy()
+    Distortion(oversampling).Process(audio, 0.3)
+    return audio
+
+
+def pultec(audio, state_dtype, **settings):
+    return PultecEQP1A(SAMPLE_RATE, 100, 0.5, 6, -3, 8000, 0.5, 3, -3, state_dtype=state_dtype,
+                       **settings).process(audio)
+
+
+def reverb(ir_path, stream=False, **settings):
+    def render(audio, state_dtype):
+        effect = ConvReverb(SAMPLE_RATE, ir_path, 0.35, block_size=256, registry=IRRegistry(), state_dtype=state_dtype,
+                            **settings)
+        try:
+            return streamed(effect, audio) if stream else effect.process(audio)
+        finally:
+            effect.close()
+    return render
+
+
+def chain(audio, state_dtype):
+    stages = [HiPass(state_dtype), ThreeBandEQ(SAMPLE_RATE, state_dtype=state_dtype), Gain(-3),
+              DeEsser(SAMPLE_RATE, state_dtype=state_dtype), VCA_Compressor(), Doubler(sample_rate=SAMPLE_RATE)]
+    effect_chain = EffectChain(stages, dtype=audio.dtype)
+    effect_chain.prepare(SAMPLE_RATE, BLOCK_SIZE, audio.shape[1])
+    return effect_chain.process(audio)
+
+
+def chorus(audio, state_dtype):
+    pytest.importorskip("pedalboard")
+    from .chorus import GVChorus
+
+    return GVChorus(5, 0.1, 10, 0.2, 0.15).Process(audio, BLOCK_SIZE, SAMPLE_RATE)
+
+
+# Name -> (function(audio, state_dtype), max error of float32 against float64).
+# Recursive filters with low corners amplify float32 rounding the most
+STAGES = {
+    "gain": (lambda audio, state_dtype: gain.process(audio, SAMPLE_RATE, -3), 1e-6),
+    "HiPass": (lambda audio, state_dtype: HiPass(state_dtype).process(audio, SAMPLE_RATE), 1e-4),
+    "high shelf": (lambda audio, state_dtype: high_shelf_filter.process(audio, SAMPLE_RATE, state_dtype=state_dtype),
+                   1e-4),
+    "ThreeBandEQ": (lambda audio, state_dtype: ThreeBandEQ(SAMPLE_RATE, state_dtype=state_dtype).process(audio), 1e-4),
+    "DeEsser": (lambda audio, state_dtype: DeEsser(SAMPLE_RATE, state_dtype=state_dtype).process(audio), 1e-4),
+    "DeEsser stream": (lambda audio, state_dtype: streamed(DeEsser(SAMPLE_RATE, state_dtype=state_dtype), audio),
+                       1e-4),
+    "VCA_Compressor": (vca, 1e-4),
+    "OpticalCompressor": (lambda audio, state_dtype: OpticalCompressor(SAMPLE_RATE, release_mode="opto").process(audio),
+                          1e-4),
+    "GV_Delay": (delay, 1e-5),
+    "Distortion": (distortion, 1e-5),
+    "Distortion, 4x oversampled": (lambda audio, state_dtype: distortion(audio, state_dtype, 4), 1e-5),
+    "Oversampler": (lambda audio, state_dtype: Oversampler(4, state_dtype=state_dtype).process(audio, np.tanh), 1e-5),
+    "DynamicEQ": (lambda audio, state_dtype: DynamicEQ(SAMPLE_RATE, vocal_bands(),
+                                                       state_dtype=state_dtype).process(audio), 1e-4),
+    "ResonantEQ": (lambda audio, state_dtype: ResonantEQ(SAMPLE_RATE, 0.01, 0.1, state_dtype=state_dtype).process(audio),
+                   1e-4),
+    "PultecEQP1A": (pultec, 1e-4),
+    "PultecEQP1A, linear phase": (lambda audio, state_dtype: pultec(audio, state_dtype, linear_phase=True), 1e-4),
+    "PultecEQP1A, 4x oversampled tube stage": (lambda audio, state_dtype: pultec(audio, state_dtype, oversampling=4),
+                                               1e-4),
+    "Doubler": (lambda audio, state_dtype: Doubler(sample_rate=SAMPLE_RATE).process(audio), 1e-5),
+    "StereoDoubler": (lambda audio, state_dtype: StereoDoubler(4, sample_rate=SAMPLE_RATE).process(audio), 1e-5),
+    "Mixer": (lambda audio, state_dtype: Mixer().process(audio, audio[::-1], 0.3), 1e-6),
+    "chorus": (chorus, 1e-6),
+    "EffectChain": (chain, 1e-4),
+}
+
+# Reverbs need the IR file, so they are built per test
+REVERBS = {
+    "ConvReverb": {},
+    "ConvReverb stream": {"stream": True},
+    "ConvReverb low latency stream": {"stream": True, "low_latency": True},
+}
+
+
+def check(effect, bound, stereo):
+    single = stereo.astype(np.float32)
+    expected = effect(stereo, None)
+    assert expected.dtype == np.float64
+    for state_dtype in (None, np.float64):
+        output = effect(single, state_dtype)
+        assert output.dtype == np.float32
+        assert output.shape == expected.shape
+        assert np.abs(output - expected).max() <= bound
+
+
+@pytest.mark.parametrize("name", STAGES)
+def test_float32_in_float32_out(name, stereo):
+    effect, bound = STAGES[name]
+    check(effect, bound, stereo)
+
+
+@pytest.mark.parametrize("name", REVERBS)
+def test_reverb_float32_in_float32_out(name, stereo, ir_path):
+    check(reverb(ir_path, **REVERBS[name]), 1e-5, stereo)
+
+
+def test_float32_convolution_runs_in_complex64(stereo):
+    spectra = partition_ir(stereo[:1000], 256)
+    convolver = PartitionedConvolver(spectra, 256)
+    wet = convolver.process_block(stereo[:1024].astype(np.float32))
+    assert wet.dtype == np.float32
+    assert convolver._history.dtype == np.complex64
+    assert partition_ir(stereo[:1000], 256, np.float32).dtype == np.complex64
+
+
+def test_float64_state_keeps_float32_audio_filtered_in_double(stereo):
+    eq = ThreeBandEQ(SAMPLE_RATE, state_dtype=np.float64)
+    assert eq.process(stereo.astype(np.float32)).dtype == np.float32
+    assert eq.zi.dtype == np.float64
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from .resonant_eq import ResonantEQ
+
+SAMPLE_RATE = 48000
+
+
+def dynamic_eq(peak_1_gain=6):
+    eq = ResonantEQ(SAMPLE_RATE, 0.01, 0.1)
+    eq.set_peak_values(100, peak_1_gain, 1, 500, 6, 1)
+    eq.set_dynamic_values(True)
+    return eq
+
+
+@pytest.mark.parametrize("peak_1_gain", [6, -6])
+@pytest.mark.parametrize("call_size", [1, 7, 100, 333])
+def test_dynamic_mode_does_not_depend_on_how_the_signal_is_split(call_size, peak_1_gain):
+    audio = np.random.default_rng(0).standard_normal((SAMPLE_RATE // 2, 2)) * 0.3
+    expected_eq = dynamic_eq(peak_1_gain)
+    expected = expected_eq.process(audio)
+
+    eq = dynamic_eq(peak_1_gain)
+    output = np.concatenate([eq.process(audio[start:start + call_size]) for start in range(0, len(audio), call_size)])
+    np.testing.assert_allclose(output, expected, rtol=0, atol=1e-12)
+    assert eq.previous_gain_1 == pytest.approx(expected_eq.previous_gain_1, abs=1e-12)
+    assert eq.previous_gain_2 == pytest.approx(expected_eq.previous_gain_2, abs=1e-12)
@@ -1,5 +1,5 @@
-from pedalboard import Pedalboard, LowShelfFilter, PeakFilter, HighShelfFilter
-from scipy.signal import lfilter
+from scipy.signal import sosfilt
+from . import biquad, precision
 import numpy as np
 
 def peaking_eq(audio, sample_rate, center_freq, q_factor, gain_db):
@@ -16,53 +16,107 @@ def peaking_eq(audio, sample_rate, center_freq, q_factor, gain_db):
     Returns:
         numpy.ndarray: Filtered audio signal.
     """
-    A = 10**(gain_db / 40)  # Amplitude from dB gain
-    omega = 2 * np.pi * center_freq / sample_rate
-    alpha = np.sin(omega) / (2 * q_factor)
-
-    # Biquad peaking EQ coefficients
-    b0 = 1 + alpha * A
-    b1 = -2 * np.cos(omega)
-    b2 = 1 - alpha * A
-    a0 = 1 + alpha / A
-    a1 = -2 * np.cos(omega)
-    a2 = 1 - alpha / A
-
-    # Normalize coefficients
-    b = [b0 / a0, b1 / a0, b2 / a0]
-    a = [1, a1 / a0, a2 / a0]
-
     # Apply filter
-    filtered_audio = lfilter(b, a, audio)
+    filtered_audio = sosfilt(biquad.peaking(sample_rate, center_freq, q_factor, gain_db), audio)
     return filtered_audio
 
 
-def create_3band_eq(audio, sample_rate, low_gain, peak_gain, high_gain, peak_cutoff, peak_resonance, low_freq=400, high_freq=2500):
+def create_3band_eq(low_gain, peak_gain, high_gain, peak_cutoff, peak_resonance, low_freq=400, high_freq=2500):
     """
     Creates a 3-band EQ pedalboard.
 
     Args:
         low_gain (float): Gain for the low shelf filter in dB.
-        mid_gain (float): Gain for the peak filter in dB.
+        peak_gain (float): Gain for the peak filter in dB.
         high_gain (float): Gain for the high shelf filter in dB.
+        peak_cutoff (float): Centre frequency of the peak filter in Hz.
+        peak_resonance (float): Q of the peak filter.
         low_freq (float): Cutoff frequency for the low shelf filter in Hz.
         high_freq (float): Cutoff frequency for the high shelf filter in Hz.
 
     Returns:
         Pedalboard: A Pedalboard object containing the 3-band EQ.
     """
-    peak = peaking_eq(audio, sample_rate, peak_cutoff, peak_resonance, peak_gain)
+    from pedalboard import Pedalboard, LowShelfFilter, PeakFilter, HighShelfFilter
 
     board = Pedalboard([
         LowShelfFilter(gain_db=low_gain, cutoff_frequency_hz=low_freq),
         PeakFilter(peak_cutoff, peak_gain, peak_resonance), # Q value for a natural-sounding filter
         HighShelfFilter(gain_db=high_gain, cutoff_frequency_hz=high_freq)
     ])
-    return board(peak, sample_rate)
+    return board
+
+
+class ThreeBandEQ(object):
+    def __init__(self, sample_rate, low_gain=-3.0, peak_gain=-2.0, high_gain=5.0, peak_cutoff=1000, peak_resonance=0.7071, low_freq=400, high_freq=2500, state_dtype=None):
+        """
+        Low shelf, peak and high shelf applied as one second-order-sections cascade.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            low_gain (float): Gain for the low shelf filter in dB.
+            peak_gain (float): Gain for the peak filter in dB.
+            high_gain (float): Gain for the high shelf filter in dB.
+            peak_cutoff (float): Centre frequency of the peak filter in Hz.
+            peak_resonance (float): Q of the peak filter.
+            low_freq (float): Cutoff frequency for the low shelf filter in Hz.
+            high_freq (float): Cutoff frequency for the high shelf filter in Hz.
+            state_dtype: Precision of the filter state and arithmetic; None
+                filters in the precision of the audio.
+        """
+        self.sample_rate = sample_rate
+        self.state_dtype = state_dtype
+        self.zi = None
+        self.set_params(low_gain, peak_gain, high_gain, peak_cutoff, peak_resonance, low_freq, high_freq)
+
+    def set_params(self, low_gain, peak_gain, high_gain, peak_cutoff, peak_resonance, low_freq=400, high_freq=2500):
+        self.low_gain = low_gain
+        self.peak_gain = peak_gain
+        self.high_gain = high_gain
+        self.peak_cutoff = peak_cutoff
+        self.peak_resonance = peak_resonance
+        self.low_freq = low_freq
+        self.high_freq = high_freq
+
+        # Designed once per setting; cast lazily to each input dtype
+        self.sos = biquad.cascade(
+            biquad.low_shelf(self.sample_rate, low_freq, low_gain),
+            biquad.peaking(self.sample_rate, peak_cutoff, peak_resonance, peak_gain),
+            biquad.high_shelf(self.sample_rate, high_freq, high_gain),
+        )
+        self._sos_by_dtype = {}
+
+    def reset(self):
+        """Clears the filter state so the next call starts from silence."""
+        self.zi = None
+
+    def process(self, audio):
+        """
+        Applies the EQ. float32 and float64 buffers, (frames,) or (frames, channels),
+        are filtered at state_dtype and returned in their own dtype. Filter
+        state carries over between calls so blocks of a stream join cleanly.
+        """
+        audio = precision.as_samples(audio)
+        if len(audio) == 0:
+            return audio.copy()
+        dtype = precision.state_dtype(audio, self.state_dtype)
+        sos = self._sos_by_dtype.get(dtype)
+        if sos is None:
+            sos = self._sos_by_dtype[dtype] = self.sos.astype(dtype)
+
+        state_shape = (len(sos), 2) + audio.shape[1:]
+        if self.zi is None or self.zi.shape != state_shape:
+            self.zi = np.zeros(state_shape, dtype=dtype)
+        elif self.zi.dtype != dtype:
+            self.zi = self.zi.astype(dtype)
+
+        processed_audio, self.zi = sosfilt(sos, audio, axis=0, zi=self.zi)
+        return processed_audio.astype(audio.dtype, copy=False)
+
 
 def process(audio, sample_rate):
-    eq = create_3band_eq(audio, sample_rate, low_gain=-3.0, mid_gain=-2.0, high_gain=5.0)
+    eq = ThreeBandEQ(sample_rate, low_gain=-3.0, peak_gain=-2.0, high_gain=5.0)
 
     # To process audio with the EQ:
-    processed_audio = eq(audio, sample_rate)
-    return processed_audio
\ No newline at end of file
+    processed_audio = eq.process(audio)
+    return processed_audio
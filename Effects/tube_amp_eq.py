@@ -4,13 +4,23 @@
 
 import numpy as np
 import scipy.signal as sig
-import librosa
-import soundfile as sf
-from scipy.signal import butter, sosfilt
+from scipy.signal import sosfilt
+from . import biquad, precision
+from .oversampling import Oversampler
+
+# The low cut shelf shares the boost frequency but has a broader slope, so with
+# both engaged the boost wins just below the corner (resonant bump) and the cut
+# wins just above it (dip), the Pultec boost-and-cut "trick"
+LOW_CUT_Q = 0.4
+# The high cut shelf sits above the boost bell, like the separate attenuation selector
+HIGH_CUT_FREQ_RATIO = 2.0
 
 class PultecEQP1A:
-    def __init__(self, sample_rate, low_freq, low_q, low_boost, low_cut, high_freq, high_q, high_boost, high_cut):
+    def __init__(self, sample_rate, low_freq, low_q, low_boost, low_cut, high_freq, high_q, high_boost, high_cut, oversampling=1, linear_phase=False, linear_phase_taps=8192, state_dtype=None):
         self.sample_rate = sample_rate
+
+        # Only the tube stage runs oversampled (1, 2, 4 or 8 times the sample rate)
+        self.oversampler = Oversampler(oversampling, state_dtype=state_dtype)
         
         # Frequencies, Q, and Boost/Cut settings
         self.low_freq = low_freq
@@ -22,113 +32,181 @@ class PultecEQP1A:
         self.high_boost = high_boost
         self.high_cut = high_cut
 
+        # Linear-phase mode filters whole renders with an FFT (overlap-save) FIR
+        # of the same magnitude response instead of the streaming IIR cascade
+        self.linear_phase = linear_phase
+        self.linear_phase_taps = linear_phase_taps
+
+        # Precision of the filters and their state; None follows the audio
+        self.state_dtype = state_dtype
+
+        self.sos = None
+        self.zi = None
+        self._design_key = None
+        self._fir = None
+
+    def reset(self):
+        """Clears the filter state so the next call starts from silence."""
+        self.zi = None
+
+    def low_shelf_sos(self, sample_rate, cutoff_freq, boost_db, cut_db, q=None):
+        """Low boost shelf at cutoff_freq (Q sets the resonance) plus the broader cut shelf."""
+        q = self.low_q if q is None else q
+        return biquad.cascade(biquad.low_shelf(sample_rate, cutoff_freq, abs(boost_db), q),
+                              biquad.low_shelf(sample_rate, cutoff_freq, -abs(cut_db), LOW_CUT_Q))
+
+    def high_shelf_sos(self, sample_rate, cutoff_freq, boost_db, cut_db, q=None):
+        """High boost bell at cutoff_freq (Q sets its bandwidth) plus the cut shelf above it."""
+        q = self.high_q if q is None else q
+        cut_freq = min(cutoff_freq * HIGH_CUT_FREQ_RATIO, 0.45 * sample_rate)
+        return biquad.cascade(biquad.peaking(sample_rate, cutoff_freq, q, abs(boost_db)),
+                              biquad.high_shelf(sample_rate, cut_freq, -abs(cut_db)))
+
     def pultec_low_shelf_filter(self, signal, sample_rate, cutoff_freq, boost_db, cut_db, order=4):
         """
         Apply a Pultec-style low-shelf filter with both boost and cut to the signal.
 
-        :param signal: The input audio signal (1D numpy array).
+        :param signal: The input audio signal (numpy array, frames along axis 0).
         :param sample_rate: The sample rate of the audio signal (e.g., 44100 Hz).
         :param cutoff_freq: The cutoff frequency for the low-shelf filter (in Hz).
         :param boost_db: The boost gain applied to frequencies below the cutoff (in dB).
-        :param cut_db: The cut gain applied to frequencies below the cutoff (in dB).
-        :param order: The order of the filter (higher values lead to sharper transitions).
+        :param cut_db: The cut gain of the broader shelf at the same frequency (in dB, sign ignored).
+        :param order: Kept for compatibility; the shelves are always second order.
         :return: The filtered audio signal.
         """
-
-        # Convert boost and cut gains from dB to linear scale
-        boost_gain = 10**(boost_db / 20.0)
-        cut_gain = 10**(cut_db / 20.0)
-        
-        # Design a low-shelf filter using a parametric EQ style (using a second-order filter section)
-        nyquist = 0.5 * sample_rate
-        cutoff_norm = cutoff_freq / nyquist
-        
-        # We create a low-shelf filter with boost applied to the lower frequencies
-        sos = butter(order, cutoff_norm, btype='low', analog=False, output='sos')
-
-        # Apply the low-shelf filter to the signal
-        filtered_signal = sosfilt(sos, signal)
-        
-        # Boost or cut the signal based on the frequencies below the cutoff
-        signal_below_cutoff = np.where(signal <= cutoff_freq, filtered_signal * boost_gain, signal)
-        signal_above_cutoff = np.where(signal > cutoff_freq, filtered_signal * cut_gain, signal)
-        
-        # Combine the results from the boosted and cut signals
-        final_signal = signal_below_cutoff + signal_above_cutoff
-
-        return final_signal
+        return sosfilt(self.low_shelf_sos(sample_rate, cutoff_freq, boost_db, cut_db), signal, axis=0)
 
     def pultec_high_shelf_filter(self, signal, sample_rate, cutoff_freq, boost_db, cut_db, order=4):
         """
         Apply a Pultec-style high-shelf filter with both boost and cut to the signal.
 
-        :param signal: The input audio signal (1D numpy array).
+        :param signal: The input audio signal (numpy array, frames along axis 0).
         :param sample_rate: The sample rate of the audio signal (e.g., 44100 Hz).
         :param cutoff_freq: The cutoff frequency for the high-shelf filter (in Hz).
-        :param boost_db: The boost gain applied to frequencies above the cutoff (in dB).
-        :param cut_db: The cut gain applied to frequencies above the cutoff (in dB).
-        :param order: The order of the filter (higher values lead to sharper transitions).
+        :param boost_db: The boost gain applied around the cutoff (in dB).
+        :param cut_db: The cut gain applied to the top end above the boost (in dB, sign ignored).
+        :param order: Kept for compatibility; the shelves are always second order.
         :return: The filtered audio signal.
         """
+        return sosfilt(self.high_shelf_sos(sample_rate, cutoff_freq, boost_db, cut_db), signal, axis=0)
+
+    def design_sos(self):
+        """Low and high sections as one cascade, redesigned only when a setting has changed."""
+        key = (self.sample_rate, self.low_freq, self.low_q, self.low_boost, self.low_cut,
+               self.high_freq, self.high_q, self.high_boost, self.high_cut)
+        if key != self._design_key:
+            self.sos = biquad.cascade(
+                self.low_shelf_sos(self.sample_rate, self.low_freq, self.low_boost, self.low_cut),
+                self.high_shelf_sos(self.sample_rate, self.high_freq, self.high_boost, self.high_cut),
+            )
+            self._design_key = key
+            self._fir = None
+        return self.sos
+
+    def linear_phase_fir(self):
+        """
+        Zero-phase version of the cascade's magnitude response as a windowed FIR,
+        with its spectrum for overlap-save. Cached until a setting changes.
 
-        # Convert boost and cut gains from dB to linear scale
-        boost_gain = 10**(boost_db / 20.0)
-        cut_gain = 10**(cut_db / 20.0)
-        
-        # Design a high-shelf filter using a parametric EQ style (using a second-order filter section)
-        nyquist = 0.5 * sample_rate
-        cutoff_norm = cutoff_freq / nyquist
-        
-        # We create a high-shelf filter with boost applied to the higher frequencies
-        # Using butterworth filter as a foundation for smoother transitions
-        sos = butter(order, cutoff_norm, btype='high', analog=False, output='sos')
-
-        # Apply the high-shelf filter to the signal
-        filtered_signal = sosfilt(sos, signal)
-        
-        # Boost or cut the signal based on the frequencies above the cutoff
-        # Here we're boosting or cutting in a more selective way
-        signal_above_cutoff = np.where(signal > cutoff_freq, filtered_signal * boost_gain, signal)
-        signal_below_cutoff = np.where(signal <= cutoff_freq, filtered_signal * cut_gain, signal)
-        
-        # Combine the results from the boosted and cut signals
-        final_signal = signal_above_cutoff + signal_below_cutoff
-
-        return final_signal
+        :return: (FIR taps, FFT size, FFT of the taps).
+        """
+        sos = self.design_sos()
+        if self._fir is None:
+            half = self.linear_phase_taps // 2
+            freqs = np.fft.rfftfreq(2 * half, 1 / self.sample_rate)
+            _, response = sig.sosfreqz(sos, worN=freqs, fs=self.sample_rate)
+            impulse = np.roll(np.fft.irfft(np.abs(response), 2 * half), half)
+
+            # Symmetric odd-length kernel centred on tap half
+            taps = np.concatenate([impulse, impulse[:1]])
+            taps[0] *= 0.5
+            taps[-1] *= 0.5
+            taps *= sig.get_window('blackman', len(taps), fftbins=False)
+
+            fft_size = 1 << int(np.ceil(np.log2(4 * len(taps))))
+            self._fir = (taps, fft_size, np.fft.rfft(taps, fft_size))
+        return self._fir
+
+    def _apply_linear_phase(self, audio_signal, dtype):
+        taps, fft_size, spectrum = self.linear_phase_fir()
+        spectrum = spectrum.astype(np.result_type(dtype, np.complex64), copy=False)
+        overlap = len(taps) - 1
+        step = fft_size - overlap
+        latency = overlap // 2
+        length = len(audio_signal)
+        if audio_signal.ndim > 1:
+            spectrum = spectrum.reshape((-1,) + (1,) * (audio_signal.ndim - 1))
+
+        # History of overlap zeros up front; the tail is flushed for the latency trim
+        padded = np.zeros((overlap + length + latency + step,) + audio_signal.shape[1:], dtype=dtype)
+        padded[overlap:overlap + length] = audio_signal
+        output = np.empty((length + latency,) + audio_signal.shape[1:], dtype=audio_signal.dtype)
+        for start in range(0, length + latency, step):
+            segment = padded[start:start + fft_size]
+            block = np.fft.irfft(np.fft.rfft(segment, fft_size, axis=0) * spectrum, fft_size, axis=0)
+            stop = min(start + step, len(output))
+            output[start:stop] = block[overlap:overlap + stop - start]
+        return output[latency:]
 
         
     def tube_distortion(self, signal, drive=0.5):
         """Apply tube-style distortion (soft clipping) to the signal"""
-        return np.tanh(signal * drive)
+        return self.oversampler.process(signal, lambda x: np.tanh(x * drive))
 
     def apply_eq(self, audio_signal):
-        """Apply the full EQ (low and high shelf) to the audio signal"""
-        # Apply Low Shelf (Boost / Cut)
-        low_eq_signal = self.pultec_low_shelf_filter(audio_signal, self.sample_rate, self.low_freq, self.low_boost, self.low_cut, 4)
+        """
+        Apply the full EQ (low and high sections) to the audio signal in one pass.
 
-        # Apply High Shelf (Boost / Cut)
-        high_eq_signal = self.pultec_high_shelf_filter(low_eq_signal, self.sample_rate, self.high_freq, self.high_boost, self.high_cut, 4)
-        
-        return high_eq_signal
+        The IIR cascade keeps its state between calls, so blocks of a stream join
+        cleanly. In linear-phase mode each call is a whole, latency-compensated render.
+        The result is float32 for float32 audio and float64 otherwise.
+        """
+        audio_signal = precision.as_samples(audio_signal)
+        dtype = precision.state_dtype(audio_signal, self.state_dtype)
+        if self.linear_phase:
+            return self._apply_linear_phase(audio_signal, dtype)
+
+        sos = self.design_sos()
+        state_shape = (len(sos), 2) + audio_signal.shape[1:]
+        if self.zi is None or self.zi.shape != state_shape or self.zi.dtype != dtype:
+            self.zi = np.zeros(state_shape, dtype=dtype)
+        eq_signal, self.zi = sosfilt(sos.astype(dtype, copy=False), audio_signal, axis=0, zi=self.zi)
+        return eq_signal.astype(audio_signal.dtype, copy=False)
 
     def process(self, audio):
         """Apply EQ and distortion to the input audio"""
         eq_signal = self.apply_eq(audio)  # Apply EQ
         
         # Normalize the signal before applying distortion (to avoid too much clipping)
-        eq_signal = np.clip(eq_signal, -1.0, 1.0)  # Clipping if necessary to prevent excessive values
+        eq_signal = np.clip(eq_signal, -1.0, 1.0, out=eq_signal)  # Clipping if necessary to prevent excessive values
 
         # Apply distortion
         processed_audio = self.tube_distortion(eq_signal, drive=0.2)  # Apply distortion
         
         return processed_audio
 
+    def process_block(self, block):
+        """
+        Apply EQ and distortion to the next block of a stream. The filter state
+        carries over between calls. Needs the IIR mode without oversampling: the
+        linear-phase FIR and the resampling filters work on whole renders.
+        """
+        if self.linear_phase or self.oversampler.factor != 1:
+            raise ValueError("process_block() needs linear_phase=False and oversampling=1")
+        block = precision.as_samples(block)
+        if len(block) == 0:
+            return block.copy()
+        return self.process(block)
+
 # Example usage:
 
 if __name__ == "__main__":
-    # Load an audio file
+    import soundfile as sf
+    from .streaming import stream_file
+
+    # The audio file is streamed through the EQ in blocks, never loaded whole
     audio_file = 'Audio/Input/M_T2.wav'  # Replace with your file path
-    y, sr = librosa.load(audio_file, sr=None)
+    sr = sf.info(audio_file).samplerate
 
     # Create an instance of the Pultec EQ
     pultec_eq = PultecEQP1A(
@@ -137,12 +215,9 @@ if __name__ == "__main__":
         high_freq=8000, high_q=0.5, high_boost=3, high_cut=-3  # High shelf settings
     )
 
-    # Process the audio signal
-    processed_audio = pultec_eq.process(y)
-
-    # Save the processed audio to a file
+    # Process the audio signal block by block into the output file
     output_file = 'output_audio.wav'
-    sf.write(output_file, processed_audio, sr)
+    stream_file(pultec_eq, audio_file, output_file)
     print(f"Processed audio saved to {output_file}")
 
 
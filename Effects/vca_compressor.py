@@ -1,69 +1,143 @@
 import numpy as np
+from scipy.signal import lfilter
+from . import precision
+from .jit import LazyKernel
+
+
+def _ballistics(x_l, y_l, alphaAttack, alphaRelease, yL_prev):
+    # Attack when the gain reduction rises above the smoothed value, release otherwise
+    for i in range(len(x_l)):
+        if (x_l[i] > yL_prev):
+            yL_prev = alphaAttack * yL_prev + (1 - alphaAttack) * x_l[i]
+        else:
+            yL_prev = alphaRelease * yL_prev + (1 - alphaRelease) * x_l[i]
+        y_l[i] = yL_prev
+    return yL_prev
+
+_ballistics_kernel = LazyKernel(_ballistics, outputs=(1,))
+
 
 class VCA_Compressor(object):
-        def Setup(self, framesize, channels, sample_rate):
+        def Setup(self, framesize, channels, sample_rate, link="max", state_dtype=None):
             self.framesize = framesize
             self.channels = channels
             self.sample_rate = sample_rate
-            inputBuffer = np.empty((framesize, channels)) # Working buffer to analyse
             self.threshold_ = -12
             self.ratio_ = 2.5
 
+            self.tauAttack_ = 20
+            self.tauRelease_ = 60 # Attack and release time in ms
+            self.makeUpGain_ = 5           # Compressor make-up gain
+
+            # Stereo link: "max" or "mean" of the channel levels drives one shared
+            # gain, None compresses every channel on its own
+            self.link_ = link
+
+            # Precision of the detector and gain computer; None follows the audio
+            self.state_dtype_ = state_dtype
+
+            VCA_Compressor.Allocate(self, framesize, channels)
+            VCA_Compressor.Reset(self)
+
+        def Allocate(self, framesize, channels, dtype=None):
+            # Scratch buffers, allocated once and reused by every Process call.
+            # Flat storage so linked (frames,) and unlinked (frames, channels)
+            # views can share it. dtype None keeps the current precision
+            if dtype is None:
+                dtype = self.x_g.dtype if hasattr(self, "x_g") else np.float64
+            self.framesize = framesize
+            self.channels = channels
+            self.x_g = np.zeros(framesize * channels, dtype=dtype)
+            self.x_l = np.zeros(framesize * channels, dtype=dtype)
+            self.y_l = np.zeros(framesize * channels, dtype=dtype)
+            self.c = np.zeros(framesize * channels, dtype=dtype)
+            self.below = np.zeros(framesize * channels, dtype=bool)
+
+            # Gain smoothing state per channel, kept when the buffers grow
+            previous = getattr(self, "yL_prev", np.zeros(0))
+            self.yL_prev = np.zeros(channels)
+            self.yL_prev[:len(previous)] = previous[:channels]
+
+        def Reset(self):
+            # Clears the gain smoothing state carried between Process calls
+            self.yL_prev.fill(0)
+
         # def UpdateParams(self):
-    
+
         def Process(self, inputBuffer):
+            """
+            Compresses a (frames,) or (frames, channels) buffer in place. The
+            gain smoothing carries over from the previous call, so consecutive
+            frames join without clicks.
+            """
             # the input signal
-            bufferSize = self.framesize
+            bufferSize = len(inputBuffer)
+            channels = 1 if inputBuffer.ndim == 1 else inputBuffer.shape[1]
             samplerate = self.sample_rate
-            yL_prev = 0
-            x_g = np.zeros(bufferSize)
-            x_l = np.zeros(bufferSize)
-            y_g = np.zeros(bufferSize)
-            y_l = np.zeros(bufferSize)
-            c = np.zeros(bufferSize)
-
-            tauAttack_ = 20
-            tauRelease_ = 60 # Attack and release time
-            # constants
-            makeUpGain_ = 5           # Compressor make-up gain
-            # inputBuffer.clear(0, 0, bufferSize)
-            # Mix down left-right to analyse the input
-            # inputBuffer.addFrom(0, 0, buffer, channel, 0, bufferSize, 0.5)
-            # inputBuffer.addFrom(0, 0, buffer, channel, 0, bufferSize, 0.5)
+            if bufferSize == 0:
+                return inputBuffer
+            dtype = precision.state_dtype(inputBuffer, self.state_dtype_)
+            if bufferSize > self.framesize or channels > self.channels or self.x_g.dtype != dtype:
+                VCA_Compressor.Allocate(self, max(bufferSize, self.framesize), max(channels, self.channels), dtype)
+            frames = inputBuffer.reshape(bufferSize, channels)
+
+            # One detector for the linked modes, one per channel otherwise
+            detectors = channels if self.link_ is None else 1
+            size = bufferSize * detectors
+            x_g = self.x_g[:size].reshape(bufferSize, detectors)
+            x_l = self.x_l[:size].reshape(bufferSize, detectors)
+            y_l = self.y_l[:size].reshape(bufferSize, detectors)
+            c = self.c[:size].reshape(bufferSize, detectors)
+            below = self.below[:size].reshape(bufferSize, detectors)
 
             # Compression: calculates the control voltage
             alphaAttack = np.exp(-1/(0.001 * samplerate *
-                                        tauAttack_))
+                                        self.tauAttack_))
             alphaRelease = np.exp(-1/(0.001 * samplerate *
-                                         tauRelease_))
-            for i in range(bufferSize):
-                # Level detection- estimate level using peak detector
-                if (np.fabs(inputBuffer[i]) < 0.000001):
-                    x_g[i] = -120
-                else:
-                    x_g[i] = 20 * np.log10(np.fabs(inputBuffer[i]))
+                                         self.tauRelease_))
 
-                # Gain computer- static apply input/output curve
-                if (x_g[i] >= self.threshold_):
-                    y_g[i] = self.threshold_ + (x_g[i]-self.threshold_) / self.ratio_
+            # Level detection- estimate level using peak detector, floored at -120 dB
+            if self.link_ is None or channels == 1:
+                np.abs(frames, out=x_g)
+            else:
+                levels = self.x_l[:bufferSize * channels].reshape(bufferSize, channels)
+                np.abs(frames, out=levels)
+                if self.link_ == "mean":
+                    np.mean(levels, axis=1, out=x_g[:, 0])
                 else:
-                    y_g[i] = x_g[i]
-                x_l[i] = x_g[i] - y_g[i]
+                    np.max(levels, axis=1, out=x_g[:, 0])
+            np.maximum(x_g, 0.000001, out=x_g)
+            np.log10(x_g, out=x_g)
+            x_g *= 20
 
-                # Ballistics- smoothing of the gain
-                if (x_l[0] > yL_prev):
-                    y_l[i] = alphaAttack * yL_prev + (1 - alphaAttack ) * x_l[i]
+            # Gain computer- static apply input/output curve; x_l = x_g - y_g
+            np.subtract(x_g, self.threshold_, out=x_l)
+            x_l /= self.ratio_
+            x_l += self.threshold_
+            np.subtract(x_g, x_l, out=x_l)
+            np.less(x_g, self.threshold_, out=below)
+            np.copyto(x_l, 0, where=below)
 
-                # Compressor thresh. in dB
-                # Compression ratio
-                else:
-                    y_l[i] = alphaRelease* yL_prev + (1 - alphaRelease) * x_l[i]
-                # Find control
-                c[i] = pow(10.0, (makeUpGain_ - y_l[i]) / 20.0)
-                yL_prev = y_l[i]
+            # Ballistics- smoothing of the gain
+            yL_prev = self.yL_prev[:detectors]
+            if alphaAttack == alphaRelease:
+                y_l[:], _ = lfilter([1 - alphaAttack], [1, -alphaAttack], x_l, axis=0,
+                                     zi=alphaAttack * yL_prev[np.newaxis, :])
+                yL_prev[:] = y_l[-1]
+            else:
+                for channel in range(detectors):
+                    yL_prev[channel] = _ballistics_kernel(x_l[:, channel], y_l[:, channel], alphaAttack, alphaRelease,
+                                                          yL_prev[channel])
+            if detectors == 1:
+                # Linked state is shared, so switching link modes stays continuous
+                self.yL_prev[:] = yL_prev[0]
+
+            # Find control
+            np.subtract(self.makeUpGain_, y_l, out=c)
+            c /= 20.0
+            np.power(10.0, c, out=c)
 
             # Apply control voltage to the audio signal
-            for i in range(bufferSize):
-                inputBuffer[i] *= c[i]
+            frames *= c
 
             return inputBuffer